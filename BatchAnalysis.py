@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Batch position analysis.
+
+Streams positions from FEN, EPD or PGN files through a pool of worker processes
+running alphaBetaSearch and appends one result per position (best move, score,
+nodes, time) to a JSONL or CSV file as soon as it is known. Only a small window
+of positions is in flight at any time, so memory use does not depend on the size
+of the input. Rerunning the same command continues after the last result that
+was written.
+
+    python BatchAnalysis.py positions.epd -o results.jsonl --depth 3 --workers 8
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+import chess
+import chess.pgn
+import ChessEngine
+
+resultFields = ["id", "fen", "bestmove", "score", "depth", "nodes", "time"]
+
+def readPositions(paths):
+    # Yields (id, fen) pairs one at a time without reading whole files into memory
+    for path in paths:
+        if path.lower().endswith(".pgn"):
+            with open(path, encoding = "utf-8", errors = "replace") as pgnFile:
+                gameNumber = 0
+
+                while True:
+                    game = chess.pgn.read_game(pgnFile)
+
+                    if game == None:
+                        break
+
+                    gameNumber += 1
+                    board = game.board()
+
+                    for ply, move in enumerate(game.mainline_moves()):
+                        board.push(move)
+                        yield "{}:{}:{}".format(os.path.basename(path), gameNumber, ply + 1), board.fen()
+        else:
+            with open(path, encoding = "utf-8", errors = "replace") as positionFile:
+                for lineNumber, line in enumerate(positionFile, 1):
+                    line = line.strip()
+
+                    if len(line) == 0 or line.startswith("#"):
+                        continue
+
+                    fields = line.split()
+
+                    # Full FEN has six fields ending in two move counters, EPD has four fields followed by operations
+                    if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+                        board = chess.Board(" ".join(fields[:6]))
+                        positionId = "{}:{}".format(os.path.basename(path), lineNumber)
+                    else:
+                        board, operations = chess.Board.from_epd(line)
+                        positionId = str(operations.get("id", "{}:{}".format(os.path.basename(path), lineNumber)))
+
+                    yield positionId, board.fen()
+
+def initWorker(hashSize, selectiveSettings, cachePath):
+    ChessEngine.initSearch(hashSize)
+    ChessEngine.setSelectiveSearch(**selectiveSettings)
+    ChessEngine.setSearchCache(cachePath)
+    # Positions from one game follow each other, but every result has to stand on its own
+    ChessEngine.setSearchReuse(False)
+
+def analysePosition(task):
+    positionId, fen, depth, moveTime = task
+    board = chess.Board(fen)
+    result = {"id": positionId, "fen": fen, "bestmove": None, "score": None, "depth": None, "nodes": 0, "time": 0.0}
+
+    if board.is_game_over():
+        return result
+
+    # Every position starts from an empty table so results do not depend on the order of the file
+    ChessEngine.transpositionTable.clear()
+    startTime = time.perf_counter()
+    move = ChessEngine.alphaBetaSearch(board, depth, moveTime)
+
+    result["time"] = round(time.perf_counter() - startTime, 4)
+    result["bestmove"] = move.uci()
+    result["nodes"] = ChessEngine.nodeStack.iterations
+
+    if len(ChessEngine.completedIterations) > 0:
+        result["depth"] = ChessEngine.completedIterations[-1][0]
+        result["score"] = round(ChessEngine.completedIterations[-1][1], 2)
+
+    return result
+
+def countFinishedResults(outputPath, outputFormat):
+    # Drops a partly written last line left by an interrupted run and counts the complete ones
+    if not os.path.exists(outputPath):
+        return 0
+
+    with open(outputPath, "rb+") as outputFile:
+        data = outputFile.read()
+        end = data.rfind(b"\n") + 1
+
+        if end != len(data):
+            outputFile.truncate(end)
+
+    lines = data[:end].count(b"\n")
+
+    return max(0, lines - 1) if outputFormat == "csv" else lines
+
+def analyseFiles(paths, outputPath, depth = None, moveTime = None, workers = None, hashSize = 16, outputFormat = None, windowSize = None,
+                 cachePath = None):
+    workers = workers if workers != None else os.cpu_count()
+    outputFormat = outputFormat if outputFormat != None else ("csv" if outputPath.lower().endswith(".csv") else "jsonl")
+    windowSize = windowSize if windowSize != None else workers * 4
+
+    finished = countFinishedResults(outputPath, outputFormat)
+    tasks = ((positionId, fen, depth, moveTime) for positionId, fen in itertools.islice(readPositions(paths), finished, None))
+
+    if finished > 0:
+        print("resuming after {} analysed positions".format(finished), file = sys.stderr)
+
+    analysed = 0
+    startTime = time.perf_counter()
+
+    with open(outputPath, "a", newline = "", encoding = "utf-8") as outputFile, \
+         multiprocessing.Pool(workers, initializer = initWorker, initargs = (hashSize, ChessEngine.selectiveSearchSettings(), cachePath)) as pool:
+        writer = csv.DictWriter(outputFile, fieldnames = resultFields) if outputFormat == "csv" else None
+
+        if writer != None and finished == 0 and outputFile.tell() == 0:
+            writer.writeheader()
+
+        while True:
+            # Only one window of positions is read and in flight at a time
+            window = list(itertools.islice(tasks, windowSize))
+
+            if len(window) == 0:
+                break
+
+            for result in pool.imap(analysePosition, window):
+                if writer != None:
+                    writer.writerow(result)
+                else:
+                    outputFile.write(json.dumps(result) + "\n")
+
+                outputFile.flush()
+                analysed += 1
+
+            elapsed = time.perf_counter() - startTime
+            print("{} positions {:.2f} positions/s".format(finished + analysed, analysed / elapsed if elapsed > 0 else 0), file = sys.stderr)
+
+    elapsed = time.perf_counter() - startTime
+
+    return {"positions": analysed, "seconds": elapsed, "positionsPerSecond": analysed / elapsed if elapsed > 0 else 0}
+
+def main():
+    parser = argparse.ArgumentParser(description = "Analyse FEN, EPD or PGN files with alphaBetaSearch.")
+    parser.add_argument("inputs", nargs = "+", help = "FEN/EPD files with one position per line, or PGN files")
+    parser.add_argument("-o", "--output", required = True, help = "results file, .jsonl or .csv")
+    parser.add_argument("--depth", type = int, default = None, help = "search depth (default 3 without --movetime)")
+    parser.add_argument("--movetime", type = float, default = None, help = "seconds per position")
+    parser.add_argument("--workers", type = int, default = None, help = "worker processes (default: all cores)")
+    parser.add_argument("--hash", type = int, default = 16, help = "transposition table size per worker in MB")
+    parser.add_argument("--format", choices = ["jsonl", "csv"], default = None)
+    parser.add_argument("--no-null-move", action = "store_true", help = "search without null-move pruning")
+    parser.add_argument("--no-lmr", action = "store_true", help = "search without late move reductions")
+    parser.add_argument("--cache", default = None, help = "SQLite file of searches shared between runs and workers")
+    arguments = parser.parse_args()
+
+    ChessEngine.setSelectiveSearch(not arguments.no_null_move, not arguments.no_lmr)
+
+    depth = arguments.depth if arguments.depth != None or arguments.movetime != None else 3
+    summary = analyseFiles(arguments.inputs, arguments.output, depth, arguments.movetime, arguments.workers,
+                           arguments.hash, arguments.format, cachePath = arguments.cache)
+
+    print("analysed {} positions in {:.1f}s: {:.2f} positions/s".format(summary["positions"], summary["seconds"],
+          summary["positionsPerSecond"]), file = sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+"""
+Batch position evaluation with NumPy.
+
+Packs many positions into arrays of 64-bit bitboards and computes the terms of
+evaluate() for the whole batch at once with vectorised bit operations: material,
+doubled, isolated and blocked pawns, the legal move and capture counts behind
+the mobility terms and the piece on every square for the piece-square tables.
+The evaluation is linear in its weights once these features are known, which
+is what Tuner.py fits the weights on. Legal moves are counted set-wise from attack sets with pins,
+checks and attacked king squares masked out. En passant captures, which can be
+illegal through a pin along the rank or legal as the answer to a pawn check,
+are counted with python-chess while packing, so the scores are those of the
+scalar evaluate(). compareWithScalar() reports any difference.
+
+    python BatchEvaluation.py positions.epd
+"""
+
+import time
+import argparse
+import numpy as np
+import chess
+import ChessEngine
+from ChessEngine import evaluate
+from EvaluationWeights import pieceNames, termNames, stageNames, phaseValues, totalPhase
+
+# Columns of the dense feature matrix: material differences, then the other terms
+denseNames = pieceNames + termNames
+
+fileMasks = np.array(chess.BB_FILES, dtype = np.uint64)
+notFileA = np.uint64(~chess.BB_FILE_A & chess.BB_ALL)
+notFileH = np.uint64(~chess.BB_FILE_H & chess.BB_ALL)
+notFilesAB = np.uint64(~(chess.BB_FILE_A | chess.BB_FILE_B) & chess.BB_ALL)
+notFilesGH = np.uint64(~(chess.BB_FILE_G | chess.BB_FILE_H) & chess.BB_ALL)
+allSquares = np.uint64(chess.BB_ALL)
+
+# (shift, mask applied after the shift) with positive shifts towards h8
+knightSteps = [(17, notFileA), (15, notFileH), (10, notFilesAB), (6, notFilesGH),
+               (-17, notFileH), (-15, notFileA), (-10, notFilesGH), (-6, notFilesAB)]
+rookSteps = [(8, None), (-8, None), (1, notFileA), (-1, notFileH)]
+bishopSteps = [(9, notFileA), (7, notFileH), (-7, notFileA), (-9, notFileH)]
+kingSteps = rookSteps + bishopSteps
+
+if hasattr(np, "bitwise_count"):
+    def popcount(bitboards):
+        return np.bitwise_count(bitboards).astype(np.int64)
+else:
+    byteCounts = np.array([bin(i).count("1") for i in range(256)], dtype = np.int64)
+
+    def popcount(bitboards):
+        return byteCounts[np.ascontiguousarray(bitboards).view(np.uint8).reshape(bitboards.shape + (8,))].sum(axis = -1)
+
+def shift(bitboards, step, mask = None):
+    shifted = np.left_shift(bitboards, np.uint64(step)) if step > 0 else np.right_shift(bitboards, np.uint64(-step))
+
+    return shifted & mask if mask != None else shifted
+
+def packPositions(boards):
+    # pieces[n, color, pieceType - 1] holds one bitboard per colour and piece type
+    pieces = np.zeros((len(boards), 2, 6), dtype = np.uint64)
+    turns = np.zeros(len(boards), dtype = bool)
+    castling = np.zeros(len(boards), dtype = np.uint64)
+    epMoves = np.zeros(len(boards), dtype = np.int64)
+
+    for index, board in enumerate(boards):
+        for color in chess.COLORS:
+            for pieceType in chess.PIECE_TYPES:
+                pieces[index, int(color), pieceType - 1] = board.pieces_mask(pieceType, color)
+
+        turns[index] = board.turn
+        castling[index] = board.castling_rights
+
+        # Legal en passant captures of the side to move, the only ones evaluate() counts
+        if board.ep_square != None:
+            epMoves[index] = sum(1 for move in board.generate_legal_ep())
+
+    return {"pieces": pieces, "turns": turns, "castling": castling, "epMoves": epMoves}
+
+def attackSets(pieces, color, occupied, targets, sliderMovers = None):
+    # Yields the destination sets of every (piece type, direction, distance) within targets, which never
+    # overlap; sliderMovers maps each step to the sliders allowed to move along it
+    for step, mask in knightSteps:
+        yield shift(pieces[:, color, chess.KNIGHT - 1], step, mask) & targets
+
+    queens = pieces[:, color, chess.QUEEN - 1]
+    empty = ~occupied
+
+    for sliders, steps in ((pieces[:, color, chess.ROOK - 1] | queens, rookSteps), (pieces[:, color, chess.BISHOP - 1] | queens, bishopSteps)):
+        for step, mask in steps:
+            frontier = sliders & sliderMovers[abs(step)] if sliderMovers != None else sliders
+
+            # Two sliders on one line cannot pass each other, so their rays never meet
+            for distance in range(7):
+                reached = shift(frontier, step, mask)
+                yield reached & targets
+                frontier = reached & empty
+
+def attackMap(pieces, color, occupied):
+    attacked = pawnAttacks(pieces, color)
+
+    for step, mask in kingSteps:
+        attacked |= shift(pieces[:, color, chess.KING - 1], step, mask)
+
+    for reached in attackSets(pieces, color, occupied, allSquares):
+        attacked |= reached
+
+    return attacked
+
+def pawnAttacks(pieces, color):
+    pawns = pieces[:, color, chess.PAWN - 1]
+    forward = 8 if color == chess.WHITE else -8
+
+    return shift(pawns, forward + 1, notFileA) | shift(pawns, forward - 1, notFileH)
+
+def kingSafety(pieces, color, occupied):
+    # Returns the side's pieces pinned along each line, keyed by the absolute step of the line,
+    # and the squares its other pieces may move to: everywhere, the checker and the squares
+    # between it and the king, or nowhere in double check
+    own = np.bitwise_or.reduce(pieces[:, color], axis = 1)
+    enemy = np.bitwise_or.reduce(pieces[:, 1 - color], axis = 1)
+    king = pieces[:, color, chess.KING - 1]
+    enemyQueens = pieces[:, 1 - color, chess.QUEEN - 1]
+    pinned = {}
+    checkers = np.zeros(len(pieces), dtype = np.int64)
+    evasions = np.zeros(len(pieces), dtype = np.uint64)
+    none = np.uint64(0)
+
+    for steps, attackers in ((rookSteps, pieces[:, 1 - color, chess.ROOK - 1] | enemyQueens),
+                             (bishopSteps, pieces[:, 1 - color, chess.BISHOP - 1] | enemyQueens)):
+        for step, mask in steps:
+            ray = king
+            between = np.zeros(len(pieces), dtype = np.uint64)
+            firstOwn = np.zeros(len(pieces), dtype = np.uint64)
+            searching = np.ones(len(pieces), dtype = bool)
+            pinned.setdefault(abs(step), np.zeros(len(pieces), dtype = np.uint64))
+
+            for distance in range(7):
+                ray = shift(ray, step, mask)
+                hitOwn = (ray & own) != 0
+                hitAttacker = (ray & attackers) != 0
+                hitOther = (ray & enemy & ~attackers) != 0
+                beforeOwn = firstOwn == 0
+
+                check = searching & beforeOwn & hitAttacker
+                checkers += check
+                evasions |= np.where(check, between | ray, none)
+                pinned[abs(step)] |= np.where(searching & ~beforeOwn & hitAttacker, firstOwn, none)
+
+                firstOwn = np.where(searching & beforeOwn & hitOwn, ray, firstOwn)
+                between |= np.where(beforeOwn, ray, none)
+                searching &= ~(hitAttacker | hitOther | (hitOwn & ~beforeOwn))
+
+    for step, mask in knightSteps:
+        knightCheckers = shift(king, step, mask) & pieces[:, 1 - color, chess.KNIGHT - 1]
+        checkers += popcount(knightCheckers)
+        evasions |= knightCheckers
+
+    forward = 8 if color == chess.WHITE else -8
+    pawnCheckers = (shift(king, forward + 1, notFileA) | shift(king, forward - 1, notFileH)) & pieces[:, 1 - color, chess.PAWN - 1]
+    checkers += popcount(pawnCheckers)
+    evasions |= pawnCheckers
+
+    evasions = np.where(checkers == 0, allSquares, np.where(checkers == 1, evasions, none))
+
+    return pinned, evasions
+
+def pawnMoves(pieces, color, occupied, pinned, unpinned, evasions):
+    # Returns (moves, captures) with every move onto the last rank counted as four promotions
+    pawns = pieces[:, color, chess.PAWN - 1]
+    enemy = np.bitwise_or.reduce(pieces[:, 1 - color], axis = 1)
+    empty = ~occupied
+    forward = 8 if color == chess.WHITE else -8
+    lastRank = np.uint64(chess.BB_RANK_8 if color == chess.WHITE else chess.BB_RANK_1)
+    startPushRank = np.uint64(chess.BB_RANK_3 if color == chess.WHITE else chess.BB_RANK_6)
+
+    # A pinned pawn may only move along the line it is pinned on
+    pushers = pawns & (unpinned | pinned[8])
+    singlePushes = shift(pushers, forward) & empty
+    doublePushes = shift(singlePushes & startPushRank, forward) & empty & evasions
+    singlePushes &= evasions
+    captureSets = [shift(pawns & (unpinned | pinned[abs(step)]), step, mask) & enemy & evasions
+                   for step, mask in ((forward + 1, notFileA), (forward - 1, notFileH))]
+
+    pushes = popcount(singlePushes) + 3 * popcount(singlePushes & lastRank) + popcount(doublePushes)
+    captures = sum(popcount(c) + 3 * popcount(c & lastRank) for c in captureSets)
+
+    return pushes + captures, captures
+
+def castlingMoves(pieces, castling, color, occupied, enemyAttacks):
+    # Castling needs the rights, empty squares in between and no attacked square on the king's path
+    rank = 0 if color == chess.WHITE else 56
+    count = np.zeros(len(castling), dtype = np.int64)
+
+    for rookFile, between, path in ((7, (5, 6), (4, 5, 6)), (0, (1, 2, 3), (4, 3, 2))):
+        betweenMask = np.uint64(sum(1 << (rank + f) for f in between))
+        pathMask = np.uint64(sum(1 << (rank + f) for f in path))
+        rights = (castling & np.uint64(1 << (rank + rookFile))) != 0
+        kingHome = (pieces[:, color, chess.KING - 1] & np.uint64(1 << (rank + 4))) != 0
+
+        count += rights & kingHome & ((occupied & betweenMask) == 0) & ((enemyAttacks & pathMask) == 0)
+
+    return count
+
+def mobility(pieces, castling, color, occupied, epMoves = None):
+    # Returns (legal moves, legal captures) for one side, as if it were to move
+    own = np.bitwise_or.reduce(pieces[:, color], axis = 1)
+    enemy = np.bitwise_or.reduce(pieces[:, 1 - color], axis = 1)
+    king = pieces[:, color, chess.KING - 1]
+    notOwn = ~own
+
+    # Squares behind the king stay attacked once it steps away from a slider
+    enemyAttacks = attackMap(pieces, 1 - color, occupied & ~king)
+    pinned, evasions = kingSafety(pieces, color, occupied)
+    unpinned = ~(pinned[8] | pinned[1] | pinned[9] | pinned[7])
+    sliderMovers = {line: unpinned | pinnedOnLine for line, pinnedOnLine in pinned.items()}
+
+    moves, captures = pawnMoves(pieces, color, occupied, pinned, unpinned, evasions)
+
+    for step, mask in kingSteps:
+        reached = shift(king, step, mask) & notOwn & ~enemyAttacks
+        moves = moves + popcount(reached)
+        captures = captures + popcount(reached & enemy)
+
+    pieceSets = pieces.copy()
+    pieceSets[:, color, chess.KNIGHT - 1] &= unpinned
+
+    for reached in attackSets(pieceSets, color, occupied, notOwn & evasions, sliderMovers):
+        moves = moves + popcount(reached)
+        captures = captures + popcount(reached & enemy)
+
+    if epMoves is not None:
+        moves = moves + epMoves
+
+    return moves + castlingMoves(pieces, castling, color, occupied, enemyAttacks), captures
+
+def pawnStructure(pieces, occupied, color):
+    # Doubled, isolated and blocked pawns of one side, counted the way evaluate() does
+    direction = 1 if color == chess.WHITE else -1
+    pawns = pieces[:, int(color), chess.PAWN - 1]
+    filePawns = pawns[:, None] & fileMasks[None, :]
+    fileCounts = popcount(filePawns)
+    hasPawns = fileCounts > 0
+
+    doubled = fileCounts > 1
+    # evaluate() looks at the h-file for the a-file and never counts the h-file as isolated
+    isolated = hasPawns & (np.roll(fileCounts, 1, axis = 1) == 0) & (np.roll(fileCounts, -1, axis = 1) == 0)
+    isolated[:, 7] = False
+
+    lowestPawns = filePawns & (~filePawns + np.uint64(1))
+    blocked = hasPawns & ((shift(lowestPawns, 8 * direction) & occupied[:, None]) != 0)
+
+    return doubled.sum(axis = 1), isolated.sum(axis = 1), blocked.sum(axis = 1)
+
+def evaluationFeatures(packed):
+    # Returns the features the evaluation is a weighted sum of: a dense matrix with a column per
+    # name in denseNames, signed so that positive weights favour White, and one entry per piece
+    # with its position, piece-square table index and sign, plus the phase of every position
+    pieces = packed["pieces"]
+    turns = packed["turns"]
+    count = len(pieces)
+    occupied = np.bitwise_or.reduce(pieces.reshape(count, 12), axis = 1)
+    dense = np.zeros((count, len(denseNames)), dtype = np.float64)
+
+    dense[:, :len(pieceNames)] = popcount(pieces[:, 1]) - popcount(pieces[:, 0])
+    whiteStructure = pawnStructure(pieces, occupied, chess.WHITE)
+    blackStructure = pawnStructure(pieces, occupied, chess.BLACK)
+
+    for index, name in enumerate(("doubledPawn", "isolatedPawn", "blockedPawn")):
+        dense[:, denseNames.index(name)] = blackStructure[index] - whiteStructure[index]
+
+    # evaluate() counts the side to move's moves with its en passant captures and the other side's without
+    epMoves = packed["epMoves"]
+    whiteMoves, whiteCaptures = mobility(pieces, packed["castling"], 1, occupied, np.where(turns, epMoves, 0))
+    blackMoves, blackCaptures = mobility(pieces, packed["castling"], 0, occupied, np.where(turns, 0, epMoves))
+
+    # The side to move is scored on its captures against every move of the other side
+    dense[:, denseNames.index("captures")] = np.where(turns, whiteCaptures - blackMoves, whiteMoves - blackCaptures)
+    dense[:, denseNames.index("mobility")] = whiteMoves - blackMoves
+
+    squares = np.arange(64, dtype = np.uint64)
+    rows, indices, signs = [], [], []
+
+    for color in (1, 0):
+        for pieceType in range(6):
+            positionIndex, square = np.nonzero((pieces[:, color, pieceType, None] >> squares) & np.uint64(1))
+            rows.append(positionIndex.astype(np.int32))
+            indices.append((pieceType * 64 + (square if color else square ^ 56)).astype(np.int16))
+            signs.append(np.full(len(square), 1 if color else -1, dtype = np.int8))
+
+    pieceCounts = popcount(pieces[:, 0]) + popcount(pieces[:, 1])
+    phase = np.minimum(pieceCounts @ np.array(phaseValues[1:]), totalPhase) / totalPhase
+
+    return {"dense": dense, "rows": np.concatenate(rows), "indices": np.concatenate(indices), "signs": np.concatenate(signs),
+            "phase": phase.astype(np.float32)}
+
+def weightVectors(weights):
+    # (dense weights, midgame table, endgame table) with the tables indexed by (piece type - 1) * 64 + square
+    dense = np.array([weights["material"][name] for name in pieceNames] + [weights[name] for name in termNames], dtype = np.float64)
+    tables = [np.array([weights["pieceSquare"][stage][name] for name in pieceNames], dtype = np.float64).ravel() for stage in stageNames]
+
+    return dense, tables[0], tables[1]
+
+def weightsFromVectors(dense, midgame, endgame):
+    weights = {"material": {name: float(dense[index]) for index, name in enumerate(pieceNames)}}
+    weights.update((name, float(dense[len(pieceNames) + index])) for index, name in enumerate(termNames))
+    weights["pieceSquare"] = {stage: {name: [float(value) for value in table[64 * index:64 * (index + 1)]] for index, name in enumerate(pieceNames)}
+                              for stage, table in zip(stageNames, (midgame, endgame))}
+
+    return weights
+
+def linearEvaluation(features, dense, midgame, endgame):
+    # Scores from White's side in pawns, with the piece-square tables tapered by the phase
+    rows = features["rows"]
+    phase = features["phase"][rows]
+    pieceSquare = features["signs"] * (midgame[features["indices"]] * phase + endgame[features["indices"]] * (1 - phase))
+
+    return features["dense"] @ dense + np.bincount(rows, weights = pieceSquare, minlength = len(features["dense"]))
+
+def evaluateBatch(packed, weights = None):
+    # Scores every packed position the way evaluate() does, from White's side in pawns
+    weights = weights if weights != None else ChessEngine.evaluationWeights
+
+    return linearEvaluation(evaluationFeatures(packed), *weightVectors(weights))
+
+def compareWithScalar(boards, tolerance = 0.01):
+    packStart = time.perf_counter()
+    packed = packPositions(boards)
+    packTime = time.perf_counter() - packStart
+
+    batchStart = time.perf_counter()
+    batchScores = evaluateBatch(packed)
+    batchTime = time.perf_counter() - batchStart
+
+    scalarStart = time.perf_counter()
+    scalarScores = np.array([evaluate(board.fen()) for board in boards])
+    scalarTime = time.perf_counter() - scalarStart
+
+    errors = np.abs(batchScores - scalarScores)
+
+    return {"positions": len(boards), "withinTolerance": float(np.mean(errors <= tolerance)) if len(boards) > 0 else 1.0,
+            "maxError": float(errors.max()) if len(boards) > 0 else 0.0, "meanError": float(errors.mean()) if len(boards) > 0 else 0.0,
+            "batchPositionsPerSecond": len(boards) / (packTime + batchTime) if packTime + batchTime > 0 else 0,
+            "batchEvaluatePositionsPerSecond": len(boards) / batchTime if batchTime > 0 else 0,
+            "scalarPositionsPerSecond": len(boards) / scalarTime if scalarTime > 0 else 0}
+
+def main():
+    from BatchAnalysis import readPositions
+
+    parser = argparse.ArgumentParser(description = "Compare the NumPy batch evaluation with the scalar evaluate().")
+    parser.add_argument("inputs", nargs = "+", help = "FEN/EPD files with one position per line, or PGN files")
+    parser.add_argument("--tolerance", type = float, default = 0.01, help = "largest difference in pawns counted as a match")
+    arguments = parser.parse_args()
+
+    boards = [chess.Board(fen) for positionId, fen in readPositions(arguments.inputs)]
+    report = compareWithScalar(boards, arguments.tolerance)
+
+    print("positions {}".format(report["positions"]))
+    print("within {} pawns: {:.1%}, max error {:.2f}, mean error {:.3f}".format(arguments.tolerance, report["withinTolerance"],
+          report["maxError"], report["meanError"]))
+    print("batch {:.0f} positions/s ({:.0f} without packing), scalar {:.0f} positions/s".format(report["batchPositionsPerSecond"],
+          report["batchEvaluatePositionsPerSecond"], report["scalarPositionsPerSecond"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Search benchmark.
+
+Searches a fixed set of opening, middlegame and endgame positions to a fixed
+depth and reports total nodes, nodes per second, the time to reach the depth
+in every position and a signature of the node counts. The node counts only
+change when the search itself changes, so the signature tells whether a change
+was meant to be functional, and a stored baseline catches both unexpected node
+count changes and speed regressions:
+
+    python Bench.py --save-baseline bench.json
+    python Bench.py --baseline bench.json
+"""
+
+import sys
+import json
+import time
+import zlib
+import argparse
+import chess
+import ChessEngine
+
+benchDepth = 3
+benchPositions = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1",
+    "rnbqkbnr/pp1ppppp/8/2p5/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2",
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "r1bqkbnr/pppp1ppp/2n5/1B2p3/4P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3",
+    "rnbqkb1r/pppp1ppp/4pn2/8/2PP4/8/PP2PPPP/RNBQKBNR w KQkq - 0 3",
+    "rnbqkb1r/ppp1pppp/5n2/3p4/3P1B2/5N2/PPP1PPPP/RN1QKB1R b KQkq - 3 3",
+    "rnbqk2r/ppp1ppbp/3p1np1/8/2PPP3/2N5/PP3PPP/R1BQKBNR w KQkq - 1 5",
+    "r1bqk2r/pppp1ppp/2n2n2/2b1p3/2B1P3/2P2N2/PP1P1PPP/RNBQK2R w KQkq - 4 5",
+    "rnbqkb1r/pp2pppp/3p1n2/8/3NP3/2N5/PPP2PPP/R1BQKB1R b KQkq - 2 5",
+    "r1bqkb1r/1ppp1ppp/p1n2n2/4p3/B3P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 2 5",
+    "rnbqkb1r/1p2pppp/p2p1n2/8/3NP3/2N5/PPP2PPP/R1BQKB1R w KQkq - 0 6",
+    "r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2PP1N2/PP3PPP/RNBQ1RK1 w - - 0 7",
+    "rn1qkb1r/pp2pppp/2p2n2/5b2/P1pP3N/2N5/1P2PPPP/R1BQKB1R b KQkq - 1 6",
+    "r1bqk2r/ppp2ppp/2n5/3np3/1b1P4/2N2N2/PP2PPPP/R1BQKB1R w KQkq - 1 7",
+    "r2qkb1r/pp1n1ppp/2p1pn2/3p1b2/2PP4/1QN1PN2/PP3PPP/R1B1KB1R w KQkq - 2 7",
+    "r1bqk2r/2ppbppp/p1n2n2/1p2p3/4P3/1B3N2/PPPP1PPP/RNBQR1K1 b kq - 1 7",
+    "rnbq1rk1/ppp1bppp/4pn2/3p2B1/2PP4/2N1P3/PP3PPP/R2QKBNR w KQ - 2 6",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+    "r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1",
+    "2r2rk1/1bqnbpp1/1p1ppn1p/pP6/N1P1P3/P2B1N1P/1B2QPP1/R2R2K1 b - - 0 1",
+    "r1b2rk1/2q1b1pp/p2ppn2/1p6/3QP3/1BN1B3/PPP3PP/R4RK1 w - - 0 1",
+    "r3r1k1/2p2ppp/p1p1bn2/8/1q2P3/2NPQN2/PPP3PP/R4RK1 b - - 2 15",
+    "r1bbk1nr/pp3p1p/2n5/1N4p1/2Np1B2/8/PPP2PPP/2KR1B1R w kq - 0 13",
+    "r1bq1rk1/ppp1nppp/4n3/3p3Q/3P4/1BP1B3/PP1N2PP/R4RK1 w - - 1 16",
+    "4r1k1/r1q2ppp/ppp2n2/4P3/5Rb1/1N1BQ3/PPP3PP/R5K1 w - - 1 17",
+    "2rqkb1r/ppp2p2/2npb1p1/1N1Nn2p/2P1PP2/8/PP2B1PP/R1BQK2R b KQ - 0 11",
+    "r1bq1r1k/b1p1npp1/p2p3p/1p6/3PP3/1B2NN2/PP3PPP/R2Q1RK1 w - - 1 16",
+    "3r1rk1/p5pp/bpp1pp2/8/q1PP1P2/b3P3/P2NQRPP/1R2B1K1 b - - 6 22",
+    "r1q2rk1/2p1bppp/2Pp4/p6b/Q1PNp3/4B3/PP1R1PPP/2K4R w - - 2 18",
+    "4k2r/1pb2ppp/1p2p3/1R1p4/3P4/2r1PN2/P4PPP/1R4K1 b - - 3 22",
+    "3q2k1/pb3p1p/4pbp1/2r5/PpN2N2/1P2P2P/5PP1/Q2R2K1 b - - 4 26",
+    "6k1/6p1/6Pp/ppp5/3pn2P/1P3K2/1PP2P2/3N4 b - - 0 1",
+    "3b4/5kp1/1p1p1p1p/pP1PpP1P/P1P1P3/3KN3/8/8 w - - 0 1",
+    "2K5/p7/7P/5pR1/8/5k2/r7/8 w - - 0 1",
+    "8/6pk/1p6/8/PP3p1p/5P2/4KP1q/3Q4 w - - 0 1",
+    "7k/3p2pp/4q3/8/4Q3/5Kp1/P6b/8 w - - 0 1",
+    "8/2p5/8/2kPKp1p/2p4P/2P5/3P4/8 w - - 0 1",
+    "8/1p3pp1/7p/5P1P/2k3P1/8/2K2P2/8 w - - 0 1",
+    "8/pp2r1k1/2p1p3/3pP2p/1P1P1P1P/P5KR/8/8 w - - 0 1",
+    "8/3p4/p1bk3p/Pp6/1Kp1PpPp/2P2P1P/2P5/5B2 b - - 0 1",
+    "5k2/7R/4P2p/5K2/p1r2P1p/8/8/8 b - - 0 1",
+    "6k1/6p1/P6p/r1N5/5p2/7P/1b3PP1/4R1K1 w - - 0 1",
+    "1r3k2/4q3/2Pp3b/3Bp3/2Q2p2/1p1P2P1/1P2KP2/3N4 w - - 0 1",
+    "6k1/4pp1p/3p2p1/P1pPb3/R7/1r2P1PP/3B1P2/6K1 w - - 0 1",
+    "8/3p3B/5p2/5P2/p7/PP5b/k7/6K1 w - - 0 1",
+    "8/8/8/8/5kp1/P7/8/1K1N4 w - - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "8/8/3P3k/8/1p6/8/1P6/1K3n2 b - - 0 1",
+    "8/R7/2q5/8/6k1/8/1P5p/K6R w - - 0 124",
+]
+
+def runBench(depth = benchDepth, hashSize = 16, positions = None, report = None):
+    positions = positions if positions != None else benchPositions
+
+    ChessEngine.initSearch(hashSize)
+    # Cached results would skip the searches whose node counts the bench compares, and
+    # move ordering carried over from the previous position would change them
+    searchCache = ChessEngine.searchCache
+    searchReuse = ChessEngine.searchReuse
+    ChessEngine.searchCache = None
+    ChessEngine.setSearchReuse(False)
+    results = []
+    startTime = time.perf_counter()
+
+    for fen in positions:
+        board = chess.Board(fen)
+
+        # Every position starts from an empty table so the node counts are reproducible
+        ChessEngine.transpositionTable.clear()
+        positionStart = time.perf_counter()
+        move = ChessEngine.alphaBetaSearch(board, depth)
+
+        result = {"fen": fen, "bestmove": move.uci(), "nodes": ChessEngine.nodeStack.iterations,
+                  "time": round(time.perf_counter() - positionStart, 4)}
+        results.append(result)
+
+        if report != None:
+            report(len(results), result)
+
+    ChessEngine.searchCache = searchCache
+    ChessEngine.setSearchReuse(searchReuse, ChessEngine.keptSearches)
+    elapsed = time.perf_counter() - startTime
+    nodes = sum(r["nodes"] for r in results)
+
+    return {"depth": depth, "positions": len(results), "nodes": nodes, "time": round(elapsed, 4),
+            "nps": int(nodes / elapsed) if elapsed > 0 else 0, "signature": benchSignature(results), "results": results}
+
+def benchSignature(results):
+    # Changes whenever the node count of any position changes, not only the total
+    return "{:08x}".format(zlib.crc32(" ".join(str(r["nodes"]) for r in results).encode()))
+
+def compareWithBaseline(bench, baseline, npsTolerance = 0.1):
+    # Returns a description of every way the bench differs from the baseline
+    failures = []
+
+    if bench["depth"] != baseline["depth"] or bench["positions"] != baseline["positions"]:
+        return ["baseline was taken at depth {} over {} positions".format(baseline["depth"], baseline["positions"])]
+
+    if bench["signature"] != baseline["signature"]:
+        failures.append("signature {} differs from baseline {} (nodes {} vs {})".format(bench["signature"], 
+                        baseline["signature"], bench["nodes"], baseline["nodes"]))
+
+        for result, expected in zip(bench["results"], baseline["results"]):
+            if result["nodes"] != expected["nodes"]:
+                failures.append("  {} nodes {} vs {}".format(result["fen"], result["nodes"], expected["nodes"]))
+
+    if bench["nps"] < baseline["nps"] * (1 - npsTolerance):
+        failures.append("nps {} is more than {:.0%} below baseline {}".format(bench["nps"], npsTolerance, baseline["nps"]))
+
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark the search on a fixed set of positions.")
+    parser.add_argument("--depth", type = int, default = benchDepth)
+    parser.add_argument("--hash", type = int, default = 16, help = "transposition table size in MB")
+    parser.add_argument("--baseline", help = "baseline JSON to compare against, exits with status 1 on a regression")
+    parser.add_argument("--save-baseline", help = "write the result as a baseline JSON")
+    parser.add_argument("--nps-tolerance", type = float, default = 0.1, help = "allowed nps drop against the baseline")
+    parser.add_argument("--quiet", action = "store_true", help = "only print the summary")
+    parser.add_argument("--no-null-move", action = "store_true", help = "search without null-move pruning")
+    parser.add_argument("--no-lmr", action = "store_true", help = "search without late move reductions")
+    parser.add_argument("--weights", help = "evaluation weights JSON written by Tuner.py")
+    parser.add_argument("--report", help = "append a JSON line per search to this file")
+    parser.add_argument("--metrics", help = "write running totals in the Prometheus text format to this file")
+    parser.add_argument("--profile", choices = ["cprofile", "pyinstrument"], help = "profile every search into ./profiles")
+    arguments = parser.parse_args()
+
+    ChessEngine.setInstrumentation(arguments.report, arguments.metrics, arguments.profile)
+    ChessEngine.setSelectiveSearch(not arguments.no_null_move, not arguments.no_lmr)
+    ChessEngine.setEvaluationWeights(arguments.weights)
+
+    def report(index, result):
+        print("{:2d}/{} {:>8} nodes {:7.3f}s {} {}".format(index, len(benchPositions), result["nodes"], result["time"], 
+              result["bestmove"], result["fen"]), file = sys.stderr)
+
+    bench = runBench(arguments.depth, arguments.hash, report = None if arguments.quiet else report)
+
+    print("depth {} positions {}".format(bench["depth"], bench["positions"]))
+    print("total time (s) {:.3f}".format(bench["time"]))
+    print("nodes searched {}".format(bench["nodes"]))
+    print("nodes/second {}".format(bench["nps"]))
+    print("signature {}".format(bench["signature"]))
+
+    if arguments.save_baseline != None:
+        with open(arguments.save_baseline, "w") as baselineFile:
+            json.dump(bench, baselineFile, indent = 1)
+
+    if arguments.baseline != None:
+        with open(arguments.baseline) as baselineFile:
+            failures = compareWithBaseline(bench, json.load(baselineFile), arguments.nps_tolerance)
+
+        for failure in failures:
+            print(failure)
+
+        if len(failures) > 0:
+            sys.exit(1)
+
+        print("matches baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,763 @@
+# -*- coding: utf-8 -*-
+"""
+Bitboard position used inside the search.
+
+A Position keeps the pieces as integer bitboards plus a square-by-square piece
+list, and makes and unmakes moves in place with a small undo record instead of
+copying the board. Moves are the same 16-bit integers the transposition table
+stores, so the search never creates move objects. Attacks come from tables
+built once at import: knight, king and pawn attacks by square, and slider
+attacks looked up by the occupancy of the rank, file or diagonals through the
+square. The Zobrist key is the Polyglot key python-chess computes, updated with
+every move. Legal moves come out in the same order as python-chess generates
+them, so searches visit the same nodes as they did on chess.Board.
+
+Positions are only converted from and to chess.Board at the root of a search.
+"""
+
+import chess
+import chess.polyglot
+
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(1, 7)
+WHITE, BLACK = True, False
+ALL = (1 << 64) - 1
+NULL_MOVE = 0
+
+squareMasks = [1 << square for square in range(64)]
+rankMasks = [0xFF << (8 * rank) for rank in range(8)]
+fileMasks = [0x0101010101010101 << file for file in range(8)]
+backRanks = [rankMasks[7], rankMasks[0]]
+
+def squareDistance(a, b):
+    return max(abs((a & 7) - (b & 7)), abs((a >> 3) - (b >> 3)))
+
+def stepAttacks(square, deltas):
+    attacks = 0
+
+    for delta in deltas:
+        target = square + delta
+
+        if 0 <= target < 64 and squareDistance(square, target) <= 2:
+            attacks |= 1 << target
+
+    return attacks
+
+def slidingAttacks(square, occupied, deltas):
+    attacks = 0
+
+    for delta in deltas:
+        target = square
+
+        while True:
+            target += delta
+
+            if not 0 <= target < 64 or squareDistance(target, target - delta) > 2:
+                break
+
+            attacks |= 1 << target
+
+            if occupied & (1 << target):
+                break
+
+    return attacks
+
+def slidingTables(deltas):
+    # For every square the relevant occupancy mask and the attacks for every subset of it
+    masks = []
+    tables = []
+
+    for square in range(64):
+        edges = ((rankMasks[0] | rankMasks[7]) & ~rankMasks[square >> 3]) | ((fileMasks[0] | fileMasks[7]) & ~fileMasks[square & 7])
+        mask = slidingAttacks(square, 0, deltas) & ~edges
+        table = {}
+        subset = 0
+
+        while True:
+            table[subset] = slidingAttacks(square, subset, deltas)
+            subset = (subset - mask) & mask
+
+            if subset == 0:
+                break
+
+        masks.append(mask)
+        tables.append(table)
+
+    return masks, tables
+
+knightAttacks = [stepAttacks(square, (17, 15, 10, 6, -17, -15, -10, -6)) for square in range(64)]
+kingAttacks = [stepAttacks(square, (9, 8, 7, 1, -9, -8, -7, -1)) for square in range(64)]
+# Indexed by colour, so pawnAttacks[WHITE] are the squares a white pawn attacks
+pawnAttacks = [[stepAttacks(square, (-7, -9)) for square in range(64)], [stepAttacks(square, (7, 9)) for square in range(64)]]
+
+diagMasks, diagAttacks = slidingTables((-9, -7, 7, 9))
+fileMasksRelevant, fileAttacks = slidingTables((-8, 8))
+rankMasksRelevant, rankAttacks = slidingTables((-1, 1))
+
+def buildLines():
+    # lines[a][b] is the whole line through two aligned squares, between[a][b] the squares strictly between them
+    lines = []
+    between = []
+
+    for a in range(64):
+        lineRow = []
+        betweenRow = []
+
+        for b in range(64):
+            bit = squareMasks[b]
+
+            for masks, tables in ((diagMasks, diagAttacks), (rankMasksRelevant, rankAttacks), (fileMasksRelevant, fileAttacks)):
+                if tables[a][0] & bit:
+                    lineRow.append((tables[a][0] & tables[b][0]) | squareMasks[a] | bit)
+                    betweenRow.append(tables[a][masks[a] & bit] & tables[b][masks[b] & squareMasks[a]])
+                    break
+            else:
+                lineRow.append(0)
+                betweenRow.append(0)
+
+        lines.append(lineRow)
+        between.append(betweenRow)
+
+    return lines, between
+
+lines, between = buildLines()
+
+# Polyglot Zobrist keys: pieceKeys[colour][pieceType][square], then castling, en passant file and side to move
+randomArray = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+pieceKeys = [[[randomArray[64 * ((pieceType - 1) * 2 + color) + square] for square in range(64)] if pieceType else None
+              for pieceType in range(7)] for color in (0, 1)]
+castlingKeys = {chess.H1: randomArray[768], chess.A1: randomArray[769], chess.H8: randomArray[770], chess.A8: randomArray[771]}
+epKeys = randomArray[772:780]
+turnKey = randomArray[780]
+
+def castlingKey(castling):
+    key = 0
+
+    for square, squareKey in castlingKeys.items():
+        if castling & squareMasks[square]:
+            key ^= squareKey
+
+    return key
+
+def scanReversed(bitboard):
+    # Squares of a bitboard from the highest to the lowest, the order python-chess generates in
+    squares = []
+
+    while bitboard:
+        square = bitboard.bit_length() - 1
+        squares.append(square)
+        bitboard ^= 1 << square
+
+    return squares
+
+def popcount(bitboard):
+    return bin(bitboard).count("1")
+
+class Position:
+
+    def __init__(self, board = None):
+        self.pieces = [0] * 7
+        self.colors = [0, 0]
+        self.pieceTypes = [0] * 64
+        self.occupied = 0
+        self.turn = WHITE
+        self.castling = 0
+        self.epSquare = None
+        self.halfmoveClock = 0
+        self.fullmoveNumber = 1
+        self.key = 0
+        self.stack = []
+
+        if board != None:
+            self.setBoard(board)
+
+    def setBoard(self, board):
+        self.__init__()
+
+        for square, piece in board.piece_map().items():
+            self.putPiece(square, piece.piece_type, piece.color)
+
+        self.turn = board.turn
+        self.castling = board.clean_castling_rights()
+        self.epSquare = board.ep_square
+        self.halfmoveClock = board.halfmove_clock
+        self.fullmoveNumber = board.fullmove_number
+        self.key ^= castlingKey(self.castling) ^ (turnKey if self.turn else 0)
+
+    def toBoard(self):
+        board = chess.Board(None)
+        board.set_piece_map({square: chess.Piece(self.pieceTypes[square], bool(self.colors[WHITE] & squareMasks[square]))
+                             for square in scanReversed(self.occupied)})
+        board.turn = self.turn
+        board.castling_rights = self.castling
+        board.ep_square = self.epSquare
+        board.halfmove_clock = self.halfmoveClock
+        board.fullmove_number = self.fullmoveNumber
+
+        return board
+
+    def putPiece(self, square, pieceType, color):
+        bit = squareMasks[square]
+        self.pieces[pieceType] |= bit
+        self.colors[color] |= bit
+        self.occupied |= bit
+        self.pieceTypes[square] = pieceType
+        self.key ^= pieceKeys[color][pieceType][square]
+
+    def zobristKey(self):
+        # The en passant file only counts when a pawn stands ready to capture, as in Polyglot
+        if self.epSquare != None and pawnAttacks[not self.turn][self.epSquare] & self.pieces[PAWN] & self.colors[self.turn]:
+            return self.key ^ epKeys[self.epSquare & 7]
+
+        return self.key
+
+    def pieceTypeAt(self, square):
+        return self.pieceTypes[square]
+
+    def colorAt(self, square):
+        return bool(self.colors[WHITE] & squareMasks[square])
+
+    def kingSquare(self, color):
+        kings = self.pieces[KING] & self.colors[color]
+
+        return kings.bit_length() - 1 if kings else None
+
+    def lastMoveWasNull(self):
+        return len(self.stack) > 0 and self.stack[-1][0] == NULL_MOVE
+
+    def attacksFrom(self, square):
+        pieceType = self.pieceTypes[square]
+
+        if pieceType == KNIGHT:
+            return knightAttacks[square]
+        elif pieceType == KING:
+            return kingAttacks[square]
+        elif pieceType == PAWN:
+            return pawnAttacks[self.colors[WHITE] >> square & 1][square]
+
+        occupied = self.occupied
+        attacks = 0
+
+        if pieceType != ROOK:
+            attacks = diagAttacks[square][diagMasks[square] & occupied]
+
+        if pieceType != BISHOP:
+            attacks |= rankAttacks[square][rankMasksRelevant[square] & occupied] | fileAttacks[square][fileMasksRelevant[square] & occupied]
+
+        return attacks
+
+    def attackersMask(self, color, square, occupied):
+        pieces = self.pieces
+        queens = pieces[QUEEN]
+        rooksAndQueens = pieces[ROOK] | queens
+        bishopsAndQueens = pieces[BISHOP] | queens
+
+        attackers = ((kingAttacks[square] & pieces[KING]) | (knightAttacks[square] & pieces[KNIGHT]) |
+                     ((rankAttacks[square][rankMasksRelevant[square] & occupied] | fileAttacks[square][fileMasksRelevant[square] & occupied]) & rooksAndQueens) |
+                     (diagAttacks[square][diagMasks[square] & occupied] & bishopsAndQueens) |
+                     (pawnAttacks[not color][square] & pieces[PAWN]))
+
+        return attackers & self.colors[color]
+
+    def isCheck(self):
+        king = self.kingSquare(self.turn)
+
+        return king != None and bool(self.attackersMask(not self.turn, king, self.occupied))
+
+    def isCapture(self, move):
+        return bool(self.colors[not self.turn] & squareMasks[(move >> 6) & 63]) or self.isEnPassant(move)
+
+    def isEnPassant(self, move):
+        toSquare = (move >> 6) & 63
+
+        return (toSquare == self.epSquare and self.pieceTypes[move & 63] == PAWN and abs(toSquare - (move & 63)) in (7, 9)
+                and not self.occupied & squareMasks[toSquare])
+
+    def isCastling(self, move):
+        return self.pieceTypes[move & 63] == KING and abs((move & 7) - ((move >> 6) & 7)) > 1
+
+    def givesCheck(self, move):
+        self.push(move)
+        check = self.isCheck()
+        self.pop()
+
+        return check
+
+    def push(self, move):
+        us = self.turn
+        them = not us
+        key = self.key ^ turnKey
+
+        if not us:
+            self.fullmoveNumber += 1
+
+        # A null move only passes the turn
+        if move == NULL_MOVE:
+            self.stack.append((move, 0, 0, 0, self.castling, self.epSquare, self.halfmoveClock, self.key))
+            self.turn = them
+            self.epSquare = None
+            self.halfmoveClock += 1
+            self.key = key
+            return
+
+        fromSquare = move & 63
+        toSquare = (move >> 6) & 63
+        promotion = move >> 12
+        pieces = self.pieces
+        colors = self.colors
+        pieceTypes = self.pieceTypes
+        pieceType = pieceTypes[fromSquare]
+        fromBit = squareMasks[fromSquare]
+        toBit = squareMasks[toSquare]
+        capturedSquare = toSquare
+        capturedType = pieceTypes[toSquare]
+
+        if pieceType == PAWN and toSquare == self.epSquare and not capturedType and abs(toSquare - fromSquare) in (7, 9):
+            capturedSquare = toSquare - 8 if us else toSquare + 8
+            capturedType = PAWN
+
+        self.stack.append((move, pieceType, capturedType, capturedSquare, self.castling, self.epSquare, self.halfmoveClock, self.key))
+        self.turn = them
+        self.epSquare = None
+
+        if capturedType:
+            capturedBit = squareMasks[capturedSquare]
+            pieces[capturedType] ^= capturedBit
+            colors[them] ^= capturedBit
+            pieceTypes[capturedSquare] = 0
+            key ^= pieceKeys[them][capturedType][capturedSquare]
+
+        newType = promotion or pieceType
+        pieces[pieceType] ^= fromBit
+        pieces[newType] |= toBit
+        colors[us] ^= fromBit | toBit
+        pieceTypes[fromSquare] = 0
+        pieceTypes[toSquare] = newType
+        key ^= pieceKeys[us][pieceType][fromSquare] ^ pieceKeys[us][newType][toSquare]
+
+        if pieceType == KING and abs((fromSquare & 7) - (toSquare & 7)) > 1:
+            rookFrom, rookTo = (fromSquare + 3, fromSquare + 1) if toSquare > fromSquare else (fromSquare - 4, fromSquare - 1)
+            rookBits = squareMasks[rookFrom] | squareMasks[rookTo]
+            pieces[ROOK] ^= rookBits
+            colors[us] ^= rookBits
+            pieceTypes[rookFrom] = 0
+            pieceTypes[rookTo] = ROOK
+            key ^= pieceKeys[us][ROOK][rookFrom] ^ pieceKeys[us][ROOK][rookTo]
+
+        if self.castling:
+            castling = self.castling & ~fromBit & ~toBit
+
+            if pieceType == KING:
+                castling &= ~backRanks[us]
+
+            if castling != self.castling:
+                key ^= castlingKey(self.castling) ^ castlingKey(castling)
+                self.castling = castling
+
+        if pieceType == PAWN:
+            self.halfmoveClock = 0
+
+            if abs(toSquare - fromSquare) == 16:
+                self.epSquare = (fromSquare + toSquare) >> 1
+        elif capturedType:
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+
+        self.occupied = colors[0] | colors[1]
+        self.key = key
+
+    def pop(self):
+        move, pieceType, capturedType, capturedSquare, self.castling, self.epSquare, self.halfmoveClock, self.key = self.stack.pop()
+        them = self.turn
+        us = not them
+        self.turn = us
+
+        if not us:
+            self.fullmoveNumber -= 1
+
+        if move == NULL_MOVE:
+            return
+
+        fromSquare = move & 63
+        toSquare = (move >> 6) & 63
+        pieces = self.pieces
+        colors = self.colors
+        pieceTypes = self.pieceTypes
+        fromBit = squareMasks[fromSquare]
+        toBit = squareMasks[toSquare]
+
+        if pieceType == KING and abs((fromSquare & 7) - (toSquare & 7)) > 1:
+            rookFrom, rookTo = (fromSquare + 3, fromSquare + 1) if toSquare > fromSquare else (fromSquare - 4, fromSquare - 1)
+            rookBits = squareMasks[rookFrom] | squareMasks[rookTo]
+            pieces[ROOK] ^= rookBits
+            colors[us] ^= rookBits
+            pieceTypes[rookTo] = 0
+            pieceTypes[rookFrom] = ROOK
+
+        pieces[pieceTypes[toSquare]] ^= toBit
+        pieces[pieceType] |= fromBit
+        colors[us] ^= fromBit | toBit
+        pieceTypes[toSquare] = 0
+        pieceTypes[fromSquare] = pieceType
+
+        if capturedType:
+            capturedBit = squareMasks[capturedSquare]
+            pieces[capturedType] |= capturedBit
+            colors[them] |= capturedBit
+            pieceTypes[capturedSquare] = capturedType
+
+        self.occupied = colors[0] | colors[1]
+
+    def sliderBlockers(self, king, color):
+        # Pieces of color that are the only piece between their king and an enemy slider
+        pieces = self.pieces
+        occupied = self.occupied
+        snipers = (((rankAttacks[king][0] | fileAttacks[king][0]) & (pieces[ROOK] | pieces[QUEEN])) |
+                   (diagAttacks[king][0] & (pieces[BISHOP] | pieces[QUEEN]))) & self.colors[not color]
+        blockers = 0
+
+        while snipers:
+            sniper = snipers.bit_length() - 1
+            snipers ^= 1 << sniper
+            b = between[king][sniper] & occupied
+
+            if b and not b & (b - 1):
+                blockers |= b
+
+        return blockers & self.colors[color]
+
+    def epSkewered(self, king, capturer):
+        # The king would be in check along the rank once both pawns leave it
+        them = not self.turn
+        lastDouble = self.epSquare + (-8 if self.turn else 8)
+        occupancy = self.occupied & ~squareMasks[lastDouble] & ~squareMasks[capturer] | squareMasks[self.epSquare]
+        pieces = self.pieces
+
+        if rankAttacks[king][rankMasksRelevant[king] & occupancy] & self.colors[them] & (pieces[ROOK] | pieces[QUEEN]):
+            return True
+
+        return bool(diagAttacks[king][diagMasks[king] & occupancy] & self.colors[them] & (pieces[BISHOP] | pieces[QUEEN]))
+
+    def pseudoLegalMoves(self, fromMask = ALL, toMask = ALL):
+        us = self.turn
+        own = self.colors[us]
+        occupied = self.occupied
+        pieces = self.pieces
+        moves = []
+        append = moves.append
+        notOwn = ~own & toMask
+        nonPawns = own & ~pieces[PAWN] & fromMask
+
+        while nonPawns:
+            fromSquare = nonPawns.bit_length() - 1
+            nonPawns ^= 1 << fromSquare
+            targets = self.attacksFrom(fromSquare) & notOwn
+
+            while targets:
+                toSquare = targets.bit_length() - 1
+                targets ^= 1 << toSquare
+                append(fromSquare | toSquare << 6)
+
+        if fromMask & pieces[KING]:
+            moves += self.castlingMoves(fromMask, toMask)
+
+        pawns = pieces[PAWN] & own & fromMask
+
+        if not pawns:
+            return moves
+
+        enemy = self.colors[not us] & toMask
+        attacks = pawnAttacks[us]
+        capturers = pawns
+
+        while capturers:
+            fromSquare = capturers.bit_length() - 1
+            capturers ^= 1 << fromSquare
+            targets = attacks[fromSquare] & enemy
+
+            while targets:
+                toSquare = targets.bit_length() - 1
+                targets ^= 1 << toSquare
+
+                if toSquare < 8 or toSquare >= 56:
+                    base = fromSquare | toSquare << 6
+                    moves += (base | QUEEN << 12, base | ROOK << 12, base | BISHOP << 12, base | KNIGHT << 12)
+                else:
+                    append(fromSquare | toSquare << 6)
+
+        if us:
+            singleMoves = pawns << 8 & ~occupied
+            doubleMoves = singleMoves << 8 & ~occupied & (rankMasks[2] | rankMasks[3])
+            step = -8
+        else:
+            singleMoves = pawns >> 8 & ~occupied
+            doubleMoves = singleMoves >> 8 & ~occupied & (rankMasks[5] | rankMasks[4])
+            step = 8
+
+        singleMoves &= toMask & ALL
+        doubleMoves &= toMask & ALL
+
+        while singleMoves:
+            toSquare = singleMoves.bit_length() - 1
+            singleMoves ^= 1 << toSquare
+            fromSquare = toSquare + step
+
+            if toSquare < 8 or toSquare >= 56:
+                base = fromSquare | toSquare << 6
+                moves += (base | QUEEN << 12, base | ROOK << 12, base | BISHOP << 12, base | KNIGHT << 12)
+            else:
+                append(fromSquare | toSquare << 6)
+
+        while doubleMoves:
+            toSquare = doubleMoves.bit_length() - 1
+            doubleMoves ^= 1 << toSquare
+            append((toSquare + 2 * step) | toSquare << 6)
+
+        if self.epSquare:
+            moves += self.pseudoLegalEp(fromMask, toMask)
+
+        return moves
+
+    def pseudoLegalEp(self, fromMask = ALL, toMask = ALL):
+        epSquare = self.epSquare
+
+        if not epSquare or not squareMasks[epSquare] & toMask or squareMasks[epSquare] & self.occupied:
+            return []
+
+        capturers = (self.pieces[PAWN] & self.colors[self.turn] & fromMask & pawnAttacks[not self.turn][epSquare] &
+                     rankMasks[4 if self.turn else 3])
+
+        return [capturer | epSquare << 6 for capturer in scanReversed(capturers)]
+
+    def castlingMoves(self, fromMask = ALL, toMask = ALL):
+        us = self.turn
+        backRank = backRanks[us]
+        kingBit = self.colors[us] & self.pieces[KING] & backRank & fromMask
+        kingBit &= -kingBit
+
+        if not kingBit:
+            return []
+
+        moves = []
+        king = kingBit.bit_length() - 1
+        occupied = self.occupied
+
+        for candidate in scanReversed(self.castling & backRank & toMask):
+            rookBit = squareMasks[candidate]
+            aSide = rookBit < kingBit
+            kingTo = (fileMasks[2] if aSide else fileMasks[6]) & backRank
+            rookTo = (fileMasks[3] if aSide else fileMasks[5]) & backRank
+            kingPath = between[king][kingTo.bit_length() - 1]
+            rookPath = between[candidate][rookTo.bit_length() - 1]
+
+            if not ((occupied ^ kingBit ^ rookBit) & (kingPath | rookPath | kingTo | rookTo) or
+                    self.attackedForKing(kingPath | kingBit, occupied ^ kingBit) or
+                    self.attackedForKing(kingTo, occupied ^ kingBit ^ rookBit ^ rookTo)):
+                # Standard chess writes castling as the king moving two squares
+                if (king == chess.E1 and candidate in (chess.A1, chess.H1)) or (king == chess.E8 and candidate in (chess.A8, chess.H8)):
+                    moves.append(king | (kingTo.bit_length() - 1) << 6)
+                else:
+                    moves.append(king | candidate << 6)
+
+        return moves
+
+    def attackedForKing(self, path, occupied):
+        them = not self.turn
+
+        return any(self.attackersMask(them, square, occupied) for square in scanReversed(path))
+
+    def evasions(self, king, checkers, fromMask = ALL, toMask = ALL):
+        us = self.turn
+        pieces = self.pieces
+        sliders = checkers & (pieces[BISHOP] | pieces[ROOK] | pieces[QUEEN])
+        attacked = 0
+
+        for checker in scanReversed(sliders):
+            attacked |= lines[king][checker] & ~squareMasks[checker]
+
+        moves = []
+
+        if squareMasks[king] & fromMask:
+            for toSquare in scanReversed(kingAttacks[king] & ~self.colors[us] & ~attacked & toMask):
+                moves.append(king | toSquare << 6)
+
+        checker = checkers.bit_length() - 1
+
+        if squareMasks[checker] == checkers:
+            # Capture or block a single checker
+            target = between[king][checker] | checkers
+            moves += self.pseudoLegalMoves(~pieces[KING] & fromMask & ALL, target & toMask)
+
+            # Capture the checking pawn en passant
+            if self.epSquare and not squareMasks[self.epSquare] & target:
+                lastDouble = self.epSquare + (-8 if us else 8)
+
+                if lastDouble == checker:
+                    moves += self.pseudoLegalEp(fromMask, toMask)
+
+        return moves
+
+    def generateMoves(self, fromMask = ALL, toMask = ALL):
+        # Legal moves as 16-bit integers in python-chess's order
+        us = self.turn
+        king = self.kingSquare(us)
+
+        if king == None:
+            return self.pseudoLegalMoves(fromMask, toMask)
+
+        blockers = self.sliderBlockers(king, us)
+        checkers = self.attackersMask(not us, king, self.occupied)
+        candidates = self.evasions(king, checkers, fromMask, toMask) if checkers else self.pseudoLegalMoves(fromMask, toMask)
+        kingBit = squareMasks[king]
+        epSquare = self.epSquare
+        pieceTypes = self.pieceTypes
+        moves = []
+
+        for move in candidates:
+            fromSquare = move & 63
+            toSquare = (move >> 6) & 63
+
+            if fromSquare == king:
+                if abs((fromSquare & 7) - (toSquare & 7)) > 1 or not self.attackersMask(not us, toSquare, self.occupied):
+                    moves.append(move)
+            elif toSquare == epSquare and pieceTypes[fromSquare] == PAWN and not self.occupied & squareMasks[toSquare]:
+                if (not blockers & squareMasks[fromSquare] or lines[fromSquare][toSquare] & kingBit) and not self.epSkewered(king, fromSquare):
+                    moves.append(move)
+            elif not blockers & squareMasks[fromSquare] or lines[fromSquare][toSquare] & kingBit:
+                moves.append(move)
+
+        return moves
+
+    def generateCaptures(self):
+        # Legal captures, en passant last, in python-chess's order
+        moves = self.generateMoves(ALL, self.colors[not self.turn])
+
+        for move in self.pseudoLegalEp():
+            if self.isLegal(move):
+                moves.append(move)
+
+        return moves
+
+    def isLegal(self, move):
+        fromSquare = move & 63
+        toSquare = (move >> 6) & 63
+
+        if not self.colors[self.turn] & squareMasks[fromSquare]:
+            return False
+
+        if self.isCastling(move):
+            return not self.isCheck() and move in self.castlingMoves()
+
+        return move in self.generateMoves(squareMasks[fromSquare], squareMasks[toSquare])
+
+    def legalMoveCounts(self, color, epSquare):
+        # Number of legal moves of color, and how many of them land on an enemy piece, counted from
+        # attack sets without generating the moves. color need not be the side to move, which is how
+        # the evaluation counts the other side's moves; en passant then is given as None.
+        pieces = self.pieces
+        own = self.colors[color]
+        enemy = self.colors[not color]
+        occupied = self.occupied
+        pawns = pieces[PAWN]
+        king = (pieces[KING] & own).bit_length() - 1
+        checkers = self.attackersMask(not color, king, occupied)
+
+        if checkers & (checkers - 1):
+            target = 0
+        elif checkers:
+            target = between[king][checkers.bit_length() - 1] | checkers
+        else:
+            target = ALL
+
+        blockers = self.sliderBlockers(king, color) if target else 0
+        moves = 0
+        captures = 0
+
+        if target:
+            movers = own & ~pawns & ~pieces[KING]
+            kingLines = lines[king]
+
+            while movers:
+                square = movers.bit_length() - 1
+                movers ^= 1 << square
+                attacks = self.attacksFrom(square) & ~own & target
+
+                if blockers & (1 << square):
+                    attacks &= kingLines[square]
+
+                moves += popcount(attacks)
+                captures += popcount(attacks & enemy)
+
+            movers = own & pawns
+            attacks = pawnAttacks[color]
+            step = 8 if color else -8
+            startRank = rankMasks[1] if color else rankMasks[6]
+
+            while movers:
+                square = movers.bit_length() - 1
+                movers ^= 1 << square
+                targets = attacks[square] & enemy
+                single = square + step
+
+                if not occupied & (1 << single):
+                    targets |= 1 << single
+
+                    if (1 << square) & startRank and not occupied & (1 << (single + step)):
+                        targets |= 1 << (single + step)
+
+                targets &= target
+
+                if blockers & (1 << square):
+                    targets &= kingLines[square]
+
+                # A pawn reaching the last rank has four moves, one for each promotion
+                count = popcount(targets)
+                capturesHere = popcount(targets & enemy)
+
+                if single < 8 or single >= 56:
+                    count *= 4
+                    capturesHere *= 4
+
+                moves += count
+                captures += capturesHere
+
+            if epSquare != None and not occupied & squareMasks[epSquare]:
+                capturedSquare = epSquare - step
+
+                for square in scanReversed(own & pawns & pawnAttacks[not color][epSquare] & rankMasks[4 if color else 3]):
+                    after = occupied ^ squareMasks[square] ^ squareMasks[capturedSquare] | squareMasks[epSquare]
+
+                    if not self.attackersMask(not color, king, after) & ~squareMasks[capturedSquare]:
+                        moves += 1
+
+            if not checkers and self.castling & backRanks[color]:
+                turn = self.turn
+                self.turn = color
+                moves += len(self.castlingMoves())
+                self.turn = turn
+
+        withoutKing = occupied ^ squareMasks[king]
+
+        for square in scanReversed(kingAttacks[king] & ~own):
+            if not self.attackersMask(not color, square, withoutKing):
+                moves += 1
+
+                if enemy & squareMasks[square]:
+                    captures += 1
+
+        return moves, captures
+
+    def perft(self, depth):
+        moves = self.generateMoves()
+
+        if depth <= 1:
+            return len(moves) if depth == 1 else 1
+
+        nodes = 0
+
+        for move in moves:
+            self.push(move)
+            nodes += self.perft(depth - 1)
+            self.pop()
+
+        return nodes
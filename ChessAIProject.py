@@ -8,208 +8,15 @@ Chess pieces by Cburnett - Own work, CC BY-SA 3.0, https://commons.wikimedia.org
 """
 
 import os
+import argparse
 import chess
+import logging
 import random
 import cairosvg
-import copy
-import math
-from functools import total_ordering
+import threading
 import PySimpleGUI as gui
-
-@total_ordering
-class TreeNode:
-    iterations = 0
-    
-    def __init__(self, color, move, position, evaluation):
-        self.color = color
-        self.move = move
-        self.position = position
-        self.evaluation = evaluation
-        self.parentNode = None
-        self.childNodes = []
-    
-    def __eq__(self, other):
-        if isinstance(other, TreeNode):
-            return self.evaluation == other.evaluation and self.position == other.position
-        else:
-            return self.evaluation == other
-        
-    def __lt__(self, other):
-        
-        if isinstance(other, TreeNode):
-            return self.evaluation < other.evaluation
-        else:
-            return self.evaluation < other
-    
-    def __hash__(self):
-        return hash(("color", self.color, "position", self.position, 
-                     "move", self.move, "evaluation", self.evaluation, "parentNode", 
-                     self.parentNode, "childNodes", self.childNodes))
-    
-def evaluate(FENPosition):
-    global checkerCount
-    
-    board = chess.Board(FENPosition)
-    pieceMap = board.piece_map()
-    
-    if not board.turn: 
-        opponentLegalMoves = list(board.copy().legal_moves)
-        board.push(chess.Move.null())
-        legalMoves = list(board.copy().legal_moves)
-        board.push(chess.Move.null())
-    else:
-        legalMoves = list(board.copy().legal_moves)
-        board.push(chess.Move.null())
-        opponentLegalMoves = list(board.copy().legal_moves)
-        board.push(chess.Move.null())
-        
-    pawnList = []
-    opponentPawnList = []
-    
-    for c in range(checkerCount):
-        pawnList.append([])
-        opponentPawnList.append([])
-     
-    evaluation = 200 * (len(board.pieces(6, True)) - len(board.pieces(6, False)))
-    evaluation += len(board.pieces(1, True)) - len(board.pieces(1, False))
-    evaluation += 3 * (len(board.pieces(2, True)) - len(board.pieces(2, False)))
-    evaluation += 3.5 * (len(board.pieces(3, True)) - len(board.pieces(3, False)))
-    evaluation += 5 * (len(board.pieces(4, True)) - len(board.pieces(4, False)))
-    evaluation += 9 * (len(board.pieces(5, True)) - len(board.pieces(5, False)))
-    
-    for p in pieceMap:
-        if pieceMap[p].piece_type == 1:
-            if pieceMap[p].color:
-                pawnList[p % checkerCount].append(p)
-            else:
-                opponentPawnList[p % checkerCount].append(p)
-            
-    for rank in pawnList:
-        index = pawnList.index(rank)
-        
-        if len(rank) > 0:
-            # Checks for doubled pawns
-            if len(rank) > 1:
-                evaluation -= 0.5
-            
-            # Checks for isolated pawns
-            if 0 < index + 1 < checkerCount and len(pawnList[index - 1]) == 0 and len(pawnList[index + 1]) == 0:
-                evaluation -= 0.5
-            
-            # Checks for blocked pawns
-            if board.piece_at(rank[-1] + (checkerCount)) != None:
-                evaluation -= 0.5
-            
-    for rank in opponentPawnList:
-        index = opponentPawnList.index(rank)
-        
-        if len(rank) > 0:
-            # Checks for doubled pawns
-            if len(rank) > 1:
-                evaluation += 0.5
-            
-            # Checks for isolated pawns
-            if 0 < index + 1 < checkerCount and len(opponentPawnList[index - 1]) == 0 and len(opponentPawnList[index + 1]) == 0:
-                evaluation += 0.5
-            
-            if board.piece_at(rank[-1] - checkerCount) != None:
-                evaluation += 0.5
-    
-    attacks = 0
-    opponentAttacks = 0
-    
-    for move in legalMoves:
-        if board.is_capture(move) > 0:
-            attacks += 1
-            
-    for opponentMove in opponentLegalMoves:
-        if board.is_capture(opponentMove):
-            opponentAttacks += 1
-    
-    
-    evaluation += 0.5 * (attacks - opponentAttacks)
-    evaluation += 0.1 * (len(legalMoves) - len(opponentLegalMoves))
-       
-    return evaluation
-
-def collectChildren(baseNode):
-    turnBoard = chess.Board(baseNode.position)
-    baseNode.childNodes = []
-    
-    for m in list(turnBoard.legal_moves):
-        turnBoard.push(m)
-        newNode = TreeNode(not copy.copy(turnBoard.turn), m.uci(), turnBoard.fen(), evaluate(turnBoard.fen()))
-        
-        if ((not newNode.color) and newNode.evaluation > baseNode.evaluation - 4) or (newNode.color and newNode.evaluation < baseNode.evaluation + 4):
-            baseNode.childNodes.append(newNode)
-            
-        turnBoard.pop()
-        
-    for c in baseNode.childNodes:
-        c.parentNode = baseNode
-
-def alphaBetaMax(currentNode, depthLeft, alpha = -math.inf, beta = math.inf):
-    
-    if depthLeft == 0:
-        return currentNode
-   
-    currentNode.childNodes.sort(reverse = True)
-    
-    for n in currentNode.childNodes:
-        TreeNode.iterations += 1
-            
-        collectChildren(n)
-        score = alphaBetaMin(n, depthLeft - 1, alpha, beta)
-        
-        if score >= beta:
-            n.evaluation = score.evaluation
-            return n
-           
-        if score > alpha:
-            n.evaluation = score.evaluation
-            alpha = n
-   
-    return alpha
-
-def alphaBetaMin(currentNode, depthLeft, alpha = -math.inf, beta = math.inf):
-    if depthLeft == 0 or len(currentNode.childNodes) == 0:
-        return currentNode
-    
-    currentNode.childNodes.sort()
-    
-    for n in currentNode.childNodes:
-        TreeNode.iterations += 1
-        
-        collectChildren(n)
-        score = alphaBetaMax(n, depthLeft - 1, alpha, beta)
-        
-        if score <= alpha:
-            n.evaluation = score.evaluation
-            return n
-       
-        if score < beta:
-            n.evaluation = score.evaluation
-            beta = n
-           
-    return beta
-
-def alphaBetaSearch(depth):
-    global board, startingPlayer
-    
-    TreeNode.iterations = 0
-    baseNode = TreeNode(not board.turn, board.peek().uci(), board.fen(), evaluate(board.fen()))
-    
-    collectChildren(baseNode)
-    
-    if startingPlayer == "Human":
-        deepestNode = alphaBetaMin(baseNode, depth, baseNode)
-    else:
-        deepestNode = alphaBetaMax(baseNode, depth, beta = baseNode)
-
-    print(deepestNode.evaluation)
-    print(TreeNode.iterations)
-    
-    return board.parse_uci(deepestNode.move)
+import ChessEngine
+from ChessEngine import alphaBetaSearch, initSearch, stopSearch
 
 def drawMarkers(pieceSquare):
     global spaceSize, startingPlayer, flipIfAI, board, moveMarkers
@@ -227,18 +34,61 @@ def drawMarkers(pieceSquare):
         
         rowOffset = (move.to_square // checkerCount) % 2 
         
-        image = os.path.join(relativePath, "images\\moveMarker" + ("Alt" if (move.to_square + rowOffset) % 2 == 0 else "") + ".svg" )
+        image = "moveMarker" + ("Alt" if (move.to_square + rowOffset) % 2 == 0 else "")
         
-        moveMarkers.append(graph.draw_image(data = cairosvg.svg2png(url = image, parent_width = spaceSize,
-                        parent_height = spaceSize), location = movePos))
+        moveMarkers.append(graph.draw_image(data = loadSprite(image), location = movePos))
         
 def drawPiece(piece, position):
-    global relativePath, spaceSize, graph
+    global graph
+    
+    return graph.draw_image(data = loadSprite(parsePiece(piece)), location = position)
+
+def loadSprite(imageName):
+    # Returns the PNG for an SVG in images/ at the current square size, rasterizing
+    # it only the first time and reusing a copy saved on disk when the SVG is unchanged
+    global relativePath, spaceSize, spriteCache, spriteCacheDirectory
+    
+    key = (imageName, spaceSize)
+    
+    if key in spriteCache:
+        return spriteCache[key]
+    
+    image = os.path.join(relativePath, "images", imageName + ".svg")
+    status = os.stat(image)
+    cachedImage = None
+    
+    if spriteCacheDirectory != None:
+        cachedImage = os.path.join(spriteCacheDirectory, "{}-{:g}-{}-{}.png".format(imageName, spaceSize, 
+                                   status.st_mtime_ns, status.st_size))
         
-    image = os.path.join(relativePath, "images\\" + parsePiece(piece) + ".svg")
+        if os.path.exists(cachedImage):
+            with open(cachedImage, "rb") as cachedFile:
+                spriteCache[key] = cachedFile.read()
+            
+            return spriteCache[key]
+    
+    spriteCache[key] = cairosvg.svg2png(url = image, parent_width = spaceSize, parent_height = spaceSize)
+    
+    if cachedImage != None:
+        # The disk cache is only a speedup, so a read-only install just rasterizes on every start
+        try:
+            os.makedirs(spriteCacheDirectory, exist_ok = True)
+            
+            with open(cachedImage, "wb") as cachedFile:
+                cachedFile.write(spriteCache[key])
+        except OSError:
+            pass
     
-    return graph.draw_image(data = cairosvg.svg2png(url = image, parent_width = spaceSize,
-                    parent_height = spaceSize), location = position)
+    return spriteCache[key]
+
+def preloadSprites():
+    # Rasterizes every piece and marker up front so no draw call waits for cairosvg
+    for color in ("white", "black"):
+        for pieceName in ("Pawn", "Knight", "Bishop", "Rook", "Queen", "King"):
+            loadSprite(color + pieceName)
+    
+    loadSprite("moveMarker")
+    loadSprite("moveMarkerAlt")
 
 def drawPieceMove(piece, xOffset = 0, yOffset = 0):
     global flipIfAI, graph
@@ -302,10 +152,13 @@ def parsePieceType(pieceName):
     elif pieceName.lower() == "king":
         return 6
     
-def init():
-    global relativePath, boardSize, spaceSize, checkerCount, startingPlayer, flipIfAI, startingMoves, moveMarkers, moveStack
+def init(cachePath = None):
+    global relativePath, boardSize, spaceSize, checkerCount, startingPlayer, flipIfAI, startingMoves, moveMarkers, moveStack, spriteCache, spriteCacheDirectory, ponderEnabled
     
     relativePath = os.path.dirname(os.path.abspath(__file__))
+    spriteCache = {}
+    ponderEnabled = True
+    spriteCacheDirectory = os.path.join(relativePath, "spriteCache")
     
     boardSize = 320
     checkerCount = 8
@@ -317,10 +170,42 @@ def init():
                      chess.Move(chess.D2, chess.D3), chess.Move(chess.G1, chess.F3)]
     moveMarkers = []
     moveStack = []
+    initSearch()
+    
+    # A Polyglot book next to the program is used for the AI's opening moves
+    bookPath = os.path.join(relativePath, "book.bin")
+    
+    if os.path.exists(bookPath):
+        ChessEngine.setOpeningBook(bookPath, maxBookDepth = 16)
+    
+    # So are Syzygy tablebase files in a syzygy folder, for perfect endgame play
+    tablebasePath = os.path.join(relativePath, "syzygy")
+    
+    if os.path.isdir(tablebasePath):
+        ChessEngine.setTablebase(tablebasePath)
+    
+    # Evaluation weights tuned with Tuner.py replace the hand-set ones
+    weightsPath = os.path.join(relativePath, "weights.json")
+    
+    if os.path.exists(weightsPath):
+        ChessEngine.setEvaluationWeights(weightsPath)
+    
+    # With --cache searches are remembered between sessions, so positions seen before are answered at once
+    if cachePath != None:
+        ChessEngine.setSearchCache(cachePath)
+    
+    preloadSprites()
     
     setLayout()
     setBoard(chess.Board())
 
+def openingMove(openingBoard):
+    global startingMoves
+    
+    bookMove = ChessEngine.openingBook.chooseMove(openingBoard) if ChessEngine.openingBook != None else None
+    
+    return bookMove if bookMove != None else random.choice(startingMoves)
+
 def setLayout():
     global boardSize, startingPlayer, flipIfAI, window, graph, table
     
@@ -337,7 +222,9 @@ def setLayout():
         [gui.Button("Reset", key="Reset"), 
          gui.Button("Start As White", key = "White", visible = startingPlayer == "AI"), 
          gui.Button("Start As Black", key = "Black", visible = startingPlayer == "Human"), 
-         gui.Button("Load Game", key = "Load"), gui.Button("Export Game", key = "Export")]
+         gui.Button("Load Game", key = "Load"), gui.Button("Export Game", key = "Export"),
+         gui.Button("Stop", key = "Stop", disabled = True)],
+        [gui.Text("", key = "-THINKING-", size = (50, 1))]
     ]
     
     window = gui.Window('Chess', layout, transparent_color="grey50", finalize=True)
@@ -382,29 +269,143 @@ def setBoard(newBoard):
                         (row + 1) * -spaceSize + 3 + spaceSize))
             
             counter += 1
+def askSearchSettings(defaultDepth):
+    depth = None
+    moveTime = None
+    
+    # Accepts either a fixed depth such as "3" or a time per move such as "5s"
+    while depth == None and moveTime == None:
+        text = gui.popup_get_text("Please enter how deep you want the AI to go,\nor how many seconds it may think per move (for example 5s).",
+                               "Choose AI Depth", str(defaultDepth))
+        
+        if not isinstance(text, str):
+            continue
+        
+        text = text.strip().lower()
+        
+        if text.isdigit() and int(text) >= 0:
+            depth = int(text)
+        elif text.endswith("s"):
+            try:
+                moveTime = float(text[:-1]) if float(text[:-1]) > 0 else None
+            except ValueError:
+                moveTime = None
+                
+    return depth, moveTime
+
+def searchWorker(searchId, searchBoard, depth, moveTime, ponder = False):
+    # Runs on its own thread and hands the move back to the event loop
+    opponentMove = alphaBetaSearch(searchBoard, depth, moveTime, iterative = True, ponder = ponder)
+    
+    window.write_event_value("-SEARCH-DONE-", (searchId, opponentMove))
+
+def reportThinking(info):
+    window.write_event_value("-ITERATION-", info)
+
+def startSearch(depth, moveTime):
+    global board, window, searchThread, currentSearchId, ponderSearchId, ponderedMove, ponderResult
+    
+    window["-THINKING-"].update("Thinking...")
+    window["Stop"].update(disabled = False)
+    
+    # Ponder hit: the search already running, or already finished, is for this position
+    if ponderSearchId != None and ponderedMove == board.peek():
+        currentSearchId = ponderSearchId
+        ponderSearchId = None
+        
+        if ponderResult != None:
+            window.write_event_value("-SEARCH-DONE-", (currentSearchId, ponderResult))
+        else:
+            ChessEngine.ponderHit()
+        
+        return
+    
+    # Ponder miss: what the ponder search found stays in the transposition table
+    cancelSearch()
+    
+    currentSearchId += 1
+    ChessEngine.iterationCallback = reportThinking
+    # Set before the thread starts, so pressing Stop at once reaches the search
+    ChessEngine.prepareSearch(moveTime)
+    searchThread = threading.Thread(target = searchWorker, args = (currentSearchId, board.copy(), depth, moveTime), daemon = True)
+    searchThread.start()
+
+def startPondering(depth, moveTime):
+    # Searches the position after the reply the AI expects while the human thinks
+    global board, window, searchThread, currentSearchId, ponderSearchId, ponderedMove, ponderResult, ponderEnabled
+    
+    if not ponderEnabled or board.is_game_over():
+        return
+    
+    predictedMove = ChessEngine.predictReply(board)
+    
+    if predictedMove == None:
+        return
+    
+    ponderBoard = board.copy()
+    ponderBoard.push(predictedMove)
+    
+    if ponderBoard.is_game_over():
+        return
+    
+    currentSearchId += 1
+    ponderSearchId = currentSearchId
+    ponderedMove = predictedMove
+    ponderResult = None
+    
+    window["-THINKING-"].update("Pondering {}...".format(predictedMove.uci()))
+    
+    ChessEngine.iterationCallback = reportThinking
+    ChessEngine.prepareSearch(moveTime, ponder = True)
+    searchThread = threading.Thread(target = searchWorker, args = (currentSearchId, ponderBoard, depth, moveTime, True), daemon = True)
+    searchThread.start()
+
+def finishSearch():
+    global window, searchThread
+    
+    if searchThread != None:
+        searchThread.join()
+        searchThread = None
+    
+    window["-THINKING-"].update("")
+    window["Stop"].update(disabled = True)
+
+def cancelSearch():
+    # The search returns at its next time check and its result is ignored
+    global searchThread, ponderSearchId, ponderResult
+    
+    if searchThread != None:
+        stopSearch()
+        searchThread.join()
+        searchThread = None
+    
+    ponderSearchId = None
+    ponderResult = None
+
 def mainLoop():
-    global spaceSize, checkerCount, startingPlayer, startingMoves, board, pieceMap, turn, move, moveMarkers, moveStack, window, graph, table
+    global spaceSize, checkerCount, startingPlayer, startingMoves, board, pieceMap, turn, move, moveMarkers, moveStack, window, graph, table, searchThread, currentSearchId, ponderSearchId, ponderResult
     
+    searchThread = None
+    currentSearchId = 0
+    ponderSearchId = None
+    ponderResult = None
     fromSquare = None
     movingPiece = None
     oldPos = None
     defaultDepth = 1
-    depth = None
-    
-    while not isinstance(depth, int):
-        depth = gui.popup_get_text("Please enter how deep you want the AI to go.",
-                               "Choose AI Depth", str(defaultDepth))
-        depth = int(depth) if isinstance(depth, str) and depth.isdigit() and int(depth) >= 0 else None
+    depth, moveTime = askSearchSettings(defaultDepth)
         
     while not board.is_game_over():
         event, values = window.read()
-        print(event, values)
+        logging.debug("event %s values %s", event, values)
         if event in (gui.WIN_CLOSED, 'Exit'):
+            cancelSearch()
             break
         mouse = values['-GRAPH-']
         
     
-        if event == '-GRAPH-':
+        # The board cannot be played on while the AI is thinking, only while it ponders
+        if event == '-GRAPH-' and (searchThread == None or ponderSearchId != None):
             if mouse == (None, None):
                 continue
             
@@ -477,53 +478,7 @@ def mainLoop():
                                 pieceMap = board.piece_map()
                                 
                                 if not board.is_game_over():
-                                    opponentMove = alphaBetaSearch(depth)
-                                    
-                                    xOffset = (opponentMove.to_square % checkerCount - opponentMove.from_square % checkerCount) * spaceSize * flipIfAI
-                                    
-                                    yOffset = ((opponentMove.to_square // checkerCount - opponentMove.from_square // checkerCount)) * spaceSize * flipIfAI
-                                    
-                                    oldPos = ( 
-                                        (opponentMove.from_square % checkerCount) * spaceSize * flipIfAI,
-                                        ((opponentMove.from_square // checkerCount)) * spaceSize * flipIfAI
-                                    )
-                                    
-                                    opponentFromMoveLocation = graph.GetFiguresAtLocation(
-                                        (oldPos[0] + (spaceSize / 2) * flipIfAI,
-                                         oldPos[1] + (spaceSize / 2) * flipIfAI) 
-                                    )
-                                    
-                                    opponentToMoveLocation = graph.GetFiguresAtLocation(
-                                        (oldPos[0] + xOffset + (spaceSize / 2) * flipIfAI,
-                                         oldPos[1] + yOffset + (spaceSize / 2) * flipIfAI) 
-                                    )
-                                    
-                                    if board.is_castling(opponentMove):
-                                        drawCastle(opponentMove)
-                                    elif board.is_en_passant(move):
-                                        figuresAtLocation = graph.GetFiguresAtLocation((newPos[0] + spaceSize / 2 * flipIfAI, newPos[1] + (spaceSize / 2 if startingPlayer == "Human" else spaceSize * 1.5)))
-                                        
-                                        for figure in figuresAtLocation:
-                                            if figure != figuresAtLocation[0] and figure != movingPiece:
-                                                graph.DeleteFigure(figure)
-                                    elif not board.piece_at(opponentMove.to_square) == None:
-                                        for figure in opponentToMoveLocation:
-                                            if figure != opponentToMoveLocation[0] and figure != opponentFromMoveLocation[-1]:
-                                                graph.DeleteFigure(figure)
-                                    
-                                    if opponentMove.promotion != None:
-                                        promotedPiece = chess.Piece(opponentMove.promotion, board.turn)
-                                        
-                                        graph.DeleteFigure(opponentFromMoveLocation)
-                                        drawPiece(promotedPiece, (oldPos[0] + xOffset, oldPos[1] + yOffset))
-                                    else:
-                                        drawPieceMove(opponentFromMoveLocation[-1], xOffset, yOffset)
-                                    
-                                    board.push(opponentMove)
-                                    
-                                    moveStack.append([len(board.move_stack) // 2, move, opponentMove])
-                                    table.update(moveStack)
-                                    table.set_vscroll_position(1)
+                                    startSearch(depth, moveTime)
                         else:
                             for marker in moveMarkers:
                                 graph.DeleteFigure(marker)
@@ -546,6 +501,79 @@ def mainLoop():
                     
                     fromSquare = None
                     
+        if event == "-SEARCH-DONE-":
+            searchId, opponentMove = values[event]
+            
+            # A ponder search that finished before the human moved keeps its move for a ponder hit
+            if searchId == ponderSearchId:
+                searchThread.join()
+                searchThread = None
+                ponderResult = opponentMove
+                continue
+            
+            # A search started before a reset or load has nothing to do with this board
+            if searchId != currentSearchId:
+                continue
+            
+            finishSearch()
+            
+            xOffset = (opponentMove.to_square % checkerCount - opponentMove.from_square % checkerCount) * spaceSize * flipIfAI
+            
+            yOffset = ((opponentMove.to_square // checkerCount - opponentMove.from_square // checkerCount)) * spaceSize * flipIfAI
+            
+            oldPos = ( 
+                (opponentMove.from_square % checkerCount) * spaceSize * flipIfAI,
+                ((opponentMove.from_square // checkerCount)) * spaceSize * flipIfAI
+            )
+            
+            opponentFromMoveLocation = graph.GetFiguresAtLocation(
+                (oldPos[0] + (spaceSize / 2) * flipIfAI,
+                 oldPos[1] + (spaceSize / 2) * flipIfAI) 
+            )
+            
+            opponentToMoveLocation = graph.GetFiguresAtLocation(
+                (oldPos[0] + xOffset + (spaceSize / 2) * flipIfAI,
+                 oldPos[1] + yOffset + (spaceSize / 2) * flipIfAI) 
+            )
+            
+            if board.is_castling(opponentMove):
+                drawCastle(opponentMove)
+            elif board.is_en_passant(move):
+                figuresAtLocation = graph.GetFiguresAtLocation((newPos[0] + spaceSize / 2 * flipIfAI, newPos[1] + (spaceSize / 2 if startingPlayer == "Human" else spaceSize * 1.5)))
+                
+                for figure in figuresAtLocation:
+                    if figure != figuresAtLocation[0] and figure != movingPiece:
+                        graph.DeleteFigure(figure)
+            elif not board.piece_at(opponentMove.to_square) == None:
+                for figure in opponentToMoveLocation:
+                    if figure != opponentToMoveLocation[0] and figure != opponentFromMoveLocation[-1]:
+                        graph.DeleteFigure(figure)
+            
+            if opponentMove.promotion != None:
+                promotedPiece = chess.Piece(opponentMove.promotion, board.turn)
+                
+                graph.DeleteFigure(opponentFromMoveLocation)
+                drawPiece(promotedPiece, (oldPos[0] + xOffset, oldPos[1] + yOffset))
+            else:
+                drawPieceMove(opponentFromMoveLocation[-1], xOffset, yOffset)
+            
+            board.push(opponentMove)
+            
+            moveStack.append([len(board.move_stack) // 2, move, opponentMove])
+            table.update(moveStack)
+            table.set_vscroll_position(1)
+            
+            startPondering(depth, moveTime)
+        
+        if event == "-ITERATION-":
+            info = values[event]
+            status = "Pondering {}...".format(ponderedMove.uci()) if ponderSearchId != None else "Thinking..."
+            window["-THINKING-"].update("{} depth {} nodes {} best {}".format(status, info["depth"], info["nodes"], 
+                                        info["pv"][0].uci() if len(info["pv"]) > 0 else ""))
+        
+        if event == "Stop":
+            stopSearch()
+        
         if board.is_game_over() or event == "Reset" or event == "White" or event == "Black":
             if board.is_checkmate():
                 gui.popup_ok("Checkmate!\n{} wins the game!".format("White" if not board.turn else "Black"))
@@ -559,9 +587,10 @@ def mainLoop():
                 gui.popup_ok("It's a draw!\n{} has no more legal moves, resulting in a stalemate!".format("White" if board.turn else "Black"))
             
             
+            cancelSearch()
             newBoard = chess.Board()
             if event == "Black" or (startingPlayer == "AI" and (event == "Reset" or board.is_game_over())):
-                newBoard.push(random.choice(startingMoves))
+                newBoard.push(openingMove(newBoard))
                 startingPlayer = "AI"
                 
             else:
@@ -577,18 +606,14 @@ def mainLoop():
             fromSquare = None
             movingPiece = None
             oldPos = None
-            depth = None
-            
-            while not isinstance(depth, int):
-                depth = gui.popup_get_text("Please enter how deep you want the AI to go.",
-                                       "Choose AI Depth", str(defaultDepth))
-                depth = int(depth) if isinstance(depth, str) and depth.isdigit() and int(depth) >= 0 else None
+            depth, moveTime = askSearchSettings(defaultDepth)
         
             
         if event == "Load":
             newBoard = chess.Board(gui.popup_get_text("Please enter a chess position matching the FEN standard.", "Load Game"))
             
             if newBoard != None:
+                cancelSearch()
                 startingPlayer = "Human" if newBoard.turn else "AI"
                 
                 moveStack = []
@@ -604,6 +629,13 @@ def mainLoop():
         if event == gui.WINDOW_CLOSED:
             break    
                   
-init()        
-mainLoop()
-window.close()
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Play chess against the AI.")
+    parser.add_argument("--cache", nargs = "?", const = os.path.join(os.path.dirname(os.path.abspath(__file__)), "searchCache.sqlite"),
+                        default = None, help = "SQLite file that keeps searches between sessions (default file: searchCache.sqlite next to the program)")
+    arguments = parser.parse_args()
+    
+    logging.basicConfig(level = os.environ.get("CHESS_LOG_LEVEL", "INFO"), format = "%(name)s: %(message)s")
+    init(arguments.cache)        
+    mainLoop()
+    window.close()
\ No newline at end of file
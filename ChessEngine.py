@@ -0,0 +1,1609 @@
+# -*- coding: utf-8 -*-
+"""
+Search and evaluation for the chess AI.
+
+Nothing in here imports the GUI, so the engine can be used on its own by the
+UCI front end, worker processes and scripts. Importing the module sets up the
+search with a 16 MB transposition table, so alphaBetaSearch() can be called at
+once; initSearch() starts over with another table size:
+
+    import chess, ChessEngine
+    move = ChessEngine.alphaBetaSearch(chess.Board(), depth = 3)
+"""
+
+import os
+import chess
+import math
+import time
+import gc
+import sys
+import logging
+import tracemalloc
+import multiprocessing
+from multiprocessing import shared_memory
+from array import array
+from Bitboard import Position, scanReversed, popcount, squareMasks, fileMasks, rankMasks, ALL, NULL_MOVE, PAWN, ROOK, KING
+from EvaluationWeights import defaultWeights, loadWeights, weightsKey, pieceNames, phaseValues, totalPhase
+from Instrumentation import Instrumentation
+from OpeningBook import OpeningBook
+from SearchCache import SearchCache
+from Tablebase import Tablebase
+from TranspositionTable import TranspositionTable, tableBytes, zobristHash, encodeMove, decodeMove, EXACT, LOWER, UPPER, NO_MOVE
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+checkerCount = 8
+maxPly = 128
+# Pawns added to a capture's value before delta pruning gives up on it
+deltaMargin = 2
+
+# Score of a tablebase win in pawns, beyond anything the evaluation can reach
+tablebaseWin = 1000
+
+# Selective search, switched with setSelectiveSearch(). Reductions are an even number
+# of plies: the evaluation swings with the side to move, so a reduced line has to reach
+# its horizon with the same side to move as the full-depth line would.
+nullMovePruning = True
+nullMoveReduction = 2
+lateMoveReductions = True
+lateMoveReduction = 2
+# Moves searched at full depth before the quiet moves that follow are reduced
+fullDepthMoves = 3
+# Width in pawns of the windows used to test a null move or a reduced move against a bound
+nullWindow = 0.01
+
+# Raised whenever a change to the search or the evaluation makes cached results of older versions wrong
+engineVersion = 3
+
+# Set with setEvaluationWeights()
+evaluationWeights = defaultWeights()
+
+# Searches reuse the table entries, killer moves and history scores of the searches before them when the
+# game went on from the last searched position; set with setSearchReuse()
+searchReuse = True
+keptSearches = 2
+lastSearchBoard = None
+
+# Set with setOpeningBook(), setTablebase(), setSearchCache() and setInstrumentation() and kept when the search is reinitialised
+openingBook = None
+tablebase = None
+searchCache = None
+instrumentation = None
+lastSearchReport = None
+
+# Search reports go to this logger at INFO level, each iteration at DEBUG level
+logger = logging.getLogger("ChessEngine")
+
+class SearchTimeout(Exception):
+    pass
+
+class NodeStack:
+    # Moves of every position on the current search path, kept in preallocated
+    # typed arrays: moves as 16-bit integers and their ordering scores as float32.
+    # A position's moves are the index span [start, end) and the span is
+    # released as soon as that position has been searched.
+    
+    def __init__(self, capacity = 16384):
+        self.moves = array("H", bytes(2 * capacity))
+        self.scores = array("f", bytes(4 * capacity))
+        self.top = 0
+        self.iterations = 0
+    
+    def append(self, move, score):
+        if self.top == len(self.moves):
+            self.moves.extend(array("H", bytes(2 * len(self.moves))))
+            self.scores.extend(array("f", bytes(4 * len(self.scores))))
+            
+        self.moves[self.top] = move
+        self.scores[self.top] = score
+        self.top += 1
+    
+    def release(self, start):
+        self.top = start
+    
+    def sortSpan(self, start, end, descending):
+        order = sorted(range(start, end), key = self.scores.__getitem__, reverse = descending)
+        moves = [self.moves[i] for i in order]
+        scores = [self.scores[i] for i in order]
+        
+        self.moves[start:end] = array("H", moves)
+        self.scores[start:end] = array("f", scores)
+
+def evaluate(FENPosition):
+    global checkerCount
+    
+    board = chess.Board(FENPosition)
+    pieceMap = board.piece_map()
+    
+    if not board.turn: 
+        opponentLegalMoves = list(board.copy().legal_moves)
+        board.push(chess.Move.null())
+        legalMoves = list(board.copy().legal_moves)
+        board.push(chess.Move.null())
+    else:
+        legalMoves = list(board.copy().legal_moves)
+        board.push(chess.Move.null())
+        opponentLegalMoves = list(board.copy().legal_moves)
+        board.push(chess.Move.null())
+        
+    pawnList = []
+    opponentPawnList = []
+    
+    for c in range(checkerCount):
+        pawnList.append([])
+        opponentPawnList.append([])
+     
+    weights = IncrementalEvaluator
+    evaluation = weights.pieceValues[6] * (len(board.pieces(6, True)) - len(board.pieces(6, False)))
+    
+    for pieceType in range(1, 6):
+        evaluation += weights.pieceValues[pieceType] * (len(board.pieces(pieceType, True)) - len(board.pieces(pieceType, False)))
+    
+    evaluation += pieceSquareScore(pieceMap)
+    
+    for p in pieceMap:
+        if pieceMap[p].piece_type == 1:
+            if pieceMap[p].color:
+                pawnList[p % checkerCount].append(p)
+            else:
+                opponentPawnList[p % checkerCount].append(p)
+            
+    for rank in pawnList:
+        index = pawnList.index(rank)
+        
+        if len(rank) > 0:
+            # Checks for doubled pawns
+            if len(rank) > 1:
+                evaluation -= weights.doubledPawn
+            
+            # Checks for isolated pawns
+            if 0 < index + 1 < checkerCount and len(pawnList[index - 1]) == 0 and len(pawnList[index + 1]) == 0:
+                evaluation -= weights.isolatedPawn
+            
+            # Checks for blocked pawns
+            if board.piece_at(rank[-1] + (checkerCount)) != None:
+                evaluation -= weights.blockedPawn
+            
+    for rank in opponentPawnList:
+        index = opponentPawnList.index(rank)
+        
+        if len(rank) > 0:
+            # Checks for doubled pawns
+            if len(rank) > 1:
+                evaluation += weights.doubledPawn
+            
+            # Checks for isolated pawns
+            if 0 < index + 1 < checkerCount and len(opponentPawnList[index - 1]) == 0 and len(opponentPawnList[index + 1]) == 0:
+                evaluation += weights.isolatedPawn
+            
+            if board.piece_at(rank[-1] - checkerCount) != None:
+                evaluation += weights.blockedPawn
+    
+    attacks = 0
+    opponentAttacks = 0
+    
+    for move in legalMoves:
+        if board.is_capture(move) > 0:
+            attacks += 1
+            
+    for opponentMove in opponentLegalMoves:
+        if board.is_capture(opponentMove):
+            opponentAttacks += 1
+    
+    
+    evaluation += weights.captureWeight * (attacks - opponentAttacks)
+    evaluation += weights.mobilityWeight * (len(legalMoves) - len(opponentLegalMoves))
+       
+    return evaluation
+
+def pieceSquareTables(weights, stage):
+    # Values by [color][piece type][square] from White's side: Black reads the tables mirrored and negated
+    tables = [[None] * 7, [None] * 7]
+    
+    for pieceType, name in enumerate(pieceNames, 1):
+        values = weights["pieceSquare"][stage][name]
+        tables[chess.WHITE][pieceType] = list(values)
+        tables[chess.BLACK][pieceType] = [-values[square ^ 56] for square in range(64)]
+    
+    return tables
+
+def taper(midgame, endgame, phase):
+    # Blends the midgame and endgame scores by the material left on the board
+    phase = min(phase, totalPhase)
+    
+    return (midgame * phase + endgame * (totalPhase - phase)) / totalPhase
+
+def pieceSquareScore(pieceMap):
+    midgame = 0
+    endgame = 0
+    phase = 0
+    
+    for square, piece in pieceMap.items():
+        midgame += IncrementalEvaluator.midgameTables[piece.color][piece.piece_type][square]
+        endgame += IncrementalEvaluator.endgameTables[piece.color][piece.piece_type][square]
+        phase += phaseValues[piece.piece_type]
+    
+    return taper(midgame, endgame, phase)
+
+class IncrementalEvaluator:
+    # Produces the same score as evaluate() for the position it wraps. Moves are
+    # made and unmade through push() and pop() so material, piece-square sums and
+    # pawn files are updated from the move instead of being recounted from a FEN string.
+    # The weights are class attributes set by setEvaluationWeights().
+    pieceValues = [0, 1, 3, 3.5, 5, 9, 200]
+    doubledPawn = 0.5
+    isolatedPawn = 0.5
+    blockedPawn = 0.5
+    captureWeight = 0.5
+    mobilityWeight = 0.1
+    midgameTables = pieceSquareTables(defaultWeights(), "midgame")
+    endgameTables = pieceSquareTables(defaultWeights(), "endgame")
+    
+    def __init__(self, position):
+        self.position = position
+        self.material = 0
+        self.midgame = 0
+        self.endgame = 0
+        self.phase = 0
+        self.pawnFiles = [[0] * 8, [0] * 8]
+        self.history = []
+        
+        for square in scanReversed(position.occupied):
+            pieceType = position.pieceTypes[square]
+            color = position.colorAt(square)
+            self.material += self.pieceValues[pieceType] * (1 if color else -1)
+            self.midgame += self.midgameTables[color][pieceType][square]
+            self.endgame += self.endgameTables[color][pieceType][square]
+            self.phase += phaseValues[pieceType]
+            
+            if pieceType == PAWN:
+                self.pawnFiles[color][square & 7] += 1
+    
+    def push(self, move):
+        position = self.position
+        
+        # A null move only passes the turn
+        if move == NULL_MOVE:
+            self.history.append((self.material, self.midgame, self.endgame, self.phase, []))
+            position.push(move)
+            return
+        
+        color = position.turn
+        sign = 1 if color else -1
+        changes = []
+        oldState = (self.material, self.midgame, self.endgame, self.phase)
+        fromSquare = move & 63
+        toSquare = (move >> 6) & 63
+        promotion = move >> 12
+        movingType = position.pieceTypes[fromSquare]
+        placedType = promotion or movingType
+        midgameTables = self.midgameTables[color]
+        endgameTables = self.endgameTables[color]
+        
+        self.midgame += midgameTables[placedType][toSquare] - midgameTables[movingType][fromSquare]
+        self.endgame += endgameTables[placedType][toSquare] - endgameTables[movingType][fromSquare]
+        self.phase += phaseValues[placedType] - phaseValues[movingType]
+        
+        # Castling also moves the rook
+        if movingType == KING and abs(toSquare - fromSquare) == 2:
+            rookFrom, rookTo = (fromSquare + 3, fromSquare + 1) if toSquare > fromSquare else (fromSquare - 4, fromSquare - 1)
+            self.midgame += midgameTables[ROOK][rookTo] - midgameTables[ROOK][rookFrom]
+            self.endgame += endgameTables[ROOK][rookTo] - endgameTables[ROOK][rookFrom]
+        
+        if position.isEnPassant(move):
+            capturedSquare = toSquare + (-8 if color else 8)
+        else:
+            capturedSquare = toSquare
+            
+        capturedType = position.pieceTypes[capturedSquare]
+        
+        if capturedType:
+            self.material += self.pieceValues[capturedType] * sign
+            self.midgame -= self.midgameTables[not color][capturedType][capturedSquare]
+            self.endgame -= self.endgameTables[not color][capturedType][capturedSquare]
+            self.phase -= phaseValues[capturedType]
+            
+            if capturedType == PAWN:
+                changes.append((not color, capturedSquare & 7, -1))
+        
+        if movingType == PAWN:
+            changes.append((color, fromSquare & 7, -1))
+            
+            if promotion:
+                self.material += (self.pieceValues[promotion] - self.pieceValues[PAWN]) * sign
+            else:
+                changes.append((color, toSquare & 7, 1))
+        
+        for changedColor, file, delta in changes:
+            self.pawnFiles[changedColor][file] += delta
+        
+        self.history.append(oldState + (changes,))
+        position.push(move)
+    
+    def pop(self):
+        self.position.pop()
+        self.material, self.midgame, self.endgame, self.phase, changes = self.history.pop()
+        
+        for changedColor, file, delta in changes:
+            self.pawnFiles[changedColor][file] -= delta
+    
+    def evaluate(self, turn = None):
+        # Scores the position as if turn were to move, which keeps the quiescence
+        # search comparing positions evaluated for the same side
+        position = self.position
+        evaluation = self.material + taper(self.midgame, self.endgame, self.phase)
+        
+        for color, direction in ((chess.WHITE, 1), (chess.BLACK, -1)):
+            pawnFiles = self.pawnFiles[color]
+            pawns = position.pieces[PAWN] & position.colors[color]
+            
+            for file in range(8):
+                if pawnFiles[file] > 0:
+                    # Checks for doubled pawns
+                    if pawnFiles[file] > 1:
+                        evaluation -= self.doubledPawn * direction
+                    
+                    # Checks for isolated pawns, looking at the h-file for the a-file like evaluate() does
+                    if file < 7 and pawnFiles[file - 1] == 0 and pawnFiles[file + 1] == 0:
+                        evaluation -= self.isolatedPawn * direction
+                    
+                    # Checks for blocked pawns in front of the lowest pawn on the file
+                    filePawns = pawns & fileMasks[file]
+                    
+                    if position.occupied & squareMasks[(filePawns & -filePawns).bit_length() - 1 + 8 * direction]:
+                        evaluation -= self.blockedPawn * direction
+        
+        # evaluate() generates the other side's moves after a null move and then tests
+        # every move with board.is_capture(), which counts all of the other side's moves
+        # and only the side to move's ordinary captures. A side that is made to move
+        # loses the en passant square, as after a null move.
+        if turn == None or turn == position.turn:
+            turn = position.turn
+            moves, captures = position.legalMoveCounts(turn, position.epSquare)
+        else:
+            moves, captures = position.legalMoveCounts(turn, None)
+        
+        opponentMoves = position.legalMoveCounts(not turn, None)[0]
+        
+        if turn:
+            evaluation += self.captureWeight * (captures - opponentMoves)
+            evaluation += self.mobilityWeight * (moves - opponentMoves)
+        else:
+            evaluation += self.captureWeight * (opponentMoves - captures)
+            evaluation += self.mobilityWeight * (opponentMoves - moves)
+        
+        return evaluation
+
+def captureValue(position, move):
+    # Material won by the move itself, counting a promotion as the pawn it replaces
+    victim = PAWN if position.isEnPassant(move) else position.pieceTypes[(move >> 6) & 63]
+    value = IncrementalEvaluator.pieceValues[victim]
+    
+    if move >> 12:
+        value += IncrementalEvaluator.pieceValues[move >> 12] - 1
+    
+    return value
+
+def mvvLvaScore(position, move):
+    # Most valuable victim first, then least valuable attacker
+    return 10 * captureValue(position, move) - IncrementalEvaluator.pieceValues[position.pieceTypes[move & 63]]
+
+def staticExchange(position, move):
+    # Material the side to move wins or loses when both sides keep recapturing on
+    # the target square with their least valuable piece and may stop at any point
+    pieceValues = IncrementalEvaluator.pieceValues
+    target = (move >> 6) & 63
+    occupied = position.occupied ^ squareMasks[move & 63]
+    
+    if position.isEnPassant(move):
+        occupied ^= squareMasks[target + (-8 if position.turn else 8)]
+    
+    gains = [captureValue(position, move)]
+    pieceOnTarget = pieceValues[(move >> 12) or position.pieceTypes[move & 63]]
+    side = not position.turn
+    
+    while True:
+        attackers = position.attackersMask(side, target, occupied) & occupied
+        
+        if not attackers:
+            break
+        
+        for pieceType in chess.PIECE_TYPES:
+            candidates = attackers & position.pieces[pieceType] & position.colors[side]
+            
+            if candidates:
+                break
+        
+        gains.append(pieceOnTarget - gains[-1])
+        occupied ^= candidates & -candidates
+        pieceOnTarget = pieceValues[pieceType]
+        side = not side
+    
+    while len(gains) > 1:
+        last = gains.pop()
+        gains[-1] = -max(-gains[-1], last)
+    
+    return gains[0]
+
+def tacticalMoves(position):
+    # Captures and promotions, the only moves the quiescence search looks at
+    promotionSquares = rankMasks[6] if position.turn else rankMasks[1]
+    moves = position.generateCaptures()
+    moves += position.generateMoves(position.pieces[PAWN] & position.colors[position.turn] & promotionSquares, ALL & ~position.occupied)
+    
+    return moves
+
+def orderedMoves(position, hashMove, pvMove, ply):
+    # Yields the legal moves as 16-bit ints in search order, generating each stage only
+    # when the previous one did not cut off: principal variation and hash move, captures
+    # and promotions by MVV-LVA, killer moves, then quiet moves by history score.
+    # The caller releases the node stack back to where it was once it stops iterating.
+    global nodeStack, killerMoves, historyTable, phaseTimes
+    
+    start = nodeStack.top
+    yielded = set()
+    
+    for encodedMove in (pvMove, hashMove):
+        if encodedMove != NO_MOVE and encodedMove not in yielded and position.isLegal(encodedMove):
+            yielded.add(encodedMove)
+            yield encodedMove
+    
+    generationStart = time.perf_counter()
+    
+    for move in tacticalMoves(position):
+        nodeStack.append(move, mvvLvaScore(position, move))
+    
+    end = nodeStack.top
+    sortStart = time.perf_counter()
+    nodeStack.sortSpan(start, end, True)
+    phaseTimes["moveGeneration"] += sortStart - generationStart
+    phaseTimes["sorting"] += time.perf_counter() - sortStart
+    
+    for index in range(start, end):
+        encodedMove = nodeStack.moves[index]
+        
+        if encodedMove not in yielded:
+            yielded.add(encodedMove)
+            yield encodedMove
+    
+    nodeStack.release(start)
+    
+    for encodedMove in killerMoves[ply]:
+        if encodedMove != NO_MOVE and encodedMove not in yielded:
+            if position.isLegal(encodedMove) and not position.isCapture(encodedMove):
+                yielded.add(encodedMove)
+                yield encodedMove
+    
+    # The low 12 bits of a move are its from and to squares
+    historyOffset = 4096 if position.turn else 0
+    generationStart = time.perf_counter()
+    
+    for encodedMove in position.generateMoves(ALL, ALL & ~position.colors[not position.turn]):
+        if encodedMove not in yielded:
+            nodeStack.append(encodedMove, historyTable[historyOffset + (encodedMove & 4095)])
+    
+    end = nodeStack.top
+    sortStart = time.perf_counter()
+    nodeStack.sortSpan(start, end, True)
+    phaseTimes["moveGeneration"] += sortStart - generationStart
+    phaseTimes["sorting"] += time.perf_counter() - sortStart
+    
+    for index in range(start, end):
+        yield nodeStack.moves[index]
+    
+    nodeStack.release(start)
+
+def recordCutoff(position, encodedMove, depthLeft, ply, moveCount):
+    global killerMoves, historyTable, searchStats
+    
+    searchStats["cutoffs"] += 1
+    
+    if moveCount == 1:
+        searchStats["firstMoveCutoffs"] += 1
+    
+    # Quiet moves that cut off become killers for this ply and gain history
+    if not position.isCapture(encodedMove) and not encodedMove >> 12:
+        if killerMoves[ply][0] != encodedMove:
+            killerMoves[ply][1] = killerMoves[ply][0]
+            killerMoves[ply][0] = encodedMove
+        
+        historyTable[(4096 if position.turn else 0) + (encodedMove & 4095)] += depthLeft * depthLeft
+
+def canPassMove(position, depthLeft, ply):
+    # Null-move pruning assumes passing is never the best move, which fails in zugzwang,
+    # so it is left out in check, after another null move and with only king and pawns
+    if not nullMovePruning or ply == 0 or depthLeft <= nullMoveReduction or position.isCheck():
+        return False
+    
+    if position.lastMoveWasNull():
+        return False
+    
+    return bool(position.colors[position.turn] & ~(position.pieces[PAWN] | position.pieces[KING]))
+
+def canReduceMove(position, move, depthLeft, ply, moveCount, inCheck):
+    # Quiet moves ordered after the first few are unlikely to be best and are searched shallower first
+    if not lateMoveReductions or ply == 0 or inCheck or moveCount <= fullDepthMoves or depthLeft <= lateMoveReduction:
+        return False
+    
+    return not position.isCapture(move) and not move >> 12 and not position.givesCheck(move)
+
+def resetMoveOrdering():
+    # Killer moves and history scores only describe the position being searched
+    global killerMoves, historyTable
+    
+    killerMoves = [[NO_MOVE, NO_MOVE] for ply in range(maxPly)]
+    historyTable = array("I", bytes(4 * 2 * 64 * 64))
+
+def pliesBetween(earlierBoard, board):
+    # Plies from earlierBoard to board when board is at most two plies further on, otherwise None
+    key = zobristHash(board)
+    position = Position(earlierBoard)
+    
+    if position.zobristKey() == key:
+        return 0
+    
+    for move in position.generateMoves():
+        position.push(move)
+        
+        if position.zobristKey() == key:
+            return 1
+        
+        for reply in position.generateMoves():
+            position.push(reply)
+            found = position.zobristKey() == key
+            position.pop()
+            
+            if found:
+                return 2
+        
+        position.pop()
+    
+    return None
+
+def carryMoveOrdering(board):
+    # After the game went on from the last searched position the killer moves move up by the plies
+    # played and the history scores are halved; any other position starts from scratch
+    global killerMoves, historyTable, lastSearchBoard
+    
+    plies = pliesBetween(lastSearchBoard, board) if searchReuse and lastSearchBoard != None else None
+    lastSearchBoard = board.copy(stack = False)
+    
+    if plies == None:
+        resetMoveOrdering()
+        return
+    
+    killerMoves = killerMoves[plies:] + [[NO_MOVE, NO_MOVE] for ply in range(plies)]
+    historyTable = array("I", (score >> 1 for score in historyTable))
+
+def retainedIteration(board):
+    # The exact result an earlier search left in the table for this position, as a completed iteration
+    global transpositionTable, rootMoveFilter
+    
+    if not searchReuse or rootMoveFilter != None:
+        return None
+    
+    entry = transpositionTable.probe(zobristHash(board))
+    
+    if entry == None:
+        return None
+    
+    entryDepth, bound, score, move = entry
+    
+    if bound != EXACT or entryDepth < 1 or move == NO_MOVE or not board.is_legal(decodeMove(move)):
+        return None
+    
+    return entryDepth, score, move
+
+def resetSearchStatistics():
+    global searchStats, phaseTimes, iterationNodes
+    
+    searchStats = {"evaluations": 0, "quiescenceNodes": 0, "cutoffs": 0, "firstMoveCutoffs": 0, "nullMoveCutoffs": 0, 
+                   "reducedMoves": 0, "researches": 0, "maxPly": 0}
+    phaseTimes = {"moveGeneration": 0.0, "evaluation": 0.0, "sorting": 0.0}
+    iterationNodes = []
+
+def cutoffRate():
+    # Share of beta cutoffs produced by the first move searched, a measure of move ordering quality
+    global searchStats
+    
+    return searchStats["firstMoveCutoffs"] / searchStats["cutoffs"] if searchStats["cutoffs"] > 0 else 0.0
+
+def tablebaseScore(wdl, turn, ply):
+    # Cursed wins and blessed losses are draws under the fifty move rule; nearer wins score higher
+    if wdl == 2:
+        score = tablebaseWin - ply
+    elif wdl == -2:
+        score = -tablebaseWin + ply
+    else:
+        score = 0
+    
+    return score if turn else -score
+
+def probeTransposition(key, depthLeft, alpha, beta, ply):
+    global transpositionTable
+    
+    entry = transpositionTable.probe(key)
+    
+    if entry == None:
+        return None, NO_MOVE
+    
+    depth, bound, score, move = entry
+    
+    # The root always has to be searched so that a move can be returned. The evaluation swings with the
+    # side to move, so only scores whose horizon falls on the same side as this search's are used
+    if depth >= depthLeft and (depth - depthLeft) % 2 == 0 and ply > 0:
+        if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+            return score, move
+    
+    return None, move
+
+def checkSearchTime():
+    global searchDeadline, stopSignal, searchStopped
+    
+    if searchDeadline != None and time.monotonic() >= searchDeadline:
+        raise SearchTimeout()
+    
+    if searchStopped:
+        raise SearchTimeout()
+    
+    # Set by the parallel search once its result is known
+    if stopSignal != None and stopSignal[0]:
+        raise SearchTimeout()
+
+def storeTransposition(key, depthLeft, bound, score, bestMove, ply):
+    global transpositionTable, rootMoveFilter
+    
+    # A root searched over only some of its moves says nothing about the position
+    if math.isinf(score) or (ply == 0 and rootMoveFilter != None):
+        return
+    
+    transpositionTable.store(key, depthLeft, bound, score, bestMove, popcount(searchEvaluator.position.occupied))
+
+def alphaBetaMax(depthLeft, alpha, beta, ply = 0):
+    global searchEvaluator, nodeStack, principalVariation, rootBestMove, rootMoveFilter, tablebase, searchStats
+    
+    position = searchEvaluator.position
+    
+    if depthLeft == 0:
+        return quiesceMax(alpha, beta, ply, position.turn)
+    
+    key = position.zobristKey()
+    cutoffScore, hashMove = probeTransposition(key, depthLeft, alpha, beta, ply)
+    
+    if cutoffScore != None:
+        return cutoffScore
+    
+    # The tables know the result, so nothing below this position needs searching
+    if tablebase != None and ply > 0 and popcount(position.occupied) <= tablebase.maxPieces and not position.castling:
+        wdl = tablebase.probeWDL(position.toBoard())
+        
+        if wdl != None:
+            return tablebaseScore(wdl, position.turn, ply)
+    
+    checkSearchTime()
+    
+    # If passing still fails high the opponent cannot stop a real move from doing so either
+    if not math.isinf(beta) and canPassMove(position, depthLeft, ply):
+        searchEvaluator.push(NULL_MOVE)
+        score = alphaBetaMin(depthLeft - 1 - nullMoveReduction, beta - nullWindow, beta, ply + 1)
+        searchEvaluator.pop()
+        
+        if score >= beta:
+            searchStats["nullMoveCutoffs"] += 1
+            storeTransposition(key, depthLeft, LOWER, beta, NO_MOVE, ply)
+            return beta
+    
+    start = nodeStack.top
+    bestMove = NO_MOVE
+    moveCount = 0
+    inCheck = position.isCheck()
+    
+    for move in orderedMoves(position, hashMove, principalVariation.get(key, NO_MOVE), ply):
+        if ply == 0 and rootMoveFilter != None and move not in rootMoveFilter:
+            continue
+        
+        moveCount += 1
+        nodeStack.iterations += 1
+        reduce = not math.isinf(alpha) and canReduceMove(position, move, depthLeft, ply, moveCount, inCheck)
+        
+        searchEvaluator.push(move)
+        
+        if reduce:
+            searchStats["reducedMoves"] += 1
+            score = alphaBetaMin(depthLeft - 1 - lateMoveReduction, alpha, alpha + nullWindow, ply + 1)
+        
+        # A reduced move that beats alpha is searched again at full depth
+        if not reduce or score > alpha:
+            if reduce:
+                searchStats["researches"] += 1
+            
+            score = alphaBetaMin(depthLeft - 1, alpha, beta, ply + 1)
+        
+        searchEvaluator.pop()
+        
+        if score >= beta:
+            if ply == 0:
+                rootBestMove = move
+            
+            recordCutoff(position, move, depthLeft, ply, moveCount)
+            nodeStack.release(start)
+            storeTransposition(key, depthLeft, LOWER, score, move, ply)
+            return score
+           
+        if score > alpha:
+            alpha = score
+            bestMove = move
+            
+            if ply == 0:
+                rootBestMove = move
+    
+    nodeStack.release(start)
+    
+    if moveCount == 0:
+        searchStats["evaluations"] += 1
+        return searchEvaluator.evaluate()
+    
+    storeTransposition(key, depthLeft, EXACT if bestMove != NO_MOVE else UPPER, alpha, bestMove, ply)
+   
+    return alpha
+
+def alphaBetaMin(depthLeft, alpha, beta, ply = 0):
+    global searchEvaluator, nodeStack, principalVariation, rootBestMove, rootMoveFilter, tablebase, searchStats
+    
+    position = searchEvaluator.position
+    
+    if depthLeft == 0:
+        return quiesceMin(alpha, beta, ply, position.turn)
+    
+    key = position.zobristKey()
+    cutoffScore, hashMove = probeTransposition(key, depthLeft, alpha, beta, ply)
+    
+    if cutoffScore != None:
+        return cutoffScore
+    
+    # The tables know the result, so nothing below this position needs searching
+    if tablebase != None and ply > 0 and popcount(position.occupied) <= tablebase.maxPieces and not position.castling:
+        wdl = tablebase.probeWDL(position.toBoard())
+        
+        if wdl != None:
+            return tablebaseScore(wdl, position.turn, ply)
+    
+    checkSearchTime()
+    
+    # If passing still fails low the opponent cannot stop a real move from doing so either
+    if not math.isinf(alpha) and canPassMove(position, depthLeft, ply):
+        searchEvaluator.push(NULL_MOVE)
+        score = alphaBetaMax(depthLeft - 1 - nullMoveReduction, alpha, alpha + nullWindow, ply + 1)
+        searchEvaluator.pop()
+        
+        if score <= alpha:
+            searchStats["nullMoveCutoffs"] += 1
+            storeTransposition(key, depthLeft, UPPER, alpha, NO_MOVE, ply)
+            return alpha
+    
+    start = nodeStack.top
+    bestMove = NO_MOVE
+    moveCount = 0
+    inCheck = position.isCheck()
+    
+    for move in orderedMoves(position, hashMove, principalVariation.get(key, NO_MOVE), ply):
+        if ply == 0 and rootMoveFilter != None and move not in rootMoveFilter:
+            continue
+        
+        moveCount += 1
+        nodeStack.iterations += 1
+        reduce = not math.isinf(beta) and canReduceMove(position, move, depthLeft, ply, moveCount, inCheck)
+        
+        searchEvaluator.push(move)
+        
+        if reduce:
+            searchStats["reducedMoves"] += 1
+            score = alphaBetaMax(depthLeft - 1 - lateMoveReduction, beta - nullWindow, beta, ply + 1)
+        
+        # A reduced move that beats beta is searched again at full depth
+        if not reduce or score < beta:
+            if reduce:
+                searchStats["researches"] += 1
+            
+            score = alphaBetaMax(depthLeft - 1, alpha, beta, ply + 1)
+        
+        searchEvaluator.pop()
+        
+        if score <= alpha:
+            if ply == 0:
+                rootBestMove = move
+            
+            recordCutoff(position, move, depthLeft, ply, moveCount)
+            nodeStack.release(start)
+            storeTransposition(key, depthLeft, UPPER, score, move, ply)
+            return score
+           
+        if score < beta:
+            beta = score
+            bestMove = move
+            
+            if ply == 0:
+                rootBestMove = move
+    
+    nodeStack.release(start)
+    
+    if moveCount == 0:
+        searchStats["evaluations"] += 1
+        return searchEvaluator.evaluate()
+    
+    storeTransposition(key, depthLeft, EXACT if bestMove != NO_MOVE else LOWER, beta, bestMove, ply)
+   
+    return beta
+
+def quiesceMax(alpha, beta, ply, horizonTurn):
+    # Searches captures and promotions past the horizon until the position is quiet.
+    # Every position is scored for the side to move at the horizon, like the leaves
+    # of the main search, and the side to move may stand pat on that score.
+    global searchEvaluator, nodeStack, searchStats, phaseTimes
+    
+    position = searchEvaluator.position
+    evaluationStart = time.perf_counter()
+    standPat = searchEvaluator.evaluate(horizonTurn)
+    phaseTimes["evaluation"] += time.perf_counter() - evaluationStart
+    searchStats["evaluations"] += 1
+    searchStats["quiescenceNodes"] += 1
+    
+    if ply > searchStats["maxPly"]:
+        searchStats["maxPly"] = ply
+    
+    if standPat >= beta:
+        return standPat
+    
+    if standPat > alpha:
+        alpha = standPat
+    
+    if ply >= maxPly:
+        return alpha
+    
+    checkSearchTime()
+    
+    start = nodeStack.top
+    generationStart = time.perf_counter()
+    
+    for move in tacticalMoves(position):
+        nodeStack.append(move, mvvLvaScore(position, move))
+    
+    end = nodeStack.top
+    sortStart = time.perf_counter()
+    nodeStack.sortSpan(start, end, True)
+    phaseTimes["moveGeneration"] += sortStart - generationStart
+    phaseTimes["sorting"] += time.perf_counter() - sortStart
+    
+    for index in range(start, end):
+        move = nodeStack.moves[index]
+        
+        # Delta pruning: even winning the piece outright would not reach the window
+        if standPat + captureValue(position, move) + deltaMargin <= alpha:
+            continue
+        
+        # Captures that lose material once the exchange is played out are not searched
+        if staticExchange(position, move) < 0:
+            continue
+        
+        nodeStack.iterations += 1
+        
+        searchEvaluator.push(move)
+        score = quiesceMin(alpha, beta, ply + 1, horizonTurn)
+        searchEvaluator.pop()
+        
+        if score >= beta:
+            nodeStack.release(start)
+            return score
+        
+        if score > alpha:
+            alpha = score
+    
+    nodeStack.release(start)
+    
+    return alpha
+
+def quiesceMin(alpha, beta, ply, horizonTurn):
+    # Searches captures and promotions past the horizon until the position is quiet.
+    # Every position is scored for the side to move at the horizon, like the leaves
+    # of the main search, and the side to move may stand pat on that score.
+    global searchEvaluator, nodeStack, searchStats, phaseTimes
+    
+    position = searchEvaluator.position
+    evaluationStart = time.perf_counter()
+    standPat = searchEvaluator.evaluate(horizonTurn)
+    phaseTimes["evaluation"] += time.perf_counter() - evaluationStart
+    searchStats["evaluations"] += 1
+    searchStats["quiescenceNodes"] += 1
+    
+    if ply > searchStats["maxPly"]:
+        searchStats["maxPly"] = ply
+    
+    if standPat <= alpha:
+        return standPat
+    
+    if standPat < beta:
+        beta = standPat
+    
+    if ply >= maxPly:
+        return beta
+    
+    checkSearchTime()
+    
+    start = nodeStack.top
+    generationStart = time.perf_counter()
+    
+    for move in tacticalMoves(position):
+        nodeStack.append(move, mvvLvaScore(position, move))
+    
+    end = nodeStack.top
+    sortStart = time.perf_counter()
+    nodeStack.sortSpan(start, end, True)
+    phaseTimes["moveGeneration"] += sortStart - generationStart
+    phaseTimes["sorting"] += time.perf_counter() - sortStart
+    
+    for index in range(start, end):
+        move = nodeStack.moves[index]
+        
+        # Delta pruning: even winning the piece outright would not reach the window
+        if standPat - captureValue(position, move) - deltaMargin >= beta:
+            continue
+        
+        # Captures that lose material once the exchange is played out are not searched
+        if staticExchange(position, move) < 0:
+            continue
+        
+        nodeStack.iterations += 1
+        
+        searchEvaluator.push(move)
+        score = quiesceMax(alpha, beta, ply + 1, horizonTurn)
+        searchEvaluator.pop()
+        
+        if score <= alpha:
+            nodeStack.release(start)
+            return score
+        
+        if score < beta:
+            beta = score
+    
+    nodeStack.release(start)
+    
+    return beta
+
+def allocateTime(timeLeft, increment = 0, movesToGo = None):
+    # Spends an even share of the clock on each move, keeping a reserve for lag
+    movesToGo = movesToGo if movesToGo else 30
+    budget = timeLeft / movesToGo + increment * 0.75
+    
+    return max(0.01, min(budget, timeLeft * 0.5 - 0.05))
+
+def extractPrincipalVariation(rootBoard, maxLength):
+    global transpositionTable
+    
+    pvBoard = rootBoard.copy(stack = False)
+    variation = []
+    
+    while len(variation) < maxLength:
+        encodedMove = transpositionTable.bestMove(zobristHash(pvBoard))
+        
+        if encodedMove == NO_MOVE:
+            break
+        
+        move = decodeMove(encodedMove)
+        
+        if not pvBoard.is_legal(move):
+            break
+        
+        variation.append(move)
+        pvBoard.push(move)
+    
+    return variation
+
+def searchDepth(board, depth):
+    global searchEvaluator, nodeStack, rootBestMove
+    
+    # Every iteration starts from a fresh position in case the last one was aborted mid-move
+    searchEvaluator = IncrementalEvaluator(Position(board))
+    nodeStack.release(0)
+    rootBestMove = NO_MOVE
+    
+    if board.turn:
+        score = alphaBetaMax(depth, -math.inf, math.inf)
+    else:
+        score = alphaBetaMin(depth, -math.inf, math.inf)
+        
+    return score, rootBestMove
+
+def firstOrderedMove(board):
+    global nodeStack
+    
+    nodeStack.release(0)
+    moves = orderedMoves(Position(board), NO_MOVE, NO_MOVE, 0)
+    move = next(moves)
+    moves.close()
+    nodeStack.release(0)
+    
+    return move
+
+def predictReply(board):
+    # The reply the last search expects in this position, if the table still holds it
+    variation = extractPrincipalVariation(board, 1)
+    
+    return variation[0] if len(variation) > 0 else None
+
+def prepareSearch(moveTime = None, timeLeft = None, increment = 0, movesToGo = None, ponder = False):
+    # Sets the clock and stop state of the next alphaBetaSearch. A caller that runs the search in another thread
+    # calls this before starting it, so a stopSearch() or ponderHit() sent right away is not undone by the search
+    global searchPrepared, searchStopped, pondering, searchClockStart, searchMoveTime, searchDeadline, stopSignal
+    
+    searchStopped = False
+    pondering = ponder
+    searchClockStart = time.monotonic()
+    searchMoveTime = allocateTime(timeLeft, increment, movesToGo) if timeLeft != None else moveTime
+    # While pondering the clock has not started, so there is no deadline until ponderHit()
+    searchDeadline = searchClockStart + searchMoveTime if searchMoveTime != None and not ponder else None
+    searchPrepared = True
+    
+    if stopSignal != None:
+        stopSignal[0] = 0
+
+def ponderHit():
+    # The predicted move was played, so the ponder search becomes the real search
+    # and its time allowance starts now; safe to call from another thread
+    global pondering, searchClockStart, searchMoveTime, searchDeadline
+    
+    searchClockStart = time.monotonic()
+    
+    if searchMoveTime != None:
+        searchDeadline = searchClockStart + searchMoveTime
+    
+    pondering = False
+
+def stopSearch():
+    # Makes the running search return its best move so far; safe to call from another thread
+    global searchStopped, stopSignal
+    
+    searchStopped = True
+    
+    if stopSignal != None:
+        stopSignal[0] = 1
+
+def alphaBetaSearch(board, depth = None, moveTime = None, timeLeft = None, increment = 0, movesToGo = None, iterative = False, ponder = False):
+    global transpositionTable, nodeStack, instrumentation, lastSearchReport, searchCache, searchPrepared
+    
+    if not searchPrepared:
+        prepareSearch(moveTime, timeLeft, increment, movesToGo, ponder)
+    
+    searchPrepared = False
+    nodeStack.iterations = 0
+    transpositionTable.resetCounters()
+    resetSearchStatistics()
+    startTime = time.perf_counter()
+    move = None
+    
+    # A pondering search has no time limit yet to compare the cached search with, and book
+    # positions are left to the book so that its moves stay varied
+    if searchCache != None and not ponder and not inBook(board):
+        move = cachedMove(board, depth, searchMoveTime)
+    
+    if move == None:
+        search = lambda: searchMove(board, depth, iterative, ponder)
+        
+        if instrumentation != None:
+            move = instrumentation.profile(search, "ply{}-{}".format(board.ply(), "white" if board.turn else "black"))
+        else:
+            move = search()
+        
+        if searchCache != None:
+            storeSearch(board, time.perf_counter() - startTime)
+    
+    lastSearchReport = searchReport(board, move, time.perf_counter() - startTime)
+    
+    logger.info("move %s depth %s score %s nodes %d nps %d time %.2fs branching %.2f first move cutoffs %.1f%% max ply %d", 
+                move.uci(), lastSearchReport["depth"], lastSearchReport["score"], lastSearchReport["counters"]["nodes"], 
+                lastSearchReport["nps"], lastSearchReport["time"], lastSearchReport["branchingFactor"], 
+                lastSearchReport["firstMoveCutoffRate"] * 100, lastSearchReport["counters"]["maxPly"])
+    logger.info("TT hits: %d misses: %d collisions: %d", transpositionTable.hits, transpositionTable.misses, transpositionTable.collisions)
+    
+    if instrumentation != None:
+        instrumentation.record(lastSearchReport)
+    
+    return move
+
+def inBook(board):
+    global openingBook
+    
+    return openingBook != None and board.ply() < openingBook.maxBookDepth and len(openingBook.moves(board)) > 0
+
+def cacheVersion():
+    # Results are only reused by an engine that would search the same tree
+    return "{} {} {}".format(engineVersion, selectiveSearchSettings(), weightsKey(evaluationWeights))
+
+def cachedMove(board, depth, moveTime):
+    # Plays a cached search that went at least as deep as asked, or that had at least as much time as this
+    # search would spend: iterative deepening starts no new iteration after half its time
+    global searchCache, completedIterations
+    
+    entry = searchCache.probe(board, cacheVersion())
+    
+    if entry == None:
+        return None
+    
+    cachedDepth, score, encodedMove, seconds = entry
+    
+    if (depth != None and cachedDepth < depth) or (moveTime != None and seconds < moveTime * 0.5) or (depth == None and moveTime == None):
+        return None
+    
+    move = decodeMove(encodedMove)
+    
+    if not board.is_legal(move):
+        return None
+    
+    completedIterations = [(cachedDepth, score, encodedMove)]
+    logger.info("cached move %s depth %d", move.uci(), cachedDepth)
+    
+    return move
+
+def storeSearch(board, elapsed):
+    # Stores the finished search and, one ply shallower each, the positions along its principal variation
+    global searchCache, completedIterations
+    
+    if len(completedIterations) == 0 or completedIterations[-1][0] == 0:
+        return
+    
+    depth, score, encodedMove = completedIterations[-1]
+    entries = [(board, depth, score, encodedMove, elapsed)]
+    variation = extractPrincipalVariation(board, depth)
+    
+    if len(variation) > 0 and encodeMove(variation[0]) == encodedMove:
+        pvBoard = board.copy(stack = False)
+        
+        for ply, move in enumerate(variation[:-1]):
+            pvBoard.push(move)
+            entries.append((pvBoard.copy(stack = False), depth - ply - 1, score, encodeMove(variation[ply + 1]), 0.0))
+    
+    searchCache.store(entries, cacheVersion())
+
+def searchReport(board, move, elapsed):
+    # Describes the search that just finished in the form the instrumentation records
+    global nodeStack, transpositionTable, searchStats, phaseTimes, iterationNodes, completedIterations, tablebase
+    
+    nodes = nodeStack.iterations
+    depth, score = completedIterations[-1][:2] if len(completedIterations) > 0 else (None, None)
+    
+    # Effective branching factor: how many times more nodes the last iteration took than the one before
+    if len(iterationNodes) >= 2 and iterationNodes[-2] > 0:
+        branchingFactor = iterationNodes[-1] / iterationNodes[-2]
+    elif depth:
+        branchingFactor = nodes ** (1 / depth)
+    else:
+        branchingFactor = 0.0
+    
+    phases = dict(phaseTimes)
+    phases["other"] = max(0.0, elapsed - sum(phaseTimes.values()))
+    
+    counters = {"nodes": nodes, "ttHits": transpositionTable.hits, "ttMisses": transpositionTable.misses, 
+                "ttCollisions": transpositionTable.collisions, "tablebaseHits": tablebase.hits if tablebase != None else 0}
+    counters.update(searchStats)
+    
+    return {"fen": board.fen(), "move": move.uci(), "depth": depth, "score": round(score, 2) if score != None else None, 
+            "time": round(elapsed, 6), "nps": int(nodes / elapsed) if elapsed > 0 else 0, "branchingFactor": round(branchingFactor, 3), 
+            "firstMoveCutoffRate": round(cutoffRate(), 4), "counters": counters, 
+            "phases": {name: round(seconds, 6) for name, seconds in phases.items()}}
+
+def searchMove(board, depth, iterative, ponder):
+    # The clock and stop state were set by prepareSearch() and are only read here, as other threads may change them
+    global transpositionTable, principalVariation, nodeStack, searchWorkers, completedIterations, openingBook, tablebase, rootMoveFilter, iterationNodes
+    
+    moveTime = searchMoveTime
+    
+    # Known theory is played from the book without searching
+    if openingBook != None and not ponder:
+        bookMove = openingBook.chooseMove(board)
+        
+        if bookMove != None:
+            completedIterations = []
+            logger.info("book move %s", bookMove.uci())
+            
+            return bookMove
+    
+    rootMoveFilter = None
+    
+    if tablebase != None:
+        tablebase.resetCounters()
+        tablebaseMoves, wdl = tablebase.rootMoves(board)
+        
+        if tablebaseMoves != None:
+            # A won or lost position is played straight from the DTZ ranking
+            if wdl != 0 or searchWorkers > 1:
+                completedIterations = [(0, tablebaseScore(wdl, board.turn, 0), encodeMove(tablebaseMoves[0]))]
+                logger.info("tablebase move %s wdl %d", tablebaseMoves[0].uci(), wdl)
+                
+                return tablebaseMoves[0]
+            
+            # Every move left holds the draw, so the search chooses between them
+            rootMoveFilter = set(encodeMove(move) for move in tablebaseMoves)
+    
+    # Pondering runs in this process so that ponderHit() can hand it its time allowance
+    if searchWorkers > 1 and not ponder:
+        return parallelSearch(board, depth, moveTime)
+    
+    transpositionTable.newSearch(chess.popcount(board.occupied), keptSearches if searchReuse else 1)
+    carryMoveOrdering(board)
+    principalVariation = {}
+    completedIterations = []
+    startTime = time.monotonic()
+    
+    # Without a time limit the requested depth is searched in one pass
+    if moveTime == None and depth != None and not iterative and not ponder:
+        try:
+            score, bestMove = searchDepth(board, depth)
+            completedIterations.append((depth, score, bestMove))
+        except SearchTimeout:
+            score, bestMove = None, rootBestMove
+        
+        return decodeMove(bestMove if bestMove != NO_MOVE else firstOrderedMove(board))
+    
+    bestMove = NO_MOVE
+    maxDepth = depth if depth != None else 64
+    firstDepth = 1
+    retained = retainedIteration(board)
+    
+    # The subtree searched before the last moves were played still holds this position's result,
+    # so deepening picks up after the depth reached there and follows its principal variation
+    if retained != None:
+        completedIterations.append(retained)
+        firstDepth = min(retained[0], maxDepth - 1) + 1
+        pvBoard = board.copy(stack = False)
+        
+        for move in extractPrincipalVariation(board, retained[0]):
+            principalVariation[zobristHash(pvBoard)] = encodeMove(move)
+            pvBoard.push(move)
+    
+    for currentDepth in range(firstDepth, maxDepth + 1):
+        try:
+            score, bestMove = searchDepth(board, currentDepth)
+        except SearchTimeout:
+            break
+        
+        completedIterations.append((currentDepth, score, bestMove))
+        iterationNodes.append(nodeStack.iterations - sum(iterationNodes))
+        
+        # The finished iteration's principal variation is searched first by the next one
+        variation = extractPrincipalVariation(board, currentDepth)
+        principalVariation = {}
+        pvBoard = board.copy(stack = False)
+        
+        for move in variation:
+            principalVariation[zobristHash(pvBoard)] = encodeMove(move)
+            pvBoard.push(move)
+        
+        elapsed = time.monotonic() - startTime
+        
+        logger.debug("depth %d score %.2f nodes %d time %.2f pv %s", currentDepth, score, nodeStack.iterations, elapsed, 
+                     " ".join(m.uci() for m in variation))
+        
+        if iterationCallback != None:
+            iterationCallback({"depth": currentDepth, "score": score, "nodes": nodeStack.iterations, 
+                               "time": elapsed, "pv": variation, "firstMoveCutoffs": cutoffRate()})
+        
+        # Another iteration would take several times as long as this one, so stop early
+        if moveTime != None and not pondering and time.monotonic() - searchClockStart > moveTime * 0.5:
+            break
+    
+    # Depth 1 could not finish in time, so play the move that orders first
+    if len(completedIterations) == 0:
+        return decodeMove(firstOrderedMove(board))
+    
+    return decodeMove(completedIterations[-1][2])
+
+def initSearch(tableSizeInMegabytes = 16, tableBuffer = None):
+    global transpositionTable, searchDeadline, principalVariation, nodeStack, rootMoveFilter, stopSignal, searchWorkers, parallelMode, completedIterations, searchStopped, pondering, searchClockStart, searchMoveTime, iterationCallback, lastSearchBoard, searchPrepared
+    
+    transpositionTable = TranspositionTable(tableSizeInMegabytes, tableBuffer)
+    searchDeadline = None
+    principalVariation = {}
+    nodeStack = NodeStack()
+    rootMoveFilter = None
+    stopSignal = None
+    searchWorkers = 1
+    parallelMode = "lazy"
+    completedIterations = []
+    searchStopped = False
+    pondering = False
+    searchClockStart = None
+    searchMoveTime = None
+    searchPrepared = False
+    iterationCallback = None
+    lastSearchBoard = None
+    resetMoveOrdering()
+    resetSearchStatistics()
+
+def setSearchReuse(enabled, kept = 2):
+    # kept is the number of searches whose table entries keep their depth-preferred slots
+    global searchReuse, keptSearches, lastSearchBoard
+    
+    searchReuse = enabled
+    keptSearches = max(1, kept)
+    lastSearchBoard = None
+
+def setEvaluationWeights(weights = None):
+    # Takes a weights dictionary or the path of a weights file; None restores the hand-set weights
+    global evaluationWeights
+    
+    if weights == None:
+        weights = defaultWeights()
+    elif isinstance(weights, str):
+        weights = loadWeights(weights)
+    
+    evaluationWeights = weights
+    IncrementalEvaluator.pieceValues = [0] + [weights["material"][name] for name in pieceNames]
+    IncrementalEvaluator.doubledPawn = weights["doubledPawn"]
+    IncrementalEvaluator.isolatedPawn = weights["isolatedPawn"]
+    IncrementalEvaluator.blockedPawn = weights["blockedPawn"]
+    IncrementalEvaluator.captureWeight = weights["captures"]
+    IncrementalEvaluator.mobilityWeight = weights["mobility"]
+    IncrementalEvaluator.midgameTables = pieceSquareTables(weights, "midgame")
+    IncrementalEvaluator.endgameTables = pieceSquareTables(weights, "endgame")
+
+def setOpeningBook(path, maxBookDepth = 16):
+    # A path of None turns the book off
+    global openingBook
+    
+    if openingBook != None:
+        openingBook.close()
+    
+    openingBook = OpeningBook(path, maxBookDepth) if path != None else None
+
+def setTablebase(path, maxPieces = None):
+    # A path of None turns the tablebases off; worker processes of a parallel search do not probe
+    global tablebase
+    
+    if tablebase != None:
+        tablebase.close()
+    
+    tablebase = Tablebase(path, maxPieces) if path != None else None
+
+def setSelectiveSearch(nullMove = True, lateMoves = True, nullReduction = 2, lateReduction = 2, fullDepth = 3):
+    # Switches null-move pruning and late move reductions so their effect can be measured on its own
+    global nullMovePruning, lateMoveReductions, nullMoveReduction, lateMoveReduction, fullDepthMoves
+    
+    if nullReduction % 2 or lateReduction % 2:
+        raise ValueError("reductions must be an even number of plies")
+    
+    nullMovePruning = nullMove
+    lateMoveReductions = lateMoves
+    nullMoveReduction = nullReduction
+    lateMoveReduction = lateReduction
+    fullDepthMoves = fullDepth
+
+def selectiveSearchSettings():
+    return {"nullMove": nullMovePruning, "lateMoves": lateMoveReductions, "nullReduction": nullMoveReduction, 
+            "lateReduction": lateMoveReduction, "fullDepth": fullDepthMoves}
+
+def setSearchCache(path, maxEntries = 1000000):
+    # A path of None turns the persistent cache off
+    global searchCache
+    
+    if searchCache != None:
+        searchCache.close()
+    
+    searchCache = SearchCache(path, maxEntries) if path != None else None
+
+def setInstrumentation(jsonLinesPath = None, prometheusPath = None, profiler = None, profileDirectory = "profiles"):
+    # Records a report of every search to the given files; with no outputs and no profiler it is turned off
+    global instrumentation
+    
+    if jsonLinesPath == None and prometheusPath == None and profiler == None:
+        instrumentation = None
+    else:
+        instrumentation = Instrumentation(jsonLinesPath, prometheusPath, profiler, profileDirectory)
+
+def setParallelSearch(workers, mode = "lazy", tableSizeInMegabytes = 16):
+    # Starts a pool of search processes sharing one transposition table. Mode "root"
+    # splits the root moves between the workers, mode "lazy" has every worker search
+    # the whole tree at staggered depths (Lazy SMP). One worker searches in this process.
+    # Null-move pruning and late move reductions depend on the window a move is searched
+    # with, and in root mode a worker's window comes only from its own share of the root
+    # moves, so it can choose a different move of the same score than a single search.
+    global transpositionTable, searchWorkers, parallelMode, parallelPool, sharedTable, stopSignal
+    
+    if searchWorkers > 1:
+        parallelPool.terminate()
+        parallelPool.join()
+        stopSignal.release()
+        transpositionTable.release()
+        sharedTable.close()
+        sharedTable.unlink()
+        stopSignal = None
+        transpositionTable = TranspositionTable(tableSizeInMegabytes)
+    
+    searchWorkers = max(1, workers)
+    parallelMode = mode
+    
+    if searchWorkers > 1:
+        size = tableBytes(tableSizeInMegabytes)
+        
+        # The byte after the table tells the workers to stop
+        sharedTable = shared_memory.SharedMemory(create = True, size = size + 1)
+        sharedTable.buf[size] = 0
+        transpositionTable = TranspositionTable(buffer = sharedTable.buf[:size])
+        stopSignal = sharedTable.buf[size:size + 1]
+        parallelPool = multiprocessing.Pool(searchWorkers, initializer = attachParallelWorker, 
+                                            initargs = (sharedTable.name, size))
+
+def attachParallelWorker(sharedName, size):
+    global workerSharedTable, stopSignal
+    
+    try:
+        workerSharedTable = shared_memory.SharedMemory(name = sharedName, track = False)
+    except TypeError:
+        workerSharedTable = shared_memory.SharedMemory(name = sharedName)
+    
+    initSearch(tableBuffer = workerSharedTable.buf[:size])
+    stopSignal = workerSharedTable.buf[size:size + 1]
+
+def parallelSearchTask(task):
+    global transpositionTable, searchDeadline, nodeStack, rootMoveFilter, stopSignal, parallelMode
+    
+    fen, tableState, depth, moveTime, rootMoves, workerIndex, mode, selectiveSettings, weights = task
+    
+    board = chess.Board(fen)
+    setSelectiveSearch(**selectiveSettings)
+    setEvaluationWeights(weights)
+    transpositionTable.age, transpositionTable.rootPieces, transpositionTable.keptSearches = tableState
+    transpositionTable.resetCounters()
+    nodeStack.iterations = 0
+    resetMoveOrdering()
+    resetSearchStatistics()
+    rootMoveFilter = set(rootMoves) if rootMoves != None else None
+    searchDeadline = time.monotonic() + moveTime if moveTime != None else None
+    completed = []
+    
+    maxDepth = depth if depth != None else 64
+    
+    if moveTime == None and depth != None and (mode == "root" or workerIndex == 0):
+        depths = [depth]
+    elif mode == "lazy" and workerIndex > 0:
+        # Helpers start one ply apart and go one ply deeper so they fill the table ahead of the main worker
+        depths = range(1 + workerIndex % 2, maxDepth + (1 if depth != None else 0) + 1)
+    else:
+        depths = range(1, maxDepth + 1)
+    
+    for currentDepth in depths:
+        try:
+            score, bestMove = searchDepth(board, currentDepth)
+        except SearchTimeout:
+            break
+        
+        if bestMove != NO_MOVE:
+            completed.append((currentDepth, score, bestMove))
+    
+    if mode == "lazy" and workerIndex == 0:
+        stopSignal[0] = 1
+    
+    return {"completed": completed, "nodes": nodeStack.iterations, "hits": transpositionTable.hits,
+            "misses": transpositionTable.misses, "collisions": transpositionTable.collisions, "stats": searchStats, "phases": phaseTimes}
+
+def parallelSearch(board, depth = None, moveTime = None):
+    global transpositionTable, searchWorkers, parallelMode, parallelPool, stopSignal, nodeStack, completedIterations, searchStats, phaseTimes
+    
+    transpositionTable.newSearch(chess.popcount(board.occupied), keptSearches if searchReuse else 1)
+    tableState = (transpositionTable.age, transpositionTable.rootPieces, transpositionTable.keptSearches)
+    startTime = time.monotonic()
+    fen = board.fen()
+    
+    if parallelMode == "root":
+        # Order the root moves once and deal them out so every worker gets a mix of good and bad moves
+        nodeStack.release(0)
+        rootMoves = list(orderedMoves(Position(board), NO_MOVE, NO_MOVE, 0))
+        nodeStack.release(0)
+        tasks = [(fen, tableState, depth, moveTime, rootMoves[i::searchWorkers], i, "root", selectiveSearchSettings(), 
+                  evaluationWeights) for i in range(searchWorkers)]
+    else:
+        tasks = [(fen, tableState, depth, moveTime, None, i, "lazy", selectiveSearchSettings(), evaluationWeights) 
+                 for i in range(searchWorkers)]
+    
+    results = parallelPool.map(parallelSearchTask, tasks)
+    
+    nodeStack.iterations = sum(r["nodes"] for r in results)
+    transpositionTable.hits = sum(r["hits"] for r in results)
+    transpositionTable.misses = sum(r["misses"] for r in results)
+    transpositionTable.collisions = sum(r["collisions"] for r in results)
+    completedIterations = []
+    
+    # Phase times are summed over the workers, so they measure CPU time rather than wall time
+    for name in searchStats:
+        searchStats[name] = max(r["stats"][name] for r in results) if name == "maxPly" else sum(r["stats"][name] for r in results)
+    
+    for name in phaseTimes:
+        phaseTimes[name] = sum(r["phases"][name] for r in results)
+    
+    if parallelMode == "root":
+        # Each worker only searched its own root moves, so merge at the deepest depth all of them finished
+        finished = [r["completed"] for r in results if len(r["completed"]) > 0]
+        
+        if len(finished) > 0:
+            commonDepth = min(c[-1][0] for c in finished)
+            candidates = [next(entry for entry in c if entry[0] == commonDepth) for c in finished]
+            # Equal scores go to the move ordered first, which is the one a single search keeps
+            completedIterations = [max(candidates, key = lambda entry: (entry[1] if board.turn else -entry[1], -rootMoves.index(entry[2])))]
+    else:
+        # The deepest finished iteration wins, the main worker's on a tie
+        for r in results:
+            if len(r["completed"]) > 0 and (len(completedIterations) == 0 or r["completed"][-1][0] > completedIterations[-1][0]):
+                completedIterations = [r["completed"][-1]]
+    
+    logger.info("workers %d nodes %d time %.2f", searchWorkers, nodeStack.iterations, time.monotonic() - startTime)
+    
+    if len(completedIterations) > 0:
+        return decodeMove(completedIterations[-1][2])
+    
+    # No worker finished a single iteration, so play the move that orders first
+    return decodeMove(firstOrderedMove(board))
+
+def measureParallelScaling(board, depth = None, moveTime = None, maxWorkers = None, mode = "lazy"):
+    # Searches the board with 1 to maxWorkers processes and reports nodes per second
+    global nodeStack, searchCache
+    
+    maxWorkers = maxWorkers if maxWorkers != None else os.cpu_count()
+    scaling = []
+    # Every run searches from scratch, otherwise each one would start from the table and move ordering of the one before
+    cache, reuse = searchCache, searchReuse
+    searchCache = None
+    setSearchReuse(False)
+    
+    for workers in range(1, maxWorkers + 1):
+        setParallelSearch(workers, mode)
+        transpositionTable.clear()
+        startTime = time.perf_counter()
+        move = alphaBetaSearch(board, depth, moveTime)
+        elapsed = time.perf_counter() - startTime
+        nodesPerSecond = nodeStack.iterations / elapsed if elapsed > 0 else 0
+        
+        scaling.append({"workers": workers, "move": move.uci(), "nodes": nodeStack.iterations, "seconds": elapsed,
+                        "nps": nodesPerSecond, "speedup": nodesPerSecond / scaling[0]["nps"] if len(scaling) > 0 and scaling[0]["nps"] > 0 else 1.0})
+        logger.info("workers %d nodes %d time %.2f nps %.0f speedup %.2f", workers, scaling[-1]["nodes"], 
+                    elapsed, nodesPerSecond, scaling[-1]["speedup"])
+    
+    setParallelSearch(1)
+    searchCache = cache
+    setSearchReuse(reuse, keptSearches)
+    
+    return scaling
+
+def measureSearch(board, depth = None, moveTime = None):
+    # Runs one search from scratch and reports its memory use, so node layouts can be compared
+    global searchCache
+    
+    cache, reuse = searchCache, searchReuse
+    searchCache = None
+    setSearchReuse(False)
+    transpositionTable.clear()
+    gc.collect()
+    collectionsBefore = gc.get_stats()[0]["collections"]
+    blocksBefore = sys.getallocatedblocks()
+    
+    tracemalloc.start()
+    startTime = time.perf_counter()
+    move = alphaBetaSearch(board, depth, moveTime)
+    elapsed = time.perf_counter() - startTime
+    currentBytes, peakBytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    searchCache = cache
+    setSearchReuse(reuse, keptSearches)
+    
+    measurements = {"move": move.uci(), "nodes": nodeStack.iterations, "seconds": elapsed,
+                    "peakTracedBytes": peakBytes, "retainedBlocks": sys.getallocatedblocks() - blocksBefore,
+                    "gen0Collections": gc.get_stats()[0]["collections"] - collectionsBefore}
+    
+    # ru_maxrss is the peak of the whole process, in kilobytes on Linux; not available on Windows
+    if resource != None:
+        measurements["peakRSSKilobytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    
+    return measurements
+
+initSearch()
+
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-game engine server.
+
+Serves any number of games over a local TCP or Unix socket, so one process can
+play for every player instead of one GUI process each. Every game is a session
+with its own board on the server; searches of all sessions share a pool of
+worker processes. Requests and replies are JSON objects, one per line:
+
+    {"id": 1, "command": "new", "fen": "<optional FEN>"}
+    {"id": 2, "command": "push", "session": "s1", "move": "e2e4"}
+    {"id": 3, "command": "go", "session": "s1", "depth": 3, "movetime": 1.5, "play": true}
+    {"id": 4, "command": "fen", "session": "s1"}
+    {"id": 5, "command": "pgn", "session": "s1"}
+    {"id": 6, "command": "close", "session": "s1"}
+    {"id": 7, "command": "stats"}
+
+Replies carry the id of their request and "ok", plus "error" when it failed.
+Requests of one session run in the order they arrived while other sessions go
+ahead. A session with too many queued requests, or a server with too many
+searches waiting for a worker, refuses new searches with a "busy" error
+instead of queueing without bound, and a connection with too many requests in
+flight is not read from until some of them have been answered. The stats
+command returns latency percentiles of every command type.
+
+    python EngineServer.py --port 8765 --workers 8
+    python EngineServer.py --unix /tmp/chess.sock
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import itertools
+import collections
+import concurrent.futures
+import chess
+import chess.pgn
+import ChessEngine
+
+logger = logging.getLogger("EngineServer")
+
+# Latencies kept per command type for the percentiles
+latencyWindow = 10000
+
+def initWorker(hashSize, selectiveSettings, cachePath):
+    ChessEngine.initSearch(hashSize)
+    ChessEngine.setSelectiveSearch(**selectiveSettings)
+    ChessEngine.setSearchCache(cachePath)
+    # A worker serves searches of unrelated sessions one after another
+    ChessEngine.setSearchReuse(False)
+
+def searchPosition(task):
+    # Runs in a worker process; the moves are replayed so repetitions are seen
+    fen, moves, depth, moveTime = task
+    board = chess.Board(fen)
+
+    for uci in moves:
+        board.push_uci(uci)
+
+    # Every search starts from an empty table so its result does not depend on which worker ran it
+    ChessEngine.transpositionTable.clear()
+    startTime = time.perf_counter()
+    move = ChessEngine.alphaBetaSearch(board, depth, moveTime)
+    result = {"bestmove": move.uci(), "score": None, "depth": None, "nodes": ChessEngine.nodeStack.iterations,
+              "time": round(time.perf_counter() - startTime, 4)}
+
+    if len(ChessEngine.completedIterations) > 0:
+        result["depth"] = ChessEngine.completedIterations[-1][0]
+        result["score"] = round(ChessEngine.completedIterations[-1][1], 2)
+
+    return result
+
+def percentile(sortedValues, fraction):
+    return sortedValues[min(len(sortedValues) - 1, int(fraction * len(sortedValues)))]
+
+class RequestError(Exception):
+    pass
+
+class Session:
+
+    def __init__(self, sessionId, fen = None):
+        self.sessionId = sessionId
+        self.board = chess.Board(fen) if fen != None else chess.Board()
+        self.startFen = self.board.fen()
+        # Requests of a session run one at a time in arrival order
+        self.lock = asyncio.Lock()
+        self.queued = 0
+
+    def pgn(self):
+        game = chess.pgn.Game.from_board(self.board)
+        game.headers["Event"] = "EngineServer session {}".format(self.sessionId)
+        game.headers["Result"] = self.board.result(claim_draw = True)
+
+        return str(game)
+
+class EngineServer:
+
+    def __init__(self, workers = None, hashSize = 16, maxSessions = 1000, maxSessionQueue = 8, maxPendingSearches = None,
+                 maxConnectionRequests = 32, cachePath = None):
+        self.workers = workers if workers != None else os.cpu_count()
+        self.hashSize = hashSize
+        self.maxSessions = maxSessions
+        self.maxSessionQueue = maxSessionQueue
+        self.maxPendingSearches = maxPendingSearches if maxPendingSearches != None else self.workers * 16
+        self.maxConnectionRequests = maxConnectionRequests
+        self.cachePath = cachePath
+        self.sessions = {}
+        self.sessionIds = itertools.count(1)
+        self.pendingSearches = 0
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen = latencyWindow))
+        self.requestCounts = collections.Counter()
+        self.pool = None
+        self.server = None
+        self.commands = {"new": self.newGame, "push": self.pushMove, "go": self.go, "fen": self.getFen, "pgn": self.getPgn,
+                         "close": self.closeSession, "stats": self.getStats}
+
+    def startPool(self):
+        self.pool = concurrent.futures.ProcessPoolExecutor(self.workers, initializer = initWorker,
+                                                           initargs = (self.hashSize, ChessEngine.selectiveSearchSettings(), self.cachePath))
+
+    def session(self, request):
+        if request.get("session") not in self.sessions:
+            raise RequestError("unknown session {}".format(request.get("session")))
+
+        return self.sessions[request["session"]]
+
+    async def newGame(self, request):
+        if len(self.sessions) >= self.maxSessions:
+            raise RequestError("busy: {} sessions open".format(len(self.sessions)))
+
+        sessionId = "s{}".format(next(self.sessionIds))
+
+        try:
+            self.sessions[sessionId] = Session(sessionId, request.get("fen"))
+        except ValueError as error:
+            raise RequestError("invalid fen: {}".format(error))
+
+        return {"session": sessionId, "fen": self.sessions[sessionId].board.fen()}
+
+    async def pushMove(self, request):
+        board = self.session(request).board
+
+        try:
+            move = board.parse_uci(request.get("move", ""))
+        except ValueError:
+            try:
+                move = board.parse_san(request.get("move", ""))
+            except ValueError:
+                raise RequestError("illegal move {}".format(request.get("move")))
+
+        board.push(move)
+
+        return {"fen": board.fen(), "gameOver": board.is_game_over(claim_draw = True)}
+
+    async def go(self, request):
+        session = self.session(request)
+        board = session.board
+
+        if board.is_game_over():
+            raise RequestError("game over: {}".format(board.result()))
+
+        moveTime = request.get("movetime")
+        depth = request.get("depth", None if moveTime != None else 3)
+
+        # Waiting for a worker is only allowed up to a point, beyond that clients are told to retry
+        if self.pendingSearches >= self.maxPendingSearches:
+            raise RequestError("busy: {} searches waiting".format(self.pendingSearches))
+
+        self.pendingSearches += 1
+
+        try:
+            task = (session.startFen, [move.uci() for move in board.move_stack], depth, moveTime)
+            result = await asyncio.get_running_loop().run_in_executor(self.pool, searchPosition, task)
+        finally:
+            self.pendingSearches -= 1
+
+        if request.get("play"):
+            board.push_uci(result["bestmove"])
+            result["fen"] = board.fen()
+
+        return result
+
+    async def getFen(self, request):
+        return {"fen": self.session(request).board.fen()}
+
+    async def getPgn(self, request):
+        return {"pgn": self.session(request).pgn()}
+
+    async def closeSession(self, request):
+        self.session(request)
+
+        return {"pgn": self.sessions.pop(request["session"]).pgn()}
+
+    async def getStats(self, request):
+        return {"sessions": len(self.sessions), "pendingSearches": self.pendingSearches, "workers": self.workers,
+                "latency": self.latencyPercentiles()}
+
+    def latencyPercentiles(self):
+        # Milliseconds from reading a request to having its reply, over the last latencyWindow requests of each command
+        report = {}
+
+        for command, latencies in self.latencies.items():
+            values = sorted(latencies)
+            report[command] = {"count": self.requestCounts[command], "p50": round(percentile(values, 0.5) * 1000, 2),
+                               "p90": round(percentile(values, 0.9) * 1000, 2), "p99": round(percentile(values, 0.99) * 1000, 2),
+                               "max": round(values[-1] * 1000, 2)}
+
+        return report
+
+    async def handleRequest(self, request):
+        startTime = time.perf_counter()
+        command = request.get("command") if isinstance(request, dict) else None
+        reply = {"id": request.get("id")} if isinstance(request, dict) else {"id": None}
+
+        try:
+            if command not in self.commands:
+                raise RequestError("unknown command {}".format(command))
+
+            session = self.sessions.get(request.get("session"))
+
+            if session != None:
+                if session.queued >= self.maxSessionQueue:
+                    raise RequestError("busy: {} requests queued for session {}".format(session.queued, session.sessionId))
+
+                session.queued += 1
+
+                try:
+                    async with session.lock:
+                        reply.update(await self.commands[command](request))
+                finally:
+                    session.queued -= 1
+            else:
+                reply.update(await self.commands[command](request))
+
+            reply["ok"] = True
+        except RequestError as error:
+            reply["ok"] = False
+            reply["error"] = str(error)
+        except Exception as error:
+            logger.exception("request %s failed", request)
+            reply["ok"] = False
+            reply["error"] = "internal error: {}".format(error)
+
+        if command in self.commands:
+            self.latencies[command].append(time.perf_counter() - startTime)
+            self.requestCounts[command] += 1
+
+        return reply
+
+    async def handleConnection(self, reader, writer):
+        inFlight = set()
+        writeLock = asyncio.Lock()
+
+        async def answer(request):
+            reply = await self.handleRequest(request)
+
+            async with writeLock:
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+
+        try:
+            while True:
+                # Stops reading while the client has too many requests unanswered, so the socket pushes back
+                if len(inFlight) >= self.maxConnectionRequests:
+                    await asyncio.wait(inFlight, return_when = asyncio.FIRST_COMPLETED)
+
+                line = await reader.readline()
+
+                if not line:
+                    break
+
+                if not line.strip():
+                    continue
+
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = {"command": None}
+
+                task = asyncio.ensure_future(answer(request))
+                inFlight.add(task)
+                task.add_done_callback(inFlight.discard)
+
+            if len(inFlight) > 0:
+                await asyncio.wait(inFlight)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host = "127.0.0.1", port = 8765, unixPath = None):
+        self.startPool()
+
+        if unixPath != None:
+            self.server = await asyncio.start_unix_server(self.handleConnection, unixPath)
+            logger.info("serving on %s with %d workers", unixPath, self.workers)
+        else:
+            self.server = await asyncio.start_server(self.handleConnection, host, port)
+            logger.info("serving on %s:%d with %d workers", host, port, self.workers)
+
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures = True)
+
+            for command, stats in self.latencyPercentiles().items():
+                logger.info("%s: %d requests, p50 %.1fms p90 %.1fms p99 %.1fms max %.1fms", command, stats["count"],
+                            stats["p50"], stats["p90"], stats["p99"], stats["max"])
+
+def main():
+    parser = argparse.ArgumentParser(description = "Serve many concurrent games over a local socket.")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8765)
+    parser.add_argument("--unix", default = None, help = "listen on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type = int, default = None, help = "search processes (default: all cores)")
+    parser.add_argument("--hash", type = int, default = 16, help = "transposition table size per worker in MB")
+    parser.add_argument("--max-sessions", type = int, default = 1000)
+    parser.add_argument("--max-session-queue", type = int, default = 8, help = "requests one session may have waiting")
+    parser.add_argument("--max-pending", type = int, default = None, help = "searches waiting for a worker (default: 16 per worker)")
+    parser.add_argument("--no-null-move", action = "store_true", help = "search without null-move pruning")
+    parser.add_argument("--no-lmr", action = "store_true", help = "search without late move reductions")
+    parser.add_argument("--cache", default = None, help = "SQLite file of searches shared between runs and workers")
+    arguments = parser.parse_args()
+
+    # The per-move search log of the workers is left out unless asked for
+    logging.basicConfig(stream = sys.stderr, level = os.environ.get("CHESS_LOG_LEVEL", "WARNING"), format = "%(name)s: %(message)s")
+    logger.setLevel(logging.INFO)
+    ChessEngine.setSelectiveSearch(not arguments.no_null_move, not arguments.no_lmr)
+
+    server = EngineServer(arguments.workers, arguments.hash, arguments.max_sessions, arguments.max_session_queue, arguments.max_pending,
+                          cachePath = arguments.cache)
+
+    try:
+        asyncio.run(server.serve(arguments.host, arguments.port, arguments.unix))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Evaluation consistency test.
+
+The search scores positions with IncrementalEvaluator, which updates its sums
+from every move instead of recounting the board, and Tuner.py fits the weights
+on the NumPy batch evaluation; both have to give exactly the score of
+evaluate(). This plays games with random moves from a fixed seed, starting from
+positions chosen for castling, en passant, promotions and checks and from any
+FEN, EPD or PGN files given. At every ply each legal move is made and unmade on
+the evaluator and the position before and after is compared with evaluate(); at
+the end all moves are taken back and the start is compared again. Every position
+is then scored by the batch evaluation as well. The hand-set weights have empty
+piece-square tables, so the games are played again with random weights and
+tables, and with a weights file when one is given:
+
+    python EvaluationCheck.py --plies 40 --seed 1 --weights weights.json games.pgn
+"""
+
+import sys
+import random
+import argparse
+import chess
+from Bitboard import Position
+from BatchAnalysis import readPositions
+from BatchEvaluation import packPositions, evaluateBatch
+from ChessEngine import IncrementalEvaluator, evaluate, setEvaluationWeights
+from EvaluationWeights import defaultWeights, loadWeights, pieceNames, termNames, stageNames
+from TranspositionTable import decodeMove
+
+# Largest difference in pawns put down to the order of floating point additions
+tolerance = 1e-9
+# The batch features hold the phase in single precision to keep tuning data small
+batchTolerance = 1e-6
+
+checkPositions = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+    "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+    # En passant that removes the checking pawn, and one the rook pins along the rank
+    "rn1q1bnr/1pp1p1p1/6R1/p3kp1p/2P1pP1P/3B3P/PP1PN3/RNBQK3 b Q f3 0 12",
+    "8/8/8/KPp4r/8/8/8/7k w - c6 0 2",
+    # Promotions with and without capture, and a bare king endgame
+    "1r2k3/2P5/8/8/8/8/6p1/4K2R w K - 0 1",
+    "8/8/4k3/8/8/3K4/8/8 w - - 0 1",
+]
+
+def randomWeights(rng):
+    # Every weight and piece-square value differs, so a term that is updated wrongly cannot hide behind a zero
+    weights = defaultWeights()
+
+    for name in pieceNames:
+        weights["material"][name] *= rng.uniform(0.5, 1.5)
+
+    for name in termNames:
+        weights[name] = rng.uniform(0, 1)
+
+    for stage in stageNames:
+        for name in pieceNames:
+            weights["pieceSquare"][stage][name] = [rng.uniform(-1, 1) for square in range(64)]
+
+    return weights
+
+def compare(evaluator, board, label, scores):
+    scores.append((label, board.copy(stack = False), evaluator.evaluate(), evaluate(board.fen())))
+
+def replayGame(fen, plies, rng, scores):
+    # Appends (label, board, incremental score, evaluate() score) for every position compared
+    board = chess.Board(fen)
+    evaluator = IncrementalEvaluator(Position(board))
+    compare(evaluator, board, "start", scores)
+
+    for ply in range(plies):
+        moves = evaluator.position.generateMoves()
+
+        if len(moves) == 0:
+            break
+
+        for move in moves:
+            evaluator.push(move)
+            board.push(decodeMove(move))
+            compare(evaluator, board, "after " + board.peek().uci(), scores)
+            board.pop()
+            evaluator.pop()
+
+        compare(evaluator, board, "after unmaking every move", scores)
+
+        move = rng.choice(moves)
+        evaluator.push(move)
+        board.push(decodeMove(move))
+
+    while len(evaluator.history) > 0:
+        evaluator.pop()
+        board.pop()
+
+    compare(evaluator, board, "after taking the game back", scores)
+
+def runCheck(fens, plies = 30, seed = 1):
+    # Returns the number of positions compared and (evaluator, label, fen, its score, evaluate() score) of every mismatch
+    rng = random.Random(seed)
+    scores = []
+
+    for fen in fens:
+        replayGame(fen, plies, rng, scores)
+
+    batchScores = evaluateBatch(packPositions([board for label, board, incremental, scalar in scores]))
+    mismatches = [("incremental", label, board.fen(), incremental, scalar) for label, board, incremental, scalar in scores
+                  if abs(incremental - scalar) > tolerance]
+    mismatches += [("batch", label, board.fen(), float(batch), scalar) for (label, board, incremental, scalar), batch in zip(scores, batchScores)
+                   if abs(batch - scalar) > batchTolerance]
+
+    return len(scores), mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description = "Check that the incremental and batch evaluations give the scores of evaluate().")
+    parser.add_argument("inputs", nargs = "*", help = "FEN/EPD files or PGN files whose positions are replayed as well")
+    parser.add_argument("--plies", type = int, default = 30, help = "random moves played from every position")
+    parser.add_argument("--seed", type = int, default = 1)
+    parser.add_argument("--weights", default = None, help = "weights JSON to check as well")
+    arguments = parser.parse_args()
+
+    fens = checkPositions + [fen for positionId, fen in readPositions(arguments.inputs)]
+    weightSets = [("hand-set weights", defaultWeights()), ("random weights", randomWeights(random.Random(arguments.seed)))]
+    failed = False
+
+    if arguments.weights != None:
+        weightSets.append((arguments.weights, loadWeights(arguments.weights)))
+
+    for name, weights in weightSets:
+        setEvaluationWeights(weights)
+        compared, mismatches = runCheck(fens, arguments.plies, arguments.seed)
+
+        for evaluator, label, fen, score, scalar in mismatches[:20]:
+            print("{} {}: {} evaluate {} {}".format(evaluator, label, score, scalar, fen))
+
+        print("{}: {} positions compared, {} mismatches".format(name, compared, len(mismatches)))
+        failed = failed or len(mismatches) > 0
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Evaluation weights.
+
+The evaluation is a weighted sum of material, doubled, isolated and blocked
+pawns, the capture and mobility terms, and piece-square tables that are tapered
+between a midgame and an endgame table by the material left on the board. The
+weights live in a JSON file, so they can be tuned with Tuner.py and loaded
+without touching the code:
+
+    {"material": {"pawn": 1, "knight": 3, ...}, "doubledPawn": 0.5, ...,
+     "pieceSquare": {"midgame": {"pawn": [64 values], ...}, "endgame": {...}}}
+
+Piece-square values are in pawns and listed from a1 to h8 from White's side;
+Black's pieces read them mirrored. The default weights are the ones evaluate()
+was written with and have empty piece-square tables.
+"""
+
+import json
+import hashlib
+
+pieceNames = ["pawn", "knight", "bishop", "rook", "queen", "king"]
+termNames = ["doubledPawn", "isolatedPawn", "blockedPawn", "captures", "mobility"]
+stageNames = ["midgame", "endgame"]
+
+# The phase runs from totalPhase with every minor and major piece on the board down to 0 with none
+phaseValues = [0, 0, 1, 1, 2, 4, 0]
+totalPhase = 24
+
+def defaultWeights():
+    return {"material": {"pawn": 1, "knight": 3, "bishop": 3.5, "rook": 5, "queen": 9, "king": 200},
+            "doubledPawn": 0.5, "isolatedPawn": 0.5, "blockedPawn": 0.5, "captures": 0.5, "mobility": 0.1,
+            "pieceSquare": {stage: {name: [0.0] * 64 for name in pieceNames} for stage in stageNames}}
+
+def loadWeights(path):
+    # Entries missing from the file keep their defaults, so a file may hold only what was tuned
+    with open(path) as weightsFile:
+        data = json.load(weightsFile)
+
+    weights = defaultWeights()
+
+    for name, value in data.get("material", {}).items():
+        if name not in pieceNames:
+            raise ValueError("{}: unknown piece '{}'".format(path, name))
+
+        weights["material"][name] = float(value)
+
+    for name in termNames:
+        if name in data:
+            weights[name] = float(data[name])
+
+    for stage, tables in data.get("pieceSquare", {}).items():
+        if stage not in stageNames:
+            raise ValueError("{}: unknown stage '{}'".format(path, stage))
+
+        for name, table in tables.items():
+            if name not in pieceNames or len(table) != 64:
+                raise ValueError("{}: {} table for '{}' needs 64 values".format(path, stage, name))
+
+            weights["pieceSquare"][stage][name] = [float(value) for value in table]
+
+    return weights
+
+def saveWeights(weights, path):
+    with open(path, "w") as weightsFile:
+        json.dump(weights, weightsFile, indent = 1)
+
+def weightsKey(weights):
+    # Short digest that tells weight sets apart, for the search cache
+    return hashlib.sha1(json.dumps(weights, sort_keys = True).encode()).hexdigest()[:12]
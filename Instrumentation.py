@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Search instrumentation.
+
+Every search produces a report with its counters (nodes, evaluations, cutoffs,
+transposition table hits, deepest ply, effective branching factor) and the time
+spent in each phase of the search (move generation, evaluation, sorting). Reports
+can be appended to a JSON lines file, and running totals can be written in the
+Prometheus text format to a file that a node exporter's textfile collector serves.
+Searches can also be run under cProfile or pyinstrument, one profile per move.
+"""
+
+import os
+import json
+import time
+import cProfile
+
+# Counters that are summed into the running totals; everything else in a report describes one search
+counterNames = ["nodes", "evaluations", "quiescenceNodes", "cutoffs", "firstMoveCutoffs", "nullMoveCutoffs", "reducedMoves",
+                "researches", "ttHits", "ttMisses", "ttCollisions", "tablebaseHits", "maxPly"]
+phaseNames = ["moveGeneration", "evaluation", "sorting", "other"]
+
+class Instrumentation:
+
+    def __init__(self, jsonLinesPath = None, prometheusPath = None, profiler = None, profileDirectory = "profiles"):
+        if profiler not in (None, "cprofile", "pyinstrument"):
+            raise ValueError("profiler must be None, 'cprofile' or 'pyinstrument'")
+
+        self.jsonLinesPath = jsonLinesPath
+        self.prometheusPath = prometheusPath
+        self.profiler = profiler
+        self.profileDirectory = profileDirectory
+        self.searches = 0
+        self.totals = dict.fromkeys(counterNames, 0)
+        self.phaseTotals = dict.fromkeys(phaseNames, 0.0)
+        self.searchSeconds = 0.0
+
+    def record(self, report):
+        self.searches += 1
+        self.searchSeconds += report["time"]
+
+        for name in counterNames:
+            # The deepest ply is a high-water mark rather than a count
+            if name == "maxPly":
+                self.totals[name] = max(self.totals[name], report["counters"][name])
+            else:
+                self.totals[name] += report["counters"][name]
+
+        for name in phaseNames:
+            self.phaseTotals[name] += report["phases"][name]
+
+        if self.jsonLinesPath != None:
+            with open(self.jsonLinesPath, "a", encoding = "utf-8") as reportFile:
+                reportFile.write(json.dumps(report) + "\n")
+
+        if self.prometheusPath != None:
+            self.writePrometheus()
+
+    def prometheusText(self):
+        lines = ["# TYPE chess_searches_total counter", "chess_searches_total {}".format(self.searches),
+                 "# TYPE chess_search_seconds_total counter", "chess_search_seconds_total {:.6f}".format(self.searchSeconds)]
+
+        for name in counterNames:
+            metric = "chess_search_max_ply" if name == "maxPly" else "chess_search_{}_total".format(snakeCase(name))
+            lines.append("# TYPE {} {}".format(metric, "gauge" if name == "maxPly" else "counter"))
+            lines.append("{} {}".format(metric, self.totals[name]))
+
+        lines.append("# TYPE chess_search_phase_seconds_total counter")
+
+        for name in phaseNames:
+            lines.append('chess_search_phase_seconds_total{{phase="{}"}} {:.6f}'.format(snakeCase(name), self.phaseTotals[name]))
+
+        return "\n".join(lines) + "\n"
+
+    def writePrometheus(self):
+        # Written to a temporary file first so a scrape never reads half a file
+        temporaryPath = self.prometheusPath + ".tmp"
+
+        with open(temporaryPath, "w", encoding = "utf-8") as metricsFile:
+            metricsFile.write(self.prometheusText())
+
+        os.replace(temporaryPath, self.prometheusPath)
+
+    def profile(self, function, label):
+        # Runs function under the configured profiler and saves the profile named after label
+        if self.profiler == None:
+            return function()
+
+        os.makedirs(self.profileDirectory, exist_ok = True)
+        path = os.path.join(self.profileDirectory, "{}-{}".format(time.strftime("%Y%m%d-%H%M%S"), label))
+
+        if self.profiler == "cprofile":
+            profile = cProfile.Profile()
+
+            try:
+                return profile.runcall(function)
+            finally:
+                profile.dump_stats(path + ".prof")
+
+        # pyinstrument is only needed by those who ask for it
+        from pyinstrument import Profiler
+
+        profile = Profiler()
+        profile.start()
+
+        try:
+            return function()
+        finally:
+            profile.stop()
+
+            with open(path + ".html", "w", encoding = "utf-8") as profileFile:
+                profileFile.write(profile.output_html())
+
+def snakeCase(name):
+    return "".join("_" + c.lower() if c.isupper() else c for c in name)
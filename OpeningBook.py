@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Polyglot opening book.
+
+Books are opened with python-chess's memory-mapped reader, which finds a
+position by binary search over the Zobrist keys the book is sorted by. Only the
+pages that a lookup touches are read from disk, so books of hundreds of
+megabytes open instantly and are never loaded into memory as a whole.
+"""
+
+import random
+import chess
+import chess.polyglot
+
+class OpeningBook:
+
+    def __init__(self, path, maxBookDepth = 16, seed = None):
+        # maxBookDepth counts plies from the start of the game
+        self.path = path
+        self.maxBookDepth = maxBookDepth
+        self.reader = chess.polyglot.open_reader(path)
+        self.random = random.Random(seed)
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self.reader.close()
+
+    def chooseMove(self, board):
+        # Picks a book move at random weighted by the book's weights, or None when out of book
+        if board.ply() >= self.maxBookDepth:
+            return None
+
+        try:
+            entry = self.reader.weighted_choice(board, random = self.random)
+        except IndexError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        return entry.move
+
+    def moves(self, board):
+        # Every book move for the position with its weight, most played first
+        return sorted(((entry.move, entry.weight) for entry in self.reader.find_all(board)), key = lambda e: -e[1])
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Move generation test.
+
+Counts the leaf nodes of the full move tree of well-known positions with the
+bitboard move generator the search uses and compares them with the published
+counts, which catches any missing, extra or illegal move including castling,
+en passant and promotions. With --compare the same trees are counted with
+python-chess as well to show the speed of both generators:
+
+    python Perft.py --depth 4 --compare
+"""
+
+import sys
+import time
+import argparse
+import chess
+from Bitboard import Position
+
+# FEN and leaf counts from depth 1 on
+perftPositions = [
+    ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", [20, 400, 8902, 197281, 4865609]),
+    ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862, 4085603]),
+    ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467, 422333]),
+    ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+    ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890, 3894594]),
+]
+
+def boardPerft(board, depth):
+    # The same count with python-chess, for comparison
+    if depth <= 1:
+        return board.legal_moves.count() if depth == 1 else 1
+
+    nodes = 0
+
+    for move in board.generate_legal_moves():
+        board.push(move)
+        nodes += boardPerft(board, depth - 1)
+        board.pop()
+
+    return nodes
+
+def timedPerft(perft, depth):
+    startTime = time.perf_counter()
+    nodes = perft(depth)
+
+    return nodes, time.perf_counter() - startTime
+
+def runPerft(depth, positions = None, compare = False, report = None):
+    positions = positions if positions != None else perftPositions
+    results = []
+
+    for fen, expected in positions:
+        # Positions with fewer published counts are only searched as deep as they go
+        positionDepth = min(depth, len(expected)) if expected != None else depth
+        nodes, elapsed = timedPerft(Position(chess.Board(fen)).perft, positionDepth)
+        result = {"fen": fen, "depth": positionDepth, "nodes": nodes, "time": elapsed,
+                  "expected": expected[positionDepth - 1] if expected != None else None}
+
+        if compare:
+            result["boardNodes"], result["boardTime"] = timedPerft(lambda d: boardPerft(chess.Board(fen), d), positionDepth)
+
+            if result["expected"] == None:
+                result["expected"] = result["boardNodes"]
+
+        results.append(result)
+
+        if report != None:
+            report(len(results), result)
+
+    return results
+
+def nodesPerSecond(nodes, elapsed):
+    return int(nodes / elapsed) if elapsed > 0 else 0
+
+def main():
+    parser = argparse.ArgumentParser(description = "Count the move tree of known positions to test the move generator.")
+    parser.add_argument("--depth", type = int, default = 3)
+    parser.add_argument("--fen", help = "count this position instead of the standard ones")
+    parser.add_argument("--compare", action = "store_true", help = "also count with python-chess and compare the speed")
+    arguments = parser.parse_args()
+
+    positions = [(arguments.fen, None)] if arguments.fen != None else None
+
+    def report(index, result):
+        line = "{:2d} depth {} nodes {:>9} {:7.3f}s nps {:>8}".format(index, result["depth"], result["nodes"], result["time"],
+               nodesPerSecond(result["nodes"], result["time"]))
+
+        if "boardNodes" in result:
+            line += " python-chess {:7.3f}s nps {:>8}".format(result["boardTime"], nodesPerSecond(result["boardNodes"], result["boardTime"]))
+
+        if result["expected"] != None and result["nodes"] != result["expected"]:
+            line += " expected {}".format(result["expected"])
+
+        print(line + " " + result["fen"])
+
+    results = runPerft(arguments.depth, positions, arguments.compare, report)
+    nodes = sum(r["nodes"] for r in results)
+    elapsed = sum(r["time"] for r in results)
+
+    print("nodes {} time {:.3f}s nps {}".format(nodes, elapsed, nodesPerSecond(nodes, elapsed)))
+
+    if arguments.compare:
+        boardElapsed = sum(r["boardTime"] for r in results)
+        print("python-chess time {:.3f}s nps {} speedup {:.2f}x".format(boardElapsed, nodesPerSecond(nodes, boardElapsed),
+              boardElapsed / elapsed if elapsed > 0 else 0))
+
+    if any(r["expected"] != None and r["nodes"] != r["expected"] for r in results):
+        print("move generation differs from the expected counts")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent search cache.
+
+Finished searches are kept in an SQLite database keyed by the position's Zobrist
+hash and the engine version, so a position analysed in an earlier session or by
+another process does not have to be searched again. Results of a different
+engine version never match, which keeps changes to the search or the evaluation
+from reusing stale scores. The database runs in write-ahead logging mode, so any
+number of processes can read it while one of them writes. Once it holds more
+than maxEntries positions the least recently used ones are deleted.
+"""
+
+import os
+import time
+import sqlite3
+from TranspositionTable import zobristHash
+
+# Eviction runs after this many stores rather than after every one
+evictionInterval = 256
+
+class SearchCache:
+
+    def __init__(self, path, maxEntries = 1000000):
+        self.path = path
+        self.maxEntries = maxEntries
+        self.connection = None
+        self.pid = None
+        self.stores = 0
+        self.resetCounters()
+        self.connect()
+
+    def connect(self):
+        # SQLite connections cannot be carried over into a forked process, so each process opens its own.
+        # Within a process the connection may be used by a background search thread.
+        if self.connection != None and self.pid == os.getpid():
+            return self.connection
+
+        self.connection = sqlite3.connect(self.path, timeout = 5, check_same_thread = False)
+        self.pid = os.getpid()
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS positions (key INTEGER NOT NULL, version TEXT NOT NULL,
+                                   depth INTEGER NOT NULL, score REAL NOT NULL, move INTEGER NOT NULL, seconds REAL NOT NULL,
+                                   lastUsed REAL NOT NULL, PRIMARY KEY (key, version))""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS positionsLastUsed ON positions (lastUsed)")
+        self.connection.commit()
+
+        return self.connection
+
+    def close(self):
+        if self.connection != None and self.pid == os.getpid():
+            self.connection.close()
+
+        self.connection = None
+
+    def resetCounters(self):
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, board, version):
+        # Returns (depth, score, encoded move, seconds) of the deepest stored search of the position
+        connection = self.connect()
+        key = signedKey(zobristHash(board))
+        row = connection.execute("SELECT depth, score, move, seconds FROM positions WHERE key = ? AND version = ?",
+                                 (key, version)).fetchone()
+
+        if row == None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        try:
+            connection.execute("UPDATE positions SET lastUsed = ? WHERE key = ? AND version = ?", (time.time(), key, version))
+            connection.commit()
+        except sqlite3.OperationalError:
+            # Another process holds the write lock; the entry just ages a little sooner
+            connection.rollback()
+
+        return row
+
+    def store(self, entries, version):
+        # Stores (board, depth, score, encoded move, seconds) tuples, keeping the deeper result of each position
+        connection = self.connect()
+        now = time.time()
+        rows = [(signedKey(zobristHash(board)), version, depth, score, move, seconds, now) for board, depth, score, move, seconds in entries]
+
+        try:
+            connection.executemany("""INSERT INTO positions VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (key, version) DO UPDATE SET
+                                      depth = excluded.depth, score = excluded.score, move = excluded.move, seconds = excluded.seconds,
+                                      lastUsed = excluded.lastUsed WHERE excluded.depth >= positions.depth""", rows)
+            connection.commit()
+        except sqlite3.OperationalError:
+            connection.rollback()
+            return
+
+        self.stores += 1
+
+        if self.stores % evictionInterval == 0:
+            self.evict()
+
+    def evict(self):
+        connection = self.connect()
+        excess = connection.execute("SELECT COUNT(*) FROM positions").fetchone()[0] - self.maxEntries
+
+        if excess > 0:
+            try:
+                connection.execute("DELETE FROM positions WHERE rowid IN (SELECT rowid FROM positions ORDER BY lastUsed LIMIT ?)", (excess,))
+                connection.commit()
+            except sqlite3.OperationalError:
+                # Left to the next eviction when another process is writing
+                connection.rollback()
+
+    def __len__(self):
+        return self.connect().execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+
+def signedKey(key):
+    # SQLite integers are signed 64-bit, Zobrist keys are unsigned
+    return key - (1 << 64) if key >= (1 << 63) else key
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Self-play matches between two engine configurations.
+
+Plays games between two alphaBetaSearch configurations in a pool of worker
+processes, one game per process at a time, so every core is busy. Each opening
+from the FEN, EPD or PGN files is played twice with the colours swapped. Games
+are adjudicated early on a lasting material advantage, on a quiet level position
+late in the game or on the tablebases, and every finished game is appended to a
+PGN file. After each game the Elo difference and a sequential probability ratio
+test (SPRT) are updated, and the match stops as soon as the test accepts either
+hypothesis.
+
+    python SelfPlay.py openings.epd -o match.pgn --games 1000 \\
+        --engine "name=lmr,depth=4" --engine "name=base,depth=4,lmr=0"
+
+Configurations are comma separated key=value pairs: name, depth, movetime (seconds
+per move), tc (seconds+increment per game), hash (MB), nullmove and lmr (0 or 1),
+weights (a weights file for the evaluation) and pawn, knight, bishop, rook, queen
+to override its piece values.
+"""
+
+import os
+import sys
+import math
+import time
+import argparse
+import multiprocessing
+import chess
+import chess.pgn
+import ChessEngine
+from BatchAnalysis import readPositions
+from TranspositionTable import TranspositionTable
+from Tablebase import Tablebase
+from EvaluationWeights import defaultWeights, loadWeights
+
+pieceNames = ["pawn", "knight", "bishop", "rook", "queen"]
+# Adjudication counts material with the standard values, whatever values the engines play with
+standardValues = list(ChessEngine.IncrementalEvaluator.pieceValues)
+
+# Adjudication: a material lead of winMaterial pawns held for winPlies plies wins, and after drawStartPly
+# a position within drawMaterial pawns without a capture or pawn move for drawPlies plies is drawn
+winMaterial = 6
+winPlies = 8
+drawStartPly = 80
+drawMaterial = 1
+drawPlies = 20
+maxGamePlies = 400
+
+def parseEngine(text, index):
+    config = {"name": "engine{}".format(index + 1), "depth": None, "moveTime": None, "timeControl": None, "hash": 16,
+              "nullMove": True, "lateMoves": True, "weights": None}
+    pieceValues = {}
+
+    for item in text.split(","):
+        key, _, value = item.strip().partition("=")
+        key = key.lower()
+
+        if key == "name":
+            config["name"] = value
+        elif key == "depth":
+            config["depth"] = int(value)
+        elif key == "movetime":
+            config["moveTime"] = float(value)
+        elif key == "tc":
+            base, _, increment = value.partition("+")
+            config["timeControl"] = (float(base), float(increment or 0))
+        elif key == "hash":
+            config["hash"] = int(value)
+        elif key == "nullmove":
+            config["nullMove"] = value not in ("0", "false", "off")
+        elif key == "lmr":
+            config["lateMoves"] = value not in ("0", "false", "off")
+        elif key == "weights":
+            config["weights"] = value
+        elif key in pieceNames:
+            pieceValues[key] = float(value)
+        else:
+            raise ValueError("unknown engine option '{}'".format(key))
+
+    # Piece values given with a weights file override the file's, whatever their order
+    config["weights"] = loadWeights(config["weights"]) if config["weights"] != None else defaultWeights()
+    config["weights"]["material"].update(pieceValues)
+
+    if config["depth"] == None and config["moveTime"] == None and config["timeControl"] == None:
+        config["depth"] = 3
+
+    return config
+
+def initWorker(engines, syzygyPath):
+    global workerTables, workerOrdering, workerTablebase
+
+    ChessEngine.initSearch(1)
+    # Each engine keeps its own table for the whole game, as a separate engine process would
+    workerTables = [TranspositionTable(engine["hash"]) for engine in engines]
+    # Killer moves, history scores and the last searched position are kept per engine as well
+    workerOrdering = [None for engine in engines]
+    workerTablebase = Tablebase(syzygyPath) if syzygyPath != None else None
+
+def materialBalance(board):
+    # Material in pawns from White's side, kings left out
+    return sum(standardValues[pieceType] * (len(board.pieces(pieceType, chess.WHITE)) - len(board.pieces(pieceType, chess.BLACK)))
+               for pieceType in range(chess.PAWN, chess.KING))
+
+def adjudicate(board, winStreak):
+    # Returns (result, reason) once the game can be scored without playing it out
+    if workerTablebase != None and workerTablebase.canProbe(board):
+        wdl = workerTablebase.probeWDL(board)
+
+        if wdl != None:
+            if abs(wdl) == 2:
+                return ("1-0" if (wdl > 0) == board.turn else "0-1"), "tablebase"
+
+            return "1/2-1/2", "tablebase"
+
+    if abs(winStreak) >= winPlies:
+        return ("1-0" if winStreak > 0 else "0-1"), "material"
+
+    if board.ply() >= drawStartPly and board.halfmove_clock >= drawPlies and abs(materialBalance(board)) <= drawMaterial:
+        return "1/2-1/2", "quiet level position"
+
+    if board.ply() >= maxGamePlies:
+        return "1/2-1/2", "move limit"
+
+    return None, None
+
+def playGame(task):
+    # Plays one game and returns it as PGN together with the result from engine 1's side
+    gameNumber, openingId, fen, engines, firstIsWhite = task
+    board = chess.Board(fen)
+    startBoard = board.copy()
+    players = {chess.WHITE: 0 if firstIsWhite else 1, chess.BLACK: 1 if firstIsWhite else 0}
+    clocks = {color: engines[players[color]]["timeControl"][0] if engines[players[color]]["timeControl"] else None
+              for color in chess.COLORS}
+    winStreak = 0
+    result, reason = None, None
+
+    for index, table in enumerate(workerTables):
+        table.clear()
+        workerOrdering[index] = (ChessEngine.killerMoves, ChessEngine.historyTable, None)
+
+    while result == None:
+        if board.is_game_over(claim_draw = True):
+            outcome = board.outcome(claim_draw = True)
+            result, reason = outcome.result(), outcome.termination.name.lower().replace("_", " ")
+            break
+
+        color = board.turn
+        engine = engines[players[color]]
+        ChessEngine.transpositionTable = workerTables[players[color]]
+        ChessEngine.killerMoves, ChessEngine.historyTable, ChessEngine.lastSearchBoard = workerOrdering[players[color]]
+        ChessEngine.setSelectiveSearch(engine["nullMove"], engine["lateMoves"])
+        ChessEngine.setEvaluationWeights(engine["weights"])
+
+        startTime = time.perf_counter()
+
+        if engine["timeControl"] != None:
+            move = ChessEngine.alphaBetaSearch(board, engine["depth"], timeLeft = clocks[color], increment = engine["timeControl"][1],
+                                               iterative = True)
+        else:
+            move = ChessEngine.alphaBetaSearch(board, engine["depth"], engine["moveTime"], iterative = engine["moveTime"] != None)
+
+        workerOrdering[players[color]] = (ChessEngine.killerMoves, ChessEngine.historyTable, ChessEngine.lastSearchBoard)
+
+        if engine["timeControl"] != None:
+            clocks[color] -= time.perf_counter() - startTime
+
+            if clocks[color] < 0:
+                result, reason = ("0-1" if color else "1-0"), "time forfeit"
+                break
+
+            clocks[color] += engine["timeControl"][1]
+
+        board.push(move)
+
+        # Counts consecutive plies in which one side kept a decisive material lead
+        balance = materialBalance(board)
+
+        if balance >= winMaterial:
+            winStreak = max(winStreak, 0) + 1
+        elif balance <= -winMaterial:
+            winStreak = min(winStreak, 0) - 1
+        else:
+            winStreak = 0
+
+        result, reason = adjudicate(board, winStreak)
+
+    game = chess.pgn.Game.from_board(board)
+    game.headers["Event"] = "SelfPlay"
+    game.headers["Round"] = str(gameNumber + 1)
+    game.headers["White"] = engines[players[chess.WHITE]]["name"]
+    game.headers["Black"] = engines[players[chess.BLACK]]["name"]
+    game.headers["Result"] = result
+    game.headers["Termination"] = reason
+    game.headers["Opening"] = openingId
+
+    if startBoard.fen() != chess.STARTING_FEN:
+        game.headers["FEN"] = startBoard.fen()
+        game.headers["SetUp"] = "1"
+
+    scores = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+
+    return {"game": gameNumber, "pgn": str(game), "result": result, "reason": reason, "plies": board.ply(),
+            "score": scores[result] if firstIsWhite else 1 - scores[result]}
+
+def eloDifference(wins, draws, losses):
+    # Elo difference of engine 1 and the half width of its 95% confidence interval
+    games = wins + draws + losses
+
+    if games == 0:
+        return 0.0, math.inf
+
+    score = (wins + 0.5 * draws) / games
+
+    if score <= 0 or score >= 1:
+        return (math.inf if score >= 1 else -math.inf), math.inf
+
+    deviation = math.sqrt((wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games / games)
+    elo = lambda s: -400 * math.log10(1 / s - 1)
+    low, high = max(score - 1.96 * deviation, 1e-6), min(score + 1.96 * deviation, 1 - 1e-6)
+
+    return elo(score), (elo(high) - elo(low)) / 2
+
+def sprt(wins, draws, losses, elo0, elo1, alpha = 0.05, beta = 0.05):
+    # Log-likelihood ratio of elo1 against elo0 under a normal approximation of the trinomial
+    # game results, with the bounds that accept elo0 (lower) or elo1 (upper)
+    lower, upper = math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+    games = wins + draws + losses
+
+    if games == 0:
+        return 0.0, lower, upper
+
+    score = (wins + 0.5 * draws) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+
+    if variance == 0:
+        return 0.0, lower, upper
+
+    expected = lambda elo: 1 / (1 + 10 ** (-elo / 400))
+    score0, score1 = expected(elo0), expected(elo1)
+
+    return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance), lower, upper
+
+def runMatch(openingPaths, outputPath, engines, games = 1000, workers = None, elo0 = 0, elo1 = 5, alpha = 0.05, beta = 0.05,
+             syzygyPath = None):
+    workers = workers if workers != None else os.cpu_count()
+    openings = list(readPositions(openingPaths)) if openingPaths else [("startpos", chess.STARTING_FEN)]
+    # Each opening is played twice in a row with the colours swapped, so a pair shares its opening's bias
+    tasks = ((number, *openings[(number // 2) % len(openings)], engines, number % 2 == 0) for number in range(games))
+    wins = draws = losses = 0
+    elo, margin, llr = 0.0, math.inf, 0.0
+    decision = None
+    startTime = time.perf_counter()
+
+    with open(outputPath, "a", encoding = "utf-8") as pgnFile, \
+         multiprocessing.Pool(workers, initializer = initWorker, initargs = (engines, syzygyPath)) as pool:
+        for game in pool.imap_unordered(playGame, tasks):
+            pgnFile.write(game["pgn"] + "\n\n")
+            pgnFile.flush()
+
+            if game["score"] == 1:
+                wins += 1
+            elif game["score"] == 0:
+                losses += 1
+            else:
+                draws += 1
+
+            elo, margin = eloDifference(wins, draws, losses)
+            llr, lower, upper = sprt(wins, draws, losses, elo0, elo1, alpha, beta)
+
+            print("{} games +{} ={} -{} elo {:.1f} +/- {:.1f} llr {:.2f} ({:.2f}, {:.2f}) {} {}".format(wins + draws + losses,
+                  wins, draws, losses, elo, margin, llr, lower, upper, game["result"], game["reason"]), file = sys.stderr)
+
+            if llr >= upper or llr <= lower:
+                decision = "H1" if llr >= upper else "H0"
+                pool.terminate()
+                break
+
+    return {"wins": wins, "draws": draws, "losses": losses, "elo": elo, "margin": margin, "llr": llr, "decision": decision,
+            "seconds": time.perf_counter() - startTime}
+
+def main():
+    parser = argparse.ArgumentParser(description = "Play two engine configurations against each other.")
+    parser.add_argument("openings", nargs = "*", help = "FEN/EPD or PGN files with the opening positions (default: the starting position)")
+    parser.add_argument("-o", "--output", required = True, help = "PGN file the games are appended to")
+    parser.add_argument("--engine", action = "append", required = True, help = "engine configuration, given twice")
+    parser.add_argument("--games", type = int, default = 1000)
+    parser.add_argument("--workers", type = int, default = None, help = "games played at once (default: all cores)")
+    parser.add_argument("--elo0", type = float, default = 0, help = "SPRT null hypothesis in Elo")
+    parser.add_argument("--elo1", type = float, default = 5, help = "SPRT alternative hypothesis in Elo")
+    parser.add_argument("--alpha", type = float, default = 0.05)
+    parser.add_argument("--beta", type = float, default = 0.05)
+    parser.add_argument("--syzygy", default = None, help = "tablebase directories used to adjudicate endgames")
+    arguments = parser.parse_args()
+
+    if len(arguments.engine) != 2:
+        parser.error("exactly two --engine configurations are needed")
+
+    engines = [parseEngine(text, index) for index, text in enumerate(arguments.engine)]
+    summary = runMatch(arguments.openings, arguments.output, engines, arguments.games, arguments.workers, arguments.elo0,
+                       arguments.elo1, arguments.alpha, arguments.beta, arguments.syzygy)
+
+    print("{} vs {}: +{} ={} -{} elo {:.1f} +/- {:.1f} llr {:.2f} {} in {:.0f}s".format(engines[0]["name"], engines[1]["name"],
+          summary["wins"], summary["draws"], summary["losses"], summary["elo"], summary["margin"], summary["llr"],
+          "accepted " + summary["decision"] if summary["decision"] else "no decision", summary["seconds"]))
+
+if __name__ == "__main__":
+    main()
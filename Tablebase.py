@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Syzygy endgame tablebases.
+
+Wraps python-chess's Syzygy reader over local table files. WDL probes give the
+search the exact result of any position with few enough pieces, and DTZ probes
+pick the move at the root that keeps the best result and makes progress
+towards it. WDL results are cached by Zobrist key because the search reaches
+the same endgame positions many times.
+"""
+
+import os
+import chess
+import chess.syzygy
+from TranspositionTable import zobristHash
+
+class Tablebase:
+
+    def __init__(self, path, maxPieces = None, cacheSize = 65536):
+        # Several directories may be given separated by os.pathsep, as in the UCI SyzygyPath option
+        self.path = path
+        self.tables = chess.syzygy.open_tablebase(path.split(os.pathsep)[0])
+
+        for directory in path.split(os.pathsep)[1:]:
+            self.tables.add_directory(directory)
+
+        # Table names such as KQvKR list every piece, so the largest one says how far the tables go
+        largestTable = max((len(name) - 1 for name in self.tables.wdl), default = 0)
+        self.maxPieces = min(maxPieces, largestTable) if maxPieces != None else largestTable
+        self.cacheSize = cacheSize
+        self.cache = {}
+        self.resetCounters()
+
+    def close(self):
+        self.tables.close()
+
+    def resetCounters(self):
+        self.hits = 0
+        self.misses = 0
+        self.cacheHits = 0
+
+    def canProbe(self, board):
+        # Tables only hold positions without castling rights
+        return chess.popcount(board.occupied) <= self.maxPieces and not board.castling_rights
+
+    def probeWDL(self, board):
+        # Win (2), cursed win (1), draw (0), blessed loss (-1) or loss (-2) for the side to move, or None
+        if not self.canProbe(board):
+            return None
+
+        key = zobristHash(board)
+
+        if key in self.cache:
+            self.cacheHits += 1
+            return self.cache[key]
+
+        wdl = self.tables.get_wdl(board)
+
+        if wdl == None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        if len(self.cache) >= self.cacheSize:
+            self.cache.clear()
+
+        self.cache[key] = wdl
+
+        return wdl
+
+    def rootMoves(self, board):
+        # The moves that keep the best result, ordered so the first one wins fastest or loses slowest;
+        # returns (moves, wdl) or (None, None) when the position is not in the tables
+        if not self.canProbe(board):
+            return None, None
+
+        rankedMoves = []
+
+        for move in board.legal_moves:
+            board.push(move)
+            wdl = self.tables.get_wdl(board)
+            dtz = self.tables.get_dtz(board)
+            board.pop()
+
+            if wdl == None or dtz == None:
+                self.misses += 1
+                return None, None
+
+            self.hits += 1
+            rankedMoves.append((-wdl, -dtz, move))
+
+        if len(rankedMoves) == 0:
+            return None, None
+
+        bestWDL = max(entry[0] for entry in rankedMoves)
+        bestMoves = [entry for entry in rankedMoves if entry[0] == bestWDL]
+
+        # The opponent's DTZ after a winning move counts down to the next capture or pawn move,
+        # so the shortest one is taken when winning and the longest one when losing
+        if bestWDL > 0:
+            bestMoves.sort(key = lambda entry: abs(entry[1]))
+        elif bestWDL < 0:
+            bestMoves.sort(key = lambda entry: -abs(entry[1]))
+
+        return [entry[2] for entry in bestMoves], bestWDL
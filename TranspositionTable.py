@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Transposition table used by the alpha-beta search.
+
+Positions are keyed by their 64-bit Zobrist hash (the same Polyglot keys that
+python-chess uses) instead of their FEN string. The table is a fixed number of
+buckets backed by one flat buffer, so its memory use is decided up front and never
+grows during a search. Every bucket holds two slots: a depth-preferred slot that
+keeps the deepest result seen for that bucket, and an always-replace slot that
+takes everything else.
+
+The table is kept from one move to the next, so the subtree below the move that
+was played is still there when the search starts from it. Entries of the last
+keptSearches searches hold on to their depth-preferred slots; older entries,
+and entries of positions with more pieces than the new root, which the game
+can never reach again, are the first to be overwritten.
+"""
+
+import chess
+import chess.polyglot
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+NO_MOVE = 0
+
+# key (8) + score (4) + move (2) + depth (1) + bound (1) + age (1) + pieces (1)
+ENTRY_SIZE = 18
+SLOTS_PER_BUCKET = 2
+
+def zobristHash(board):
+    return chess.polyglot.zobrist_hash(board)
+
+def encodeMove(move):
+    # Packs a move into 16 bits: 6 bits from square, 6 bits to square, 4 bits promotion
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+def decodeMove(encodedMove):
+    promotion = encodedMove >> 12
+
+    return chess.Move(encodedMove & 63, (encodedMove >> 6) & 63, promotion if promotion else None)
+
+def tableBytes(sizeInMegabytes):
+    bucketCount = max(1, (sizeInMegabytes * 1024 * 1024) // (ENTRY_SIZE * SLOTS_PER_BUCKET))
+
+    return bucketCount * SLOTS_PER_BUCKET * ENTRY_SIZE
+
+class TranspositionTable:
+
+    def __init__(self, sizeInMegabytes = 16, buffer = None):
+        # A buffer such as a shared memory block lets several processes use one table
+        if buffer == None:
+            buffer = bytearray(tableBytes(sizeInMegabytes))
+
+        self.bucketCount = max(1, len(buffer) // (ENTRY_SIZE * SLOTS_PER_BUCKET))
+        slotCount = self.bucketCount * SLOTS_PER_BUCKET
+        self.buffer = memoryview(buffer)
+        self.views = []
+        offset = 0
+
+        # Widest fields first so every view stays aligned
+        for fieldFormat, fieldSize in (("Q", 8), ("f", 4), ("H", 2), ("b", 1), ("B", 1), ("B", 1), ("B", 1)):
+            self.views.append(self.buffer[offset:offset + fieldSize * slotCount].cast("B").cast(fieldFormat))
+            offset += fieldSize * slotCount
+
+        self.keys, self.scores, self.moves, self.depths, self.bounds, self.ages, self.pieces = self.views
+
+        self.age = 1
+        self.rootPieces = 32
+        self.keptSearches = 1
+        self.resetCounters()
+
+    def release(self):
+        # Shared memory can only be closed once no views of it are left
+        for view in self.views:
+            view.release()
+
+        self.buffer.release()
+        self.views = []
+
+    def resetCounters(self):
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+
+    def newSearch(self, rootPieces = 32, keptSearches = 1):
+        # Entries from older searches may be overwritten by shallower results
+        self.age = self.age % 255 + 1
+        self.rootPieces = rootPieces
+        self.keptSearches = keptSearches
+        self.resetCounters()
+
+    def clear(self):
+        self.ages[:] = bytes(self.bucketCount * SLOTS_PER_BUCKET)
+        self.age = 1
+        self.resetCounters()
+
+    def probe(self, key):
+        slot = (key % self.bucketCount) * SLOTS_PER_BUCKET
+
+        for s in (slot, slot + 1):
+            if self.ages[s] != 0 and self.keys[s] == key:
+                self.hits += 1
+
+                return (self.depths[s], self.bounds[s], self.scores[s], self.moves[s])
+
+        self.misses += 1
+
+        # Counts a lookup that landed on a bucket filled by other positions
+        if self.ages[slot] != 0 or self.ages[slot + 1] != 0:
+            self.collisions += 1
+
+        return None
+
+    def bestMove(self, key):
+        # Looks up the stored move without counting towards the hit statistics
+        slot = (key % self.bucketCount) * SLOTS_PER_BUCKET
+
+        for s in (slot, slot + 1):
+            if self.ages[s] != 0 and self.keys[s] == key:
+                return self.moves[s]
+
+        return NO_MOVE
+
+    def isStale(self, slot):
+        # An entry from a search older than keptSearches, or of a position that cannot come back
+        if self.ages[slot] == self.age:
+            return False
+
+        return (self.age - self.ages[slot]) % 255 >= self.keptSearches or self.pieces[slot] > self.rootPieces
+
+    def store(self, key, depth, bound, score, move = NO_MOVE, pieces = 0):
+        slot = (key % self.bucketCount) * SLOTS_PER_BUCKET
+
+        # Depth-preferred slot: replaced by the same position, a deeper or equal search or a stale entry
+        if self.ages[slot] == 0 or self.keys[slot] == key or depth >= self.depths[slot] or self.isStale(slot):
+            if self.keys[slot] == key and move == NO_MOVE:
+                move = self.moves[slot]
+        else:
+            slot += 1
+
+            if self.keys[slot] == key and move == NO_MOVE:
+                move = self.moves[slot]
+
+        self.keys[slot] = key
+        self.depths[slot] = depth
+        self.bounds[slot] = bound
+        self.scores[slot] = score
+        self.moves[slot] = move
+        self.ages[slot] = self.age
+        self.pieces[slot] = pieces
+        self.stores += 1
+
+    def hashfull(self):
+        # Permille of slots sampled from the start of the table that belong to the current search
+        sample = min(1000, self.bucketCount * SLOTS_PER_BUCKET)
+
+        return sum(1 for s in range(sample) if self.ages[s] == self.age) * 1000 // sample
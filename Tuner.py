@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Texel tuning of the evaluation weights.
+
+Fits the weights of the evaluation to game results: every position is labelled
+with the result of its game from White's side (1, 0.5 or 0) and the weights are
+moved to minimise the squared difference between the result and a sigmoid of
+the evaluation. The evaluation is linear in its weights, so the features of
+every position are computed once with BatchEvaluation in a pool of processes
+and each step of the descent is a few NumPy products over the feature arrays.
+The scale of the sigmoid is fitted to the starting weights first.
+
+Positions come from PGN files, labelled with the game's result, or from lines
+holding a FEN or EPD position followed by its result as 1-0, 0-1, 1/2-1/2 or
+1.0, 0.5, 0.0, with or without quotes or brackets.
+
+    python Tuner.py games.pgn -o weights.json --epochs 20 --features features.npz
+"""
+
+import os
+import re
+import sys
+import math
+import time
+import argparse
+import itertools
+import multiprocessing
+import numpy as np
+import chess
+import chess.pgn
+from BatchEvaluation import packPositions, evaluationFeatures, weightVectors, weightsFromVectors, linearEvaluation, denseNames
+from EvaluationWeights import defaultWeights, loadWeights, saveWeights, pieceNames
+
+resultPattern = re.compile(r"[\"\[]?(1-0|0-1|1/2-1/2|1\.0|0\.5|0\.0|1|0)[\"\]]?;?$")
+resultValues = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5, "1.0": 1.0, "0.5": 0.5, "0.0": 0.0, "1": 1.0, "0": 0.0}
+
+# Positions the sigmoid scale is fitted on
+scaleSample = 262144
+
+# Groups of weights that can be held fixed with --freeze
+weightGroups = {"material": pieceNames[:-1], "pawns": ["doubledPawn", "isolatedPawn", "blockedPawn"], "mobility": ["captures", "mobility"]}
+
+def readLabeledPositions(paths, skipPlies = 8):
+    # Yields (fen, result) pairs one at a time without reading whole files into memory
+    for path in paths:
+        if path.lower().endswith(".pgn"):
+            with open(path, encoding = "utf-8", errors = "replace") as pgnFile:
+                while True:
+                    game = chess.pgn.read_game(pgnFile)
+
+                    if game == None:
+                        break
+
+                    result = resultValues.get(game.headers.get("Result"))
+
+                    if result == None:
+                        continue
+
+                    board = game.board()
+
+                    # Opening positions say little about the result
+                    for ply, move in enumerate(game.mainline_moves()):
+                        board.push(move)
+
+                        if ply + 1 >= skipPlies:
+                            yield board.fen(), result
+        else:
+            with open(path, encoding = "utf-8", errors = "replace") as positionFile:
+                for line in positionFile:
+                    fields = line.split()
+
+                    if len(fields) == 0 or fields[0].startswith("#"):
+                        continue
+
+                    # A full FEN ends in two move counters, EPD stops after the en passant square
+                    fenFields = 6 if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit() else 4
+                    match = resultPattern.search(fields[-1]) if len(fields) > fenFields else None
+
+                    if match != None:
+                        yield " ".join(fields[:fenFields]), resultValues[match.group(1)]
+
+def extractChunk(positions):
+    boards = [chess.Board(fen) if len(fen.split()) >= 6 else chess.Board(fen + " 0 1") for fen, result in positions]
+    features = evaluationFeatures(packPositions(boards))
+    features["results"] = np.array([result for fen, result in positions], dtype = np.float64)
+
+    return features
+
+def extractFeatures(paths, chunkSize = 65536, workers = None, skipPlies = 8):
+    # Returns a list of feature chunks; each chunk is one step of the descent
+    positions = readLabeledPositions(paths, skipPlies)
+    chunks = iter(lambda: list(itertools.islice(positions, chunkSize)), [])
+    featureChunks = []
+    startTime = time.perf_counter()
+
+    with multiprocessing.Pool(workers) as pool:
+        for features in pool.imap(extractChunk, chunks):
+            featureChunks.append(features)
+            count = sum(len(f["results"]) for f in featureChunks)
+            print("{} positions {:.0f} positions/s".format(count, count / (time.perf_counter() - startTime)), file = sys.stderr)
+
+    return featureChunks
+
+def saveFeatures(featureChunks, path):
+    arrays = {}
+
+    for index, features in enumerate(featureChunks):
+        arrays.update(("{}{}".format(name, index), values) for name, values in features.items())
+
+    np.savez(path, **arrays)
+
+def loadFeatures(path):
+    arrays = np.load(path)
+    chunkCount = sum(1 for name in arrays.files if name.startswith("results"))
+
+    return [{name: arrays["{}{}".format(name, index)] for name in ("dense", "rows", "indices", "signs", "phase", "results")}
+            for index in range(chunkCount)]
+
+def expectedResult(evaluation, scale):
+    # Expected score from White's side of a position evaluated at evaluation pawns
+    return 1 / (1 + np.power(10, -scale * evaluation / 4))
+
+def meanLoss(featureChunks, vectors, scale):
+    loss = sum(np.sum((f["results"] - expectedResult(linearEvaluation(f, *vectors), scale)) ** 2) for f in featureChunks)
+
+    return loss / sum(len(f["results"]) for f in featureChunks)
+
+def fitScale(featureChunks, vectors, low = 0.05, high = 10.0, iterations = 40):
+    # Golden-section search for the sigmoid scale that best fits the starting weights
+    ratio = (math.sqrt(5) - 1) / 2
+
+    for iteration in range(iterations):
+        left = high - ratio * (high - low)
+        right = low + ratio * (high - low)
+
+        if meanLoss(featureChunks, vectors, left) < meanLoss(featureChunks, vectors, right):
+            high = right
+        else:
+            low = left
+
+    return (low + high) / 2
+
+def gradient(features, vectors, scale):
+    # Returns the summed squared error of the chunk and its gradient for every weight vector
+    evaluation = linearEvaluation(features, *vectors)
+    expected = expectedResult(evaluation, scale)
+    error = expected - features["results"]
+    slope = 2 * error * expected * (1 - expected) * scale * math.log(10) / 4
+
+    rows = features["rows"]
+    phase = features["phase"][rows]
+    pieceSlope = slope[rows] * features["signs"]
+    tableSize = len(vectors[1])
+
+    return np.sum(error ** 2), (features["dense"].T @ slope, np.bincount(features["indices"], weights = pieceSlope * phase, minlength = tableSize),
+                                np.bincount(features["indices"], weights = pieceSlope * (1 - phase), minlength = tableSize))
+
+def tune(featureChunks, weights, epochs = 20, learningRate = 0.01, scale = None, frozen = ()):
+    # Adam over the weight vectors with one step per chunk; frozen names and groups keep their values
+    vectors = [vector.copy() for vector in weightVectors(weights)]
+    # The scale is fitted on a sample, which pins it down as well as all positions would
+    sampleChunks = featureChunks[:max(1, scaleSample // len(featureChunks[0]["results"]))]
+    scale = scale if scale != None else fitScale(sampleChunks, vectors)
+    masks = [np.ones(len(vector)) for vector in vectors]
+    count = sum(len(f["results"]) for f in featureChunks)
+
+    # The kings always cancel out of the material difference
+    for name in ["king"] + [n for group in frozen for n in weightGroups.get(group, [group])]:
+        if name in denseNames:
+            masks[0][denseNames.index(name)] = 0
+        elif name == "pieceSquare":
+            masks[1][:] = 0
+            masks[2][:] = 0
+        else:
+            raise ValueError("unknown weight or group '{}'".format(name))
+
+    moments = [np.zeros(len(vector)) for vector in vectors]
+    squares = [np.zeros(len(vector)) for vector in vectors]
+    step = 0
+
+    print("scale {:.4f} loss {:.6f}".format(scale, meanLoss(featureChunks, vectors, scale)), file = sys.stderr)
+
+    for epoch in range(epochs):
+        startTime = time.perf_counter()
+        epochLoss = 0
+
+        for features in featureChunks:
+            loss, gradients = gradient(features, vectors, scale)
+            epochLoss += loss
+            step += 1
+
+            for vector, moment, square, grad, mask in zip(vectors, moments, squares, gradients, masks):
+                grad = grad / len(features["results"])
+                moment[:] = 0.9 * moment + 0.1 * grad
+                square[:] = 0.999 * square + 0.001 * grad * grad
+                vector -= mask * learningRate * (moment / (1 - 0.9 ** step)) / (np.sqrt(square / (1 - 0.999 ** step)) + 1e-8)
+
+        print("epoch {} loss {:.6f} {:.1f}s".format(epoch + 1, epochLoss / count, time.perf_counter() - startTime), file = sys.stderr)
+
+    return weightsFromVectors(*vectors), scale, meanLoss(featureChunks, vectors, scale)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Tune the evaluation weights on positions labelled with game results.")
+    parser.add_argument("inputs", nargs = "*", help = "PGN files, or FEN/EPD files with a result on every line")
+    parser.add_argument("-o", "--output", required = True, help = "weights JSON to write")
+    parser.add_argument("--weights", default = None, help = "weights JSON to start from (default: the hand-set weights)")
+    parser.add_argument("--features", default = None, help = "feature cache: loaded when it exists, otherwise written after extraction")
+    parser.add_argument("--epochs", type = int, default = 20)
+    parser.add_argument("--learning-rate", type = float, default = 0.01)
+    parser.add_argument("--batch", type = int, default = 65536, help = "positions per descent step")
+    parser.add_argument("--scale", type = float, default = None, help = "sigmoid scale (default: fitted to the starting weights)")
+    parser.add_argument("--freeze", nargs = "*", default = [], help = "weights or groups ({}, pieceSquare) to keep".format(
+                        ", ".join(weightGroups)))
+    parser.add_argument("--skip-plies", type = int, default = 8, help = "opening plies of PGN games left out")
+    parser.add_argument("--workers", type = int, default = None, help = "feature extraction processes (default: all cores)")
+    arguments = parser.parse_args()
+
+    if arguments.features != None and os.path.exists(arguments.features):
+        featureChunks = loadFeatures(arguments.features)
+    elif len(arguments.inputs) > 0:
+        featureChunks = extractFeatures(arguments.inputs, arguments.batch, arguments.workers, arguments.skip_plies)
+
+        if arguments.features != None:
+            saveFeatures(featureChunks, arguments.features)
+    else:
+        parser.error("give input files or an existing --features file")
+
+    weights = loadWeights(arguments.weights) if arguments.weights != None else defaultWeights()
+    startTime = time.perf_counter()
+    tuned, scale, loss = tune(featureChunks, weights, arguments.epochs, arguments.learning_rate, arguments.scale, arguments.freeze)
+    saveWeights(tuned, arguments.output)
+
+    print("{} positions tuned in {:.1f}s, scale {:.4f} loss {:.6f}, written to {}".format(sum(len(f["results"]) for f in featureChunks),
+          time.perf_counter() - startTime, scale, loss, arguments.output), file = sys.stderr)
+
+if __name__ == "__main__":
+    main()
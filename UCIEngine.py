@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Headless UCI front end for the chess AI.
+
+Speaks the Universal Chess Interface over stdin/stdout so the engine can be run
+by tournament managers such as cutechess and in containers without a display:
+
+    python UCIEngine.py
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+import chess
+import ChessEngine
+import Bench
+
+engineName = "ChessAIProject"
+engineAuthor = "jones"
+
+outputLock = threading.Lock()
+
+def send(line):
+    with outputLock:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+def formatScore(score, turn):
+    # The engine scores in pawns from White's side; UCI wants centipawns for the side to move
+    return "cp {}".format(int(round(score * 100)) * (1 if turn else -1))
+
+def parsePosition(tokens):
+    board = chess.Board()
+    index = 0
+
+    if len(tokens) > 0 and tokens[0] == "startpos":
+        index = 1
+    elif len(tokens) > 0 and tokens[0] == "fen":
+        index = tokens.index("moves") if "moves" in tokens else len(tokens)
+        board = chess.Board(" ".join(tokens[1:index]))
+
+    if index < len(tokens) and tokens[index] == "moves":
+        for uci in tokens[index + 1:]:
+            board.push_uci(uci)
+
+    return board
+
+def parseGo(tokens, turn):
+    options = {}
+    index = 0
+
+    while index < len(tokens):
+        token = tokens[index]
+
+        if token in ("depth", "movetime", "wtime", "btime", "winc", "binc", "movestogo", "nodes") and index + 1 < len(tokens):
+            options[token] = int(tokens[index + 1])
+            index += 2
+        else:
+            options[token] = True
+            index += 1
+
+    search = {"depth": options.get("depth"), "moveTime": None, "timeLeft": None, "increment": 0, "movesToGo": options.get("movestogo"),
+              "ponder": "ponder" in options}
+
+    if "movetime" in options:
+        search["moveTime"] = options["movetime"] / 1000
+    elif ("wtime" if turn else "btime") in options:
+        search["timeLeft"] = options["wtime" if turn else "btime"] / 1000
+        search["increment"] = options.get("winc" if turn else "binc", 0) / 1000
+
+    return search
+
+class UCIEngine:
+
+    def __init__(self):
+        self.board = chess.Board()
+        self.searchThread = None
+        self.ponderReleased = threading.Event()
+        self.hashSize = 16
+        self.threads = 1
+        self.bookFile = None
+        self.bookDepth = 16
+        self.syzygyPath = None
+        self.syzygyProbeLimit = 7
+        self.nullMove = True
+        self.cacheFile = None
+        self.evalFile = None
+        self.lateMoveReductions = True
+
+        ChessEngine.initSearch(self.hashSize)
+
+    def reportIteration(self, info):
+        nodesPerSecond = int(info["nodes"] / info["time"]) if info["time"] > 0 else 0
+
+        send("info depth {} score {} nodes {} nps {} time {} pv {}".format(info["depth"], formatScore(info["score"], self.searchBoard.turn),
+             info["nodes"], nodesPerSecond, int(info["time"] * 1000), " ".join(m.uci() for m in info["pv"])))
+
+    def runSearch(self, search):
+        startTime = time.monotonic()
+        move = ChessEngine.alphaBetaSearch(self.searchBoard, search["depth"], search["moveTime"], search["timeLeft"],
+                                           search["increment"], search["movesToGo"], iterative = True, ponder = search["ponder"])
+
+        # A ponder search may not answer before the GUI sends ponderhit or stop
+        if search["ponder"]:
+            self.ponderReleased.wait()
+
+        # Worker processes cannot report their iterations, so the merged result is sent at the end
+        if ChessEngine.searchWorkers > 1 and len(ChessEngine.completedIterations) > 0:
+            depth, score, bestMove = ChessEngine.completedIterations[-1]
+
+            self.reportIteration({"depth": depth, "score": score, "nodes": ChessEngine.nodeStack.iterations,
+                                  "time": time.monotonic() - startTime, "pv": [move]})
+
+        replyBoard = self.searchBoard.copy(stack = False)
+        replyBoard.push(move)
+        reply = ChessEngine.predictReply(replyBoard)
+
+        send("bestmove {}".format(move.uci()) + (" ponder {}".format(reply.uci()) if reply != None else ""))
+
+    def go(self, tokens):
+        self.waitForSearch()
+        self.searchBoard = self.board.copy()
+
+        if self.searchBoard.is_game_over():
+            send("bestmove 0000")
+            return
+
+        search = parseGo(tokens, self.searchBoard.turn)
+        ChessEngine.iterationCallback = self.reportIteration
+        self.ponderReleased.clear()
+        # Set before the thread starts, so a stop or ponderhit that follows at once reaches the search
+        ChessEngine.prepareSearch(search["moveTime"], search["timeLeft"], search["increment"], search["movesToGo"], search["ponder"])
+        self.searchThread = threading.Thread(target = self.runSearch, args = (search,), daemon = True)
+        self.searchThread.start()
+
+    def waitForSearch(self):
+        if self.searchThread != None:
+            self.searchThread.join()
+            self.searchThread = None
+
+    def ponderHit(self):
+        if self.searchThread != None:
+            ChessEngine.ponderHit()
+            self.ponderReleased.set()
+
+    def stop(self):
+        if self.searchThread != None:
+            self.ponderReleased.set()
+            ChessEngine.stopSearch()
+            self.waitForSearch()
+
+    def setOption(self, tokens):
+        name = " ".join(tokens[2:tokens.index("value")]) if "value" in tokens else " ".join(tokens[2:])
+        value = tokens[tokens.index("value") + 1] if "value" in tokens else None
+
+        self.waitForSearch()
+
+        if name.lower() == "hash" and value != None:
+            self.hashSize = max(1, int(value))
+            ChessEngine.setParallelSearch(1)
+            ChessEngine.initSearch(self.hashSize)
+            ChessEngine.setParallelSearch(self.threads, tableSizeInMegabytes = self.hashSize)
+        elif name.lower() == "threads" and value != None:
+            self.threads = max(1, int(value))
+            ChessEngine.setParallelSearch(self.threads, tableSizeInMegabytes = self.hashSize)
+        elif name.lower() == "bookfile":
+            # The value is a path and may contain spaces
+            self.bookFile = " ".join(tokens[tokens.index("value") + 1:]) if value not in (None, "<empty>") else None
+            ChessEngine.setOpeningBook(self.bookFile, self.bookDepth)
+        elif name.lower() == "cachefile":
+            self.cacheFile = " ".join(tokens[tokens.index("value") + 1:]) if value not in (None, "<empty>") else None
+            ChessEngine.setSearchCache(self.cacheFile)
+        elif name.lower() == "evalfile":
+            self.evalFile = " ".join(tokens[tokens.index("value") + 1:]) if value not in (None, "<empty>") else None
+            ChessEngine.setEvaluationWeights(self.evalFile)
+        elif name.lower() == "syzygypath":
+            self.syzygyPath = " ".join(tokens[tokens.index("value") + 1:]) if value not in (None, "<empty>") else None
+            ChessEngine.setTablebase(self.syzygyPath, self.syzygyProbeLimit)
+        elif name.lower() == "syzygyprobelimit" and value != None:
+            self.syzygyProbeLimit = max(0, int(value))
+
+            if self.syzygyPath != None:
+                ChessEngine.setTablebase(self.syzygyPath, self.syzygyProbeLimit)
+        elif name.lower() in ("nullmove", "latemovereductions") and value != None:
+            if name.lower() == "nullmove":
+                self.nullMove = value.lower() == "true"
+            else:
+                self.lateMoveReductions = value.lower() == "true"
+
+            ChessEngine.setSelectiveSearch(self.nullMove, self.lateMoveReductions)
+        elif name.lower() == "searchreuse" and value != None:
+            ChessEngine.setSearchReuse(value.lower() == "true")
+        elif name.lower() == "bookdepth" and value != None:
+            self.bookDepth = max(0, int(value))
+
+            if ChessEngine.openingBook != None:
+                ChessEngine.openingBook.maxBookDepth = self.bookDepth
+
+    def bench(self, tokens):
+        # Runs single-threaded on a fresh table so the node counts match Bench.py
+        depth = int(tokens[0]) if len(tokens) > 0 else Bench.benchDepth
+
+        self.stop()
+        ChessEngine.setParallelSearch(1)
+        bench = Bench.runBench(depth, self.hashSize, report = lambda index, result: send("info string bench {} nodes {} time {} bestmove {}".format(
+                               index, result["nodes"], int(result["time"] * 1000), result["bestmove"])))
+
+        send("info string bench total time {} nodes {} nps {} signature {}".format(int(bench["time"] * 1000), bench["nodes"], 
+             bench["nps"], bench["signature"]))
+
+        ChessEngine.initSearch(self.hashSize)
+        ChessEngine.setParallelSearch(self.threads, tableSizeInMegabytes = self.hashSize)
+
+    def handle(self, line):
+        tokens = line.split()
+
+        if len(tokens) == 0:
+            return True
+
+        command = tokens[0]
+
+        if command == "uci":
+            send("id name {}".format(engineName))
+            send("id author {}".format(engineAuthor))
+            send("option name Hash type spin default 16 min 1 max 4096")
+            send("option name Threads type spin default 1 min 1 max 256")
+            send("option name Ponder type check default false")
+            send("option name BookFile type string default <empty>")
+            send("option name BookDepth type spin default 16 min 0 max 200")
+            send("option name SyzygyPath type string default <empty>")
+            send("option name SyzygyProbeLimit type spin default 7 min 0 max 7")
+            send("option name CacheFile type string default <empty>")
+            send("option name EvalFile type string default <empty>")
+            send("option name NullMove type check default true")
+            send("option name LateMoveReductions type check default true")
+            send("option name SearchReuse type check default true")
+            send("uciok")
+        elif command == "isready":
+            send("readyok")
+        elif command == "ucinewgame":
+            self.stop()
+            ChessEngine.transpositionTable.clear()
+        elif command == "setoption":
+            self.setOption(tokens)
+        elif command == "position":
+            self.stop()
+            self.board = parsePosition(tokens[1:])
+        elif command == "go":
+            self.go(tokens[1:])
+        elif command == "bench":
+            self.bench(tokens[1:])
+        elif command == "ponderhit":
+            self.ponderHit()
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            self.stop()
+            return False
+
+        return True
+
+def main():
+    # stdout belongs to the UCI protocol, so the search log goes to stderr
+    logging.basicConfig(stream = sys.stderr, level = os.environ.get("CHESS_LOG_LEVEL", "WARNING"), format = "%(name)s: %(message)s")
+    engine = UCIEngine()
+
+    for line in sys.stdin:
+        if not engine.handle(line.strip()):
+            break
+
+    engine.stop()
+    ChessEngine.setParallelSearch(1)
+
+if __name__ == "__main__":
+    main()